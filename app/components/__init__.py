@@ -3,6 +3,6 @@ UI components for the Confluence AI Assistant.
 """
 
 from .chat import show_chat_interface, export_chat_history
-from .page_info import show_page_info
+from .page_info import get_current_page, show_page_info
 
-__all__ = ['show_chat_interface', 'export_chat_history', 'show_page_info']
+__all__ = ['show_chat_interface', 'export_chat_history', 'show_page_info', 'get_current_page']
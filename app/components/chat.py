@@ -1,6 +1,6 @@
 import streamlit as st
-from typing import Dict, List, Optional, Tuple
-import json
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+import os
 from datetime import datetime
 import sys
 from pathlib import Path
@@ -10,75 +10,136 @@ app_dir = str(Path(__file__).parent.parent.absolute())
 if app_dir not in sys.path:
     sys.path.append(app_dir)
 
+from config import APP_CONFIG
+from app.services.chat_history import ChatHistory
+from app.services.conversation import ConversationMemory
+from .page_info import get_current_page
+
 class ChatManager:
     """Manages chat interactions and state."""
     
     @staticmethod
     def initialize_session_state() -> None:
         """Initialize chat-related session state variables if they don't exist."""
-        if 'messages' not in st.session_state:
-            st.session_state.messages = []
-        
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
+        if st.session_state.get('chat_history') is None:
+            st.session_state.chat_history = ChatHistory(
+                os.path.join(APP_CONFIG['OUTPUT_DIR'], 'chat_logs'),
+                max_messages=APP_CONFIG['CHAT_HISTORY_MAX_MESSAGES'],
+                max_log_bytes=int(APP_CONFIG['CHAT_LOG_MAX_MB'] * 1024 * 1024),
+                max_log_age_days=APP_CONFIG['CHAT_LOG_MAX_AGE_DAYS']
+            )
+    
+    @staticmethod
+    def get_history() -> ChatHistory:
+        """Get this session's chat history, creating it on first use."""
+        ChatManager.initialize_session_state()
+        return st.session_state.chat_history
     
     @staticmethod
     def display_chat_messages() -> None:
-        """Display chat messages from the session state."""
-        if not hasattr(st.session_state, 'messages') or not st.session_state.messages:
+        """
+        Display chat messages from the session state.
+        
+        Only the latest CHAT_VISIBLE_MESSAGES are rendered unless the user asks
+        for the earlier ones, so each rerun of a long conversation sends a
+        bounded number of elements to the browser.
+        """
+        history = ChatManager.get_history()
+        if not len(history):
             return
-            
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        
+        messages = list(history)
+        hidden = len(messages) - APP_CONFIG['CHAT_VISIBLE_MESSAGES']
+        if hidden > 0 and not st.session_state.get('show_all_messages'):
+            st.button(
+                f"Show {hidden} earlier messages",
+                on_click=ChatManager.show_all_messages,
+                type="tertiary",
+                key="show_all_messages_button"
+            )
+            messages = messages[hidden:]
+        elif history.dropped:
+            st.caption(f"{history.dropped} earlier messages are only in the exported chat history.")
+        
+        for message in messages:
+            with st.chat_message(message.role):
+                st.markdown(message.content)
+    
+    @staticmethod
+    def show_all_messages() -> None:
+        """Render the whole conversation from the next rerun on."""
+        st.session_state.show_all_messages = True
     
     @staticmethod
     def add_user_message(content: str) -> None:
         """Add a user message to the chat."""
-        if not hasattr(st.session_state, 'messages'):
-            st.session_state.messages = []
-        if not hasattr(st.session_state, 'chat_history'):
-            st.session_state.chat_history = []
-            
-        st.session_state.messages.append({"role": "user", "content": content})
-        st.session_state.chat_history.append({
-            "role": "user",
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        })
+        ChatManager.get_history().add("user", content)
     
     @staticmethod
     def add_assistant_message(content: str) -> None:
         """Add an assistant message to the chat."""
-        if not hasattr(st.session_state, 'messages'):
-            st.session_state.messages = []
-        if not hasattr(st.session_state, 'chat_history'):
-            st.session_state.chat_history = []
-            
-        st.session_state.messages.append({"role": "assistant", "content": content})
-        st.session_state.chat_history.append({
-            "role": "assistant",
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        })
+        ChatManager.get_history().add("assistant", content)
     
     @staticmethod
     def get_chat_history() -> List[Dict]:
-        """Get the chat history."""
-        return st.session_state.get('chat_history', [])
+        """Get the messages of the conversation still held in memory."""
+        return [message.to_dict() for message in ChatManager.get_history()]
+    
+    @staticmethod
+    def get_memory() -> Optional[ConversationMemory]:
+        """Get the conversation memory sent with follow-up questions, creating it on first use."""
+        if 'conversation_memory' not in st.session_state:
+            if 'openai_service' not in st.session_state:
+                return None
+            st.session_state.conversation_memory = ConversationMemory(
+                st.session_state.openai_service.async_service,
+                max_tokens=APP_CONFIG['HISTORY_MAX_TOKENS'],
+                summary_tokens=APP_CONFIG['HISTORY_SUMMARY_TOKENS']
+            )
+        return st.session_state.conversation_memory
     
     @staticmethod
     def clear_chat() -> None:
-        """Clear the chat history while keeping the context."""
-        if hasattr(st.session_state, 'messages'):
-            st.session_state.messages = []
-        
-        # Keep the chat history for logging
-        if not hasattr(st.session_state, 'chat_history'):
-            st.session_state.chat_history = []
+        """Clear the chat while keeping the context."""
+        # The history's log keeps the cleared messages for logging and export
+        ChatManager.get_history().clear()
+        st.session_state.show_all_messages = False
+        if 'conversation_memory' in st.session_state:
+            st.session_state.conversation_memory.clear()
 
+def get_relevant_context(page_content: Mapping[str, Any], question: str) -> Union[List[Dict], str]:
+    """
+    Get the context for a question: the page's most relevant chunks.
+
+    Falls back to the full page content when the page is not indexed or
+    no chunks could be retrieved.
+
+    Args:
+        page_content: The loaded page
+        question: The user's question
+
+    Returns:
+        Ranked chunk dicts, or the page text; generate_answer packs either
+        into the model's token budget
+    """
+    retriever = st.session_state.get('retriever')
+    if retriever is not None:
+        try:
+            chunks = retriever.search(question, page_id=page_content.get('id'))
+        except Exception:
+            chunks = []
+        if chunks:
+            return chunks
+    return page_content.get('content', '')
+
+@st.fragment
 def show_chat_interface() -> None:
-    """Display the chat interface."""
+    """
+    Display the chat interface.
+    
+    Runs as a fragment: sending a message or clicking its buttons reruns only
+    this function, not the page load, the page info panel or the sidebar.
+    """
     # Initialize chat state
     ChatManager.initialize_session_state()
     
@@ -96,48 +157,73 @@ def show_chat_interface() -> None:
         
         # Generate assistant response
         with st.chat_message("assistant"):
-            with st.spinner('Thinking...'):
-                try:
-                    # Get the page content from session state
-                    page_content = st.session_state.get('page_content', {})
-                    
-                    # Generate answer using OpenAI service
-                    if 'openai_service' in st.session_state and page_content:
-                        response = st.session_state.openai_service.generate_answer(
-                            context=page_content.get('content', ''),
-                            question=prompt
+            try:
+                # Get the page content from session state
+                page_content = get_current_page()
+                
+                # Stream the answer using OpenAI service so text appears as it is generated
+                if 'openai_service' in st.session_state and page_content:
+                    with st.spinner('Searching the page...'):
+                        context = get_relevant_context(page_content, prompt)
+                    page = (page_content['id'], page_content.get('version')) if page_content.get('id') else None
+                    memory = ChatManager.get_memory()
+                    response = st.write_stream(
+                        st.session_state.openai_service.stream_answer(
+                            context=context,
+                            question=prompt,
+                            history=memory.history() if memory else None,
+                            page=page
                         )
-                    else:
-                        response = "I'm sorry, I couldn't process your request. The page content is not available."
-                    
-                    # Display the response
+                    )
+                    if not isinstance(response, str):
+                        response = "".join(str(part) for part in response)
+                    if memory:
+                        # Summarizing older turns happens after the answer is shown
+                        memory.add("user", prompt)
+                        memory.add("assistant", response)
+                        memory.fold_in_background()
+                else:
+                    response = "I'm sorry, I couldn't process your request. The page content is not available."
                     st.markdown(response)
-                    
-                    # Add assistant response to chat
-                    ChatManager.add_assistant_message(response)
-                except Exception as e:
-                    error_msg = f"An error occurred while processing your request: {str(e)}"
-                    st.error(error_msg)
-                    ChatManager.add_assistant_message(error_msg)
-        
-        # Rerun to update the chat
-        st.rerun()
+                
+                # Add assistant response to chat
+                ChatManager.add_assistant_message(response)
+            except Exception as e:
+                error_msg = f"An error occurred while processing your request: {str(e)}"
+                st.error(error_msg)
+                ChatManager.add_assistant_message(error_msg)
     
-    # Add a button to clear chat
-    if st.button("Clear Chat"):
-        ChatManager.clear_chat()
-        st.rerun()
+    col1, col2 = st.columns(2)
+    with col1:
+        # The callback runs before the rerun the click triggers, so the cleared chat renders straight away
+        st.button("Clear Chat", on_click=ChatManager.clear_chat)
+    with col2:
+        data, filename = export_chat_history()
+        if data and filename:
+            # Read from the log only when clicked, not on every rerun
+            st.download_button(
+                label="📥 Export Chat History",
+                data=data,
+                file_name=filename,
+                mime="application/x-ndjson",
+                on_click="ignore",
+                key="export_chat_history"
+            )
 
-def export_chat_history() -> Tuple[Optional[str], Optional[str]]:
+def export_chat_history() -> Tuple[Optional[Callable[[], bytes]], Optional[str]]:
     """
-    Export chat history to a JSON file.
+    Export chat history as JSON Lines, read from the session's chat log when downloaded.
+    
+    The log holds the session's messages, including cleared ones, up to
+    CHAT_LOG_MAX_MB.
     
     Returns:
-        Tuple containing (json_string, filename) or (None, None) if no history
+        Tuple containing (callable reading the log, filename) or (None, None) if no history
     """
-    if hasattr(st.session_state, 'chat_history') and st.session_state.chat_history:
+    history = st.session_state.get('chat_history')
+    if history is not None and history.has_log():
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"chat_history_{timestamp}.json"
-        return json.dumps(st.session_state.chat_history, indent=2), filename
+        filename = f"chat_history_{timestamp}.jsonl"
+        return history.read_log, filename
     
     return None, None
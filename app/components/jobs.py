@@ -0,0 +1,111 @@
+import streamlit as st
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+# Add the app directory to the Python path
+app_dir = str(Path(__file__).parent.parent.absolute())
+if app_dir not in sys.path:
+    sys.path.append(app_dir)
+
+from app.services.ingestion import SPACE, IngestionJob
+from app.services.registry import get_ingestion_runner
+
+def requested_jobs() -> Dict[int, IngestionJob]:
+    """Space jobs this session submitted or joined and has not withdrawn from, by ID."""
+    if 'requested_jobs' not in st.session_state:
+        st.session_state.requested_jobs = {}
+    return st.session_state.requested_jobs
+
+def withdraw_job(job_id: int) -> None:
+    """Withdraw this session's request for a job; it is cancelled unless other sessions still want it."""
+    job = requested_jobs().pop(job_id, None)
+    if job is not None:
+        job.release()
+
+def show_job_progress(
+    job: IngestionJob,
+    on_cancel: Optional[Callable[[], None]] = None,
+    key: str = 'jobs_panel'
+) -> None:
+    """
+    Display one ingestion job's progress, throughput and a cancel button.
+
+    Jobs are shared by every session that asked for them, so Cancel only
+    withdraws this session's request, and is only offered to sessions
+    that made one.
+
+    Args:
+        job: The job to display
+        on_cancel: Called when Cancel is clicked (default: withdraw_job, with
+            the button shown only for jobs in requested_jobs())
+        key: Prefix of the widget keys, unique per place the job is shown
+    """
+    info = job.snapshot()
+    st.markdown(f"**{info['kind'].capitalize()} {info['target']}** · {info['stage']}")
+
+    if info['progress'] is not None:
+        st.progress(info['progress'])
+
+    pages = f"{info['pages_done']}"
+    if info['pages_total']:
+        pages += f" of {info['pages_total'] - info['pages_skipped']}"
+    details = (
+        f"{pages} pages, {info['chunks']} chunks in {info['elapsed']:.0f}s "
+        f"({info['pages_per_second']:.1f} pages/s, {info['chunks_per_second']:.0f} chunks/s)"
+    )
+    if info['pages_skipped']:
+        details += f", {info['pages_skipped']} already ingested"
+    if info['pages_deleted']:
+        details += f", {info['pages_deleted']} removed"
+    if info['failed_pages']:
+        details += f", {info['failed_pages']} failed"
+    st.caption(details)
+    if info['error']:
+        st.caption(f"⚠️ {info['error']}")
+
+    if job.finished:
+        return
+    if on_cancel is None and job.id not in requested_jobs():
+        return
+    st.button(
+        "Cancelling..." if job.cancelled else "Cancel",
+        key=f"{key}_cancel_{job.id}",
+        on_click=on_cancel or withdraw_job,
+        args=() if on_cancel else (job.id,),
+        disabled=job.cancelled
+    )
+
+@st.fragment(run_every=2)
+def show_jobs_panel() -> None:
+    """
+    Display the space ingestion form and every recent ingestion job.
+
+    Runs as a fragment refreshed every two seconds, so progress updates
+    without rerunning the rest of the app.
+    """
+    try:
+        runner = get_ingestion_runner()
+    except Exception as e:
+        st.caption(f"Ingestion is unavailable: {str(e)}")
+        return
+
+    space_key = st.text_input("Space Key", help="Index every page of a Confluence space in the background")
+    if st.button("Ingest Space"):
+        if space_key:
+            job = runner.submit(SPACE, space_key.strip())
+            if job.id in requested_jobs():
+                # Already asked for by this session; submit() counted another request
+                job.release()
+            requested_jobs()[job.id] = job
+        else:
+            st.error("Please enter a space key")
+
+    jobs = runner.jobs()
+    for job_id, job in list(requested_jobs().items()):
+        if job.finished:
+            del requested_jobs()[job_id]
+    if not jobs:
+        st.caption("No ingestion jobs yet.")
+    for job in jobs:
+        show_job_progress(job)
@@ -1,6 +1,6 @@
 import streamlit as st
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional
 import json
 import sys
 from pathlib import Path
@@ -10,8 +10,20 @@ app_dir = str(Path(__file__).parent.parent.absolute())
 if app_dir not in sys.path:
     sys.path.append(app_dir)
 
-# Import the chat component for exporting history
-from .chat import export_chat_history
+from app.services.metrics import metrics
+from app.services.rate_limiter import scheduler
+from app.services.registry import get_page_store
+
+def get_current_page() -> Optional[Mapping[str, Any]]:
+    """
+    Get the page loaded in this session.
+    
+    Returns:
+        Read-only view of the page shared by all sessions that loaded it, or
+        None if no page is loaded
+    """
+    handle = st.session_state.get('page_handle')
+    return handle.page if handle is not None else None
 
 def format_datetime(dt_str: str) -> str:
     """
@@ -36,14 +48,18 @@ def format_datetime(dt_str: str) -> str:
     except (ValueError, AttributeError, TypeError) as e:
         return "N/A"
 
+@st.fragment
 def show_page_info() -> None:
-    """Display information about the current Confluence page."""
-    if not hasattr(st.session_state, 'page_content') or not st.session_state.page_content:
+    """
+    Display information about the current Confluence page.
+    
+    Runs as a fragment, so toggling the debug panel does not rerun the chat.
+    """
+    page = get_current_page()
+    if not page:
         st.warning("No page content available. Please load a Confluence page first.")
         return
     
-    page = st.session_state.page_content
-    
     try:
         st.markdown("### 📄 Page Information")
         
@@ -102,28 +118,49 @@ def show_page_info() -> None:
             else:
                 st.caption("No child pages")
         
-        # Export button
-        try:
-            chat_history, filename = export_chat_history()
-            if chat_history and filename:
-                st.download_button(
-                    label="📥 Export Chat History",
-                    data=chat_history,
-                    file_name=filename,
-                    mime="application/json",
-                    key="export_chat_history"
-                )
-        except Exception as e:
-            st.error(f"Failed to prepare chat history export: {str(e)}")
-        
-        # Debug info (collapsed)
-        with st.expander("Debug Info"):
+        # Debug info, rendered only while switched on: a collapsed expander would still send it all
+        if st.toggle("Debug Info", key="show_debug_info"):
             try:
-                st.json(page, expanded=False)
+                # Answer latency: time to first token is what users notice
+                for name, label in (('answer_ttft', 'Time to first token'), ('answer_total', 'Full answer')):
+                    summary = metrics.summary(name)
+                    if summary:
+                        st.caption(
+                            f"{label}: p50 {summary['p50']:.2f}s, p95 {summary['p95']:.2f}s "
+                            f"(last {summary['last']:.2f}s, {summary['count']} answers)"
+                        )
+                openai_service = st.session_state.get('openai_service')
+                if openai_service is not None:
+                    cache_stats = openai_service.answer_cache.stats()
+                    st.caption(
+                        f"Answer cache: {cache_stats['hit_rate']:.0%} hit rate "
+                        f"({cache_stats['exact_hits']} exact, {cache_stats['semantic_hits']} similar, "
+                        f"{cache_stats['misses']} misses, {cache_stats['near_misses']} near misses)"
+                    )
+                confluence_service = st.session_state.get('confluence_service')
+                if confluence_service is not None:
+                    flight_stats = confluence_service.single_flight.stats()
+                    st.caption(
+                        f"Page loads: {flight_stats['calls']} requests, {flight_stats['coalesced']} shared "
+                        f"(most waiters on one load: {flight_stats['max_waiters']})"
+                    )
+                store_stats = get_page_store().stats()
+                st.caption(
+                    f"Shared pages: {store_stats['pages']} in memory ({store_stats['bytes'] / 1e6:.1f} MB, "
+                    f"{store_stats['referenced']} open in {store_stats['handles']} sessions)"
+                )
+                for endpoint, limiter_stats in scheduler.stats().items():
+                    depth = limiter_stats['queue_depth']
+                    st.caption(
+                        f"{endpoint}: {depth['interactive']} interactive / {depth['background']} background queued, "
+                        f"{limiter_stats['throttled']} rate limited"
+                    )
+                if st.toggle("Raw page JSON", key="show_page_json"):
+                    st.json(dict(page), expanded=False)
             except Exception as e:
                 st.error(f"Failed to display debug info: {str(e)}")
     
     except Exception as e:
         st.error(f"An error occurred while displaying page information: {str(e)}")
-        if st.button("Reload Page"):
-            st.rerun()
+        # Clicking reruns this fragment, which displays the page again
+        st.button("Reload Page")
@@ -12,17 +12,23 @@ if app_dir not in sys.path:
 # Load environment variables
 load_dotenv()
 
+from config import APP_CONFIG
+
+# Preload encodings and service clients while the landing page is shown; runs once per process
+if APP_CONFIG['WARM_UP_ON_START']:
+    from app.services.warmup import warm_up
+    warm_up()
+
 # Initialize session state variables in a single place
 def init_session_state():
     if 'initialized' not in st.session_state:
         st.session_state.initialized = True
         st.session_state.page = "home"
         st.session_state.page_id = ""
-        st.session_state.messages = []
-        st.session_state.chat_history = []
+        st.session_state.chat_history = None
         st.session_state.confluence_service = None
         st.session_state.openai_service = None
-        st.session_state.page_content = None
+        st.session_state.page_handle = None
 
 # Initialize session state
 init_session_state()
@@ -85,6 +91,9 @@ custom_css = """
 # Apply custom CSS
 st.markdown(custom_css, unsafe_allow_html=True)
 
+# Main pages by session state value, with their navigation labels
+PAGES = {"home": "🏠 Home", "dashboard": "📊 Dashboard"}
+
 def show_sidebar():
     """Display the sidebar with navigation and configuration options."""
     with st.sidebar:
@@ -92,18 +101,9 @@ def show_sidebar():
                 width=200)
         st.title("Confluence AI")
         
-        # Navigation
-        st.markdown("### Navigation")
-        
-        # Home button
-        if st.button("🏠 Home"):
-            st.session_state.page = "home"
-            st.rerun()
-            
-        # Dashboard button
-        if st.button("📊 Dashboard"):
-            st.session_state.page = "dashboard"
-            st.rerun()
+        # Navigation is bound to st.session_state.page and, living outside any
+        # fragment, reruns the whole app with the selected page
+        st.radio("Navigation", list(PAGES), format_func=PAGES.get, key="page")
         
         st.markdown("---")
         
@@ -112,27 +112,49 @@ def show_sidebar():
         
         # Only show these in dashboard
         if st.session_state.page == "dashboard":
-            page_id = st.text_input(
-                "Confluence Page ID", 
-                value=st.session_state.get('page_id', ''),
-                help="Enter the Confluence page ID you want to analyze"
-            )
+            show_page_selector()
             
-            if st.button("Load Page", type="primary"):
-                if page_id:
-                    st.session_state.page_id = page_id
-                    # Clear previous page content when loading a new page
-                    if 'page_content' in st.session_state:
-                        del st.session_state.page_content
-                    st.success(f"Page ID set to: {page_id}")
-                    st.rerun()
-                else:
-                    st.error("Please enter a valid page ID")
+            st.markdown("### Ingestion")
+            try:
+                # Imported here so the landing page does not load the services
+                from app.components.jobs import show_jobs_panel
+                show_jobs_panel()
+            except Exception as e:
+                st.caption(f"Ingestion is unavailable: {str(e)}")
         
         st.markdown("---")
         st.markdown("### About")
         st.markdown("This is a POC for an AI-powered Confluence assistant that helps you find and understand information across your Confluence spaces.")
 
+@st.fragment
+def show_page_selector():
+    """Display the page ID input; editing it reruns only this fragment."""
+    page_id = st.text_input(
+        "Confluence Page ID", 
+        value=st.session_state.get('page_id') or os.getenv("DEFAULT_PAGE_ID", ""),
+        help="Enter the Confluence page ID you want to analyze"
+    )
+    
+    if st.button("Load Page", type="primary"):
+        if page_id:
+            st.session_state.page_id = page_id
+            # Let go of the previous page so the shared store can evict it once no session uses it
+            handle = st.session_state.pop('page_handle', None)
+            if handle is not None:
+                handle.release()
+            # Withdraw from a load still in progress; it is cancelled if no other session wants it
+            job = st.session_state.pop('page_job', None)
+            if job is not None:
+                job.release()
+            # The dashboard is outside this fragment, so it needs a full rerun to load the page
+            st.rerun(scope="app")
+        else:
+            st.error("Please enter a valid page ID")
+
+def go_home():
+    """Switch to the landing page."""
+    st.session_state.page = "home"
+
 def show_landing_page():
     """Display the landing page content."""
     st.markdown("""
@@ -185,48 +207,7 @@ def show_landing_page():
     3. Asking questions about the content
     """)
 
-# Initialize session state
-if 'page' not in st.session_state:
-    st.session_state.page = "home"
-
-# Sidebar
-with st.sidebar:
-    st.image("https://upload.wikimedia.org/wikipedia/commons/thumb/8/8a/Confluence_Logo.svg/1200px-Confluence_Logo.svg.png", 
-             width=200)
-    st.title("Confluence AI")
-    
-    # Navigation
-    page = st.radio(
-        "Navigation",
-        ["🏠 Home", "📊 Dashboard"],
-        index=0 if st.session_state.page == "home" else 1
-    )
-    
-    # Update page state based on navigation
-    if page == "📊 Dashboard":
-        st.session_state.page = "dashboard"
-    else:
-        st.session_state.page = "home"
-    
-    st.markdown("---")
-    st.markdown("### Configuration")
-    
-    # Only show these in dashboard
-    if st.session_state.page == "dashboard":
-        page_id = st.text_input("Confluence Page ID", 
-                              value=os.getenv("DEFAULT_PAGE_ID", ""),
-                              help="Enter the Confluence page ID you want to analyze")
-        
-        if st.button("Load Page", type="primary"):
-            if page_id:
-                st.session_state.page_id = page_id
-                st.success(f"Page ID set to: {page_id}")
-            else:
-                st.error("Please enter a valid page ID")
-    
-    st.markdown("---")
-    st.markdown("### About")
-    st.markdown("This is a POC for an AI-powered Confluence assistant that helps you find and understand information across your Confluence spaces.")
+show_sidebar()
 
 # Main content
 if st.session_state.page == "home":
@@ -239,6 +220,4 @@ else:
     except Exception as e:
         st.error(f"Error loading dashboard: {str(e)}")
         st.info("Please make sure you have set up the required environment variables and installed all dependencies.")
-        if st.button("Go to Home", type="primary"):
-            st.session_state.page = "home"
-            st.rerun()
+        st.button("Go to Home", type="primary", on_click=go_home)
@@ -11,24 +11,40 @@ if app_dir not in sys.path:
 
 # Import services and components
 try:
-    from app.services.confluence_service import ConfluenceService
-    from app.services.openai_service import OpenAIService
+    from app.services.ingestion import PAGE, IngestionJob
+    from app.services.registry import (
+        get_confluence_service, get_ingestion_runner, get_openai_service, get_retriever
+    )
+    from app.components.jobs import show_job_progress
     from app.components.chat import show_chat_interface
-    from app.components.page_info import show_page_info
+    from app.components.page_info import get_current_page, show_page_info
 except ImportError as e:
     st.error(f"Failed to import required modules: {str(e)}")
     st.stop()
 
+@st.fragment(run_every=0.5)
+def show_page_loading(job: IngestionJob) -> None:
+    """Display a page job's progress until it finishes, then rerun the app to show the page."""
+    if job.finished:
+        st.rerun(scope="app")
+    show_job_progress(job, on_cancel=cancel_page_load, key='page_loading')
+
+def cancel_page_load() -> None:
+    """Stop waiting for the page; its job is cancelled unless other sessions are waiting for it too."""
+    job = st.session_state.pop('page_job', None)
+    if job is not None:
+        job.release()
+    st.session_state.page_id = ""
+
 def show_dashboard():
     """Display the main dashboard with chat interface and page information."""
     # Don't show title here to avoid duplicate headers
     
-    # Initialize services
+    # Get the process-wide services (created and health-checked once, not per session)
     try:
-        if 'confluence_service' not in st.session_state or st.session_state.confluence_service is None:
-            st.session_state.confluence_service = ConfluenceService()
-        if 'openai_service' not in st.session_state or st.session_state.openai_service is None:
-            st.session_state.openai_service = OpenAIService()
+        st.session_state.confluence_service = get_confluence_service()
+        st.session_state.openai_service = get_openai_service()
+        st.session_state.retriever = get_retriever()
     except Exception as e:
         st.error(f"Failed to initialize services: {str(e)}")
         st.info("Please check your environment variables and try again.")
@@ -39,31 +55,39 @@ def show_dashboard():
         st.info("👈 Please enter a Confluence Page ID and click 'Load Page' in the sidebar to get started.")
         return
     
-    # Try to load page content if not already loaded
-    if 'page_content' not in st.session_state:
-        with st.spinner("Loading page content..."):
+    # Load the page in the background; the page job fetches, chunks, embeds and indexes it
+    if st.session_state.get('page_handle') is None:
+        job = st.session_state.get('page_job')
+        if job is None or job.target != st.session_state.page_id:
             try:
-                page_content = st.session_state.confluence_service.get_page(st.session_state.page_id)
-                if page_content:
-                    st.session_state.page_content = page_content
-                    st.success(f"Successfully loaded page: {page_content.get('title', 'Untitled')}")
-                else:
-                    st.error(f"Failed to load page with ID: {st.session_state.page_id}")
-                    return
+                # Sessions loading the same page share one job
+                job = st.session_state.page_job = get_ingestion_runner().submit(PAGE, st.session_state.page_id)
             except Exception as e:
                 st.error(f"Error loading page: {str(e)}")
-                if st.button("Try Again"):
-                    if 'page_content' in st.session_state:
-                        del st.session_state.page_content
-                    st.rerun()
                 return
+        if not job.finished:
+            show_page_loading(job)
+            return
+        
+        st.session_state.page_job = None
+        # Keep a handle on the copy shared by all sessions, not a copy of our own
+        handle = get_ingestion_runner().acquire_page(job)
+        if handle is None:
+            st.error(f"Error loading page: {job.error or job.status}")
+            # Clicking reruns the app, which starts a new job since none is stored
+            st.button("Try Again")
+            return
+        if job.error:
+            st.warning(f"{job.error}. Answers will use the full page.")
+        st.session_state.page_handle = handle
+        st.success(f"Successfully loaded page: {handle.page.get('title', 'Untitled')}")
     
     # Show page title and content
-    if 'page_content' in st.session_state and st.session_state.page_content:
-        page = st.session_state.page_content
+    page = get_current_page()
+    if page:
         st.markdown(f"## {page.get('title', 'Untitled')}")
         
-        # Two-column layout
+        # Two-column layout; each column is a fragment that reruns on its own
         col1, col2 = st.columns([2, 1])
         
         with col1:
@@ -1,8 +1,79 @@
 """
 Services for the Confluence AI Assistant.
+
+Exported names are imported from their submodules on first access (PEP 562),
+so importing one light submodule such as app.services.metrics does not pull
+in openai, tiktoken or atlassian.
 """
 
-from .confluence_service import ConfluenceService
-from .openai_service import OpenAIService
+import importlib
+from typing import Any, List
+
+# Imported eagerly: the submodule shares its name with the recorder it exports,
+# and importing the submodule later would otherwise rebind the name to it
+from .metrics import LatencyRecorder, metrics
+
+# Exported name -> submodule defining it
+_EXPORTS = {
+    'ConfluenceService': 'confluence_service',
+    'OpenAIService': 'openai_service',
+    'AsyncOpenAIService': 'async_openai_service',
+    'run_sync': 'async_openai_service',
+    'run_background': 'async_openai_service',
+    'ConversationMemory': 'conversation',
+    'ChatHistory': 'chat_history',
+    'ChatMessage': 'chat_history',
+    'chunk_text': 'chunker',
+    'Tokenizer': 'tokenizer',
+    'get_tokenizer': 'tokenizer',
+    'AnswerCache': 'answer_cache',
+    'ContextPacker': 'context_packer',
+    'MapReduceSummarizer': 'summarizer',
+    'Summary': 'summarizer',
+    'SummaryCache': 'summarizer',
+    'EmbeddingCache': 'embedding_cache',
+    'storage_to_markdown': 'extractor',
+    'PageCache': 'page_cache',
+    'PageHandle': 'page_store',
+    'PageStore': 'page_store',
+    'PageCrawler': 'crawler',
+    'IngestionJob': 'ingestion',
+    'IngestionRunner': 'ingestion',
+    'SpaceSync': 'sync',
+    'FlatIndex': 'vector_index',
+    'IVFIndex': 'vector_index',
+    'create_index': 'vector_index',
+    'load_index': 'vector_index',
+    'SingleFlight': 'single_flight',
+    'AsyncSingleFlight': 'single_flight',
+    'RequestScheduler': 'rate_limiter',
+    'EndpointLimiter': 'rate_limiter',
+    'RateLimitedAdapter': 'rate_limiter',
+    'scheduler': 'rate_limiter',
+    'request_priority': 'rate_limiter',
+    'INTERACTIVE': 'rate_limiter',
+    'BACKGROUND': 'rate_limiter',
+    'BM25Index': 'lexical_index',
+    'reciprocal_rank_fusion': 'lexical_index',
+    'Retriever': 'retrieval',
+    'ServiceRegistry': 'registry',
+    'get_confluence_service': 'registry',
+    'get_openai_service': 'registry',
+    'get_page_store': 'registry',
+    'get_ingestion_runner': 'registry',
+    'get_retriever': 'registry',
+    'warm_up': 'warmup',
+}
+
+__all__ = ['LatencyRecorder', 'metrics'] + list(_EXPORTS)
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
 
-__all__ = ['ConfluenceService', 'OpenAIService']
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,212 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vector_index import normalize
+
+def _is_newer(version: Any, than: Any) -> bool:
+    """Whether a page version is newer than another; versions that are not numbers are newer when they differ."""
+    try:
+        return float(version) > float(than)
+    except (TypeError, ValueError):
+        return version != than
+
+class AnswerCache:
+    """
+    In-memory cache of answers keyed by page, page version and question.
+
+    A lookup first tries the exact question (after normalizing case and
+    whitespace), then the most similar cached question for the same page
+    version by cosine similarity of the question embeddings. Entries for a
+    page are dropped as soon as a lookup or store names a newer version;
+    sessions still holding an older version miss and do not store, so they
+    cannot wipe the answers for the current one.
+    The cache holds at most max_entries answers, evicting the least recently
+    used, and entries expire ttl seconds after they were stored.
+    """
+
+    def __init__(self, similarity: float = 0.95, max_entries: int = 1000, ttl: float = 86400.0):
+        """
+        Initialize an empty cache.
+
+        Args:
+            similarity: Minimum cosine similarity for a semantic hit
+            max_entries: Maximum number of cached answers
+            ttl: Seconds an answer stays valid
+        """
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (page_id, question hash) -> entry, in least recently used order
+        self._entries: 'OrderedDict[Tuple[str, bytes], Dict[str, Any]]' = OrderedDict()
+        self._versions: Dict[str, Any] = {}
+        self._stats = {
+            'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'near_misses': 0,
+            'writes': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0,
+        }
+
+    @staticmethod
+    def key(question: str) -> bytes:
+        """Hash a question, ignoring case and whitespace differences."""
+        normalized = re.sub(r'\s+', ' ', question).strip().lower()
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+    def get_exact(self, page_id: str, version: Any, question: str) -> Optional[str]:
+        """
+        Look up the answer to exactly this question, without needing its embedding.
+
+        Misses are not counted, since a semantic lookup usually follows.
+
+        Returns:
+            The cached answer, or None
+        """
+        with self._lock:
+            if not self._check_version(page_id, version):
+                return None
+            entry = self._live(page_id, self.key(question))
+            if entry is None:
+                return None
+            self._stats['exact_hits'] += 1
+            return entry['answer']
+
+    def get(self, page_id: str, version: Any, question: str, embedding: Optional[Sequence[float]]) -> Optional[str]:
+        """
+        Look up the answer to this question or the most similar cached one.
+
+        Args:
+            page_id: ID of the page the question is about
+            version: Version of the page
+            question: The question
+            embedding: Embedding of the question (None to only match exactly)
+
+        Returns:
+            The cached answer, or None
+        """
+        with self._lock:
+            if not self._check_version(page_id, version):
+                self._stats['misses'] += 1
+                return None
+            entry = self._live(page_id, self.key(question))
+            if entry is not None:
+                self._stats['exact_hits'] += 1
+                return entry['answer']
+
+            best: Optional[Tuple[str, bytes]] = None
+            best_score = -1.0
+            if embedding is not None:
+                candidates = [
+                    key for key in list(self._entries)
+                    if key[0] == page_id and self._live(page_id, key[1], touch=False) is not None
+                    and self._entries[key]['embedding'] is not None
+                ]
+                if candidates:
+                    query = normalize(np.asarray(embedding, dtype=np.float32))
+                    scores = np.stack([self._entries[key]['embedding'] for key in candidates]) @ query
+                    index = int(np.argmax(scores))
+                    best, best_score = candidates[index], float(scores[index])
+
+            if best is not None and best_score >= self.similarity:
+                self._entries.move_to_end(best)
+                self._stats['semantic_hits'] += 1
+                return self._entries[best]['answer']
+
+            self._stats['misses'] += 1
+            if best_score >= self.similarity - 0.05:
+                self._stats['near_misses'] += 1
+            return None
+
+    def put(
+        self,
+        page_id: str,
+        version: Any,
+        question: str,
+        embedding: Optional[Sequence[float]],
+        answer: str
+    ) -> None:
+        """
+        Cache the answer to a question.
+
+        Args:
+            page_id: ID of the page the question is about
+            version: Version of the page the answer was generated from
+            question: The question
+            embedding: Embedding of the question (None to only match exactly)
+            answer: The answer
+        """
+        vector = normalize(np.asarray(embedding, dtype=np.float32)) if embedding is not None else None
+        with self._lock:
+            if not self._check_version(page_id, version):
+                # Answered from an outdated version; not worth keeping
+                return
+            key = (page_id, self.key(question))
+            if vector is None and key in self._entries:
+                vector = self._entries[key]['embedding']
+            self._entries[key] = {'answer': answer, 'embedding': vector, 'stored_at': time.time()}
+            self._entries.move_to_end(key)
+            self._stats['writes'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, page_id: str) -> None:
+        """Drop all cached answers about a page."""
+        with self._lock:
+            self._drop_page(page_id)
+            self._versions.pop(page_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters and current size.
+
+        'near_misses' counts misses whose closest question was within 0.05 of
+        the similarity threshold, a hint for tuning it.
+
+        Returns:
+            Dict of counters plus 'entries' and 'hit_rate'
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _check_version(self, page_id: str, version: Any) -> bool:
+        """
+        Drop a page's answers if a newer version is named.
+
+        Returns:
+            Whether version is the newest one seen for the page
+        """
+        latest = self._versions.get(page_id)
+        if page_id not in self._versions or _is_newer(version, latest):
+            if page_id in self._versions:
+                self._drop_page(page_id)
+                self._stats['invalidations'] += 1
+            self._versions[page_id] = version
+            return True
+        return version == latest
+
+    def _drop_page(self, page_id: str) -> None:
+        for key in [key for key in self._entries if key[0] == page_id]:
+            del self._entries[key]
+
+    def _live(self, page_id: str, question_key: bytes, touch: bool = True) -> Optional[Dict[str, Any]]:
+        """Get an unexpired entry, dropping it if it has expired."""
+        key = (page_id, question_key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['stored_at'] > self.ttl:
+            del self._entries[key]
+            self._stats['expirations'] += 1
+            return None
+        if touch:
+            self._entries.move_to_end(key)
+        return entry
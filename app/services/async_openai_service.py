@@ -0,0 +1,616 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Tuple, TypeVar, Union
+
+# Add the app directory to the Python path
+app_dir = str(Path(__file__).parent.parent.absolute())
+if app_dir not in sys.path:
+    sys.path.append(app_dir)
+
+# Import third-party libraries
+try:
+    from openai import (
+        APIConnectionError, APITimeoutError, AsyncOpenAI, BadRequestError, InternalServerError, RateLimitError
+    )
+except ImportError as e:
+    print(f"Error importing required packages: {e}")
+    print("Please install the required packages with: pip install openai tiktoken")
+    sys.exit(1)
+
+from config import APP_CONFIG, OPENAI_CONFIG
+from .answer_cache import AnswerCache
+from .context_packer import ContextPacker
+from .embedding_cache import EmbeddingCache
+from .metrics import metrics
+from .rate_limiter import retry_after_header, scheduler
+from .single_flight import AsyncSingleFlight
+from .summarizer import MapReduceSummarizer, Summary, SummaryCache
+from .tokenizer import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Maximum tokens accepted per input by the embeddings endpoint
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+
+# Shown instead of an answer when OpenAI keeps rate limiting us
+RATE_LIMITED_MESSAGE = "The AI service is busy right now. Please try again in a moment."
+
+# Errors worth retrying with backoff; anything else fails immediately
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+ANSWER_SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on the provided context.
+                    The context is made of excerpts, each starting with its source IDs in square brackets; cite the IDs of the excerpts you used, e.g. [12345_0].
+                    If the answer cannot be found in the context, say \"I couldn't find the answer in the provided content.\"
+                    Be concise and to the point in your responses."""
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) the event loop thread that sync callers run coroutines on."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='openai-async', daemon=True).start()
+        return _loop
+
+def _in_context(coroutine: Coroutine[Any, Any, T]) -> Coroutine[Any, Any, T]:
+    """Wrap a coroutine so it runs with the calling thread's context variables, e.g. the request priority."""
+    context = contextvars.copy_context()
+
+    async def run() -> T:
+        for variable, value in context.items():
+            variable.set(value)
+        return await coroutine
+
+    return run()
+
+def run_sync(coroutine: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+    """
+    Run a coroutine on the shared background event loop and wait for its result.
+
+    Lets synchronous code such as Streamlit callbacks use async services. All
+    sync callers share one loop, so the services' clients and semaphores are
+    always used from the loop they belong to.
+
+    Args:
+        coroutine: The coroutine to run
+        timeout: Seconds to wait for the result
+
+    Returns:
+        The coroutine's result
+
+    Raises:
+        RuntimeError: If called from the background loop itself
+    """
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("run_sync cannot be called from the background event loop; await the coroutine instead")
+    future: Future = asyncio.run_coroutine_threadsafe(_in_context(coroutine), loop)
+    return future.result(timeout)
+
+def run_background(coroutine: Coroutine[Any, Any, T]) -> 'Future[T]':
+    """
+    Start a coroutine on the shared background event loop without waiting for it.
+
+    Args:
+        coroutine: The coroutine to run
+
+    Returns:
+        Future that completes with the coroutine's result
+    """
+    return asyncio.run_coroutine_threadsafe(_in_context(coroutine), _background_loop())
+
+class AsyncOpenAIService:
+    """
+    Asyncio-based service for OpenAI's API, for fan-out workloads.
+
+    Has the same surface as OpenAIService with coroutine methods. All requests
+    made through one instance share a semaphore limiting how many are in
+    flight, and every call accepts a timeout. An instance, its HTTP client
+    and its semaphore belong to the event loop they are first used on.
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-3.5-turbo",
+        http_client: Optional[Any] = None,
+        max_concurrency: int = OPENAI_CONFIG['MAX_CONCURRENCY'],
+        timeout: float = OPENAI_CONFIG['TIMEOUT']
+    ):
+        """
+        Initialize the async OpenAI client with API key from environment variables.
+
+        Args:
+            model: The name of the OpenAI model to use (default: "gpt-3.5-turbo")
+            http_client: httpx.AsyncClient to send requests through, e.g. one with a shared connection pool
+            max_concurrency: Maximum number of requests in flight at once
+            timeout: Default seconds per request
+
+        Raises:
+            ValueError: If OPENAI_API_KEY environment variable is not set
+            Exception: If client initialization fails
+        """
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            error_msg = "OPENAI_API_KEY environment variable not set"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
+        self.model = model
+        self.embedding_model = OPENAI_CONFIG['EMBEDDING_MODEL']
+        self.embedding_cache = EmbeddingCache.shared(
+            os.path.join(APP_CONFIG['CACHE_DIR'], 'embeddings'),
+            self.embedding_model,
+            max_rows=APP_CONFIG['EMBEDDING_CACHE_MAX_ROWS']
+        )
+        self.summary_model = "gpt-3.5-turbo"
+        self.timeout = timeout
+        self.single_flight = AsyncSingleFlight('openai_answers')
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        try:
+            logger.info(f"Initializing async OpenAI client with model: {self.model}")
+            # Retries are left to _request so they go through the rate limiter
+            self.client = AsyncOpenAI(api_key=self.api_key, http_client=http_client, timeout=timeout, max_retries=0)
+            self.tokenizer = get_tokenizer(self.model)
+            self.embedding_tokenizer = get_tokenizer(self.embedding_model)
+            self.context_packer = ContextPacker(self.tokenizer)
+            self.answer_cache = AnswerCache(
+                similarity=APP_CONFIG['ANSWER_CACHE_SIMILARITY'],
+                max_entries=APP_CONFIG['ANSWER_CACHE_MAX_ENTRIES'],
+                ttl=APP_CONFIG['ANSWER_CACHE_TTL_SECONDS']
+            )
+            self.summarizer = MapReduceSummarizer(
+                self,
+                SummaryCache.shared(
+                    os.path.join(APP_CONFIG['CACHE_DIR'], 'summaries'),
+                    max_entries=APP_CONFIG['SUMMARY_CACHE_MAX_ENTRIES']
+                ),
+                chunk_tokens=APP_CONFIG['SUMMARY_CHUNK_TOKENS'],
+                map_tokens=APP_CONFIG['SUMMARY_MAP_TOKENS'],
+                deadline=APP_CONFIG['SUMMARY_DEADLINE_SECONDS']
+            )
+        except Exception as e:
+            error_msg = f"Failed to initialize async OpenAI client: {str(e)}"
+            logger.error(error_msg)
+            raise Exception(error_msg) from e
+
+    async def close(self) -> None:
+        """Close the underlying HTTP client."""
+        await self.client.close()
+
+    async def _request(
+        self,
+        request: Callable[[float], Awaitable[T]],
+        max_retries: int = 5,
+        timeout: Optional[float] = None,
+        endpoint: str = 'openai_chat',
+        tokens: float = 0
+    ) -> T:
+        """
+        Make a request through the rate limiter and concurrency limit, retrying retryable errors.
+
+        Each attempt first waits for the endpoint's request and token quota,
+        at the priority of the calling context. A 429 pauses the endpoint for
+        everyone (honouring Retry-After) instead of just this call. The
+        semaphore is held only while a request is in flight, not during
+        backoff, so a rate-limited call does not block others.
+
+        Args:
+            request: Coroutine function taking the timeout and performing the request
+            max_retries: Total attempts before the last error is raised
+            timeout: Seconds per attempt (default: the service timeout)
+            endpoint: Rate limiter endpoint the request counts against
+            tokens: Tokens the request is expected to use
+
+        Returns:
+            The request's result
+
+        Raises:
+            ValueError: If max_retries is less than 1
+        """
+        if max_retries < 1:
+            raise ValueError(f"max_retries must be at least 1, got {max_retries}")
+        timeout = timeout or self.timeout
+        limiter = scheduler.endpoint(endpoint)
+        for attempt in range(max_retries):
+            await limiter.acquire_async(tokens)
+            try:
+                async with self.semaphore:
+                    result = await request(timeout)
+                limiter.success()
+                return result
+            except RateLimitError as e:
+                limiter.backoff(retry_after_header(getattr(e.response, 'headers', None)))
+                if attempt == max_retries - 1:
+                    raise
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_retries - 1:
+                    raise
+                delay = min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+                logger.warning(f"OpenAI request failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def get_embedding(self, text: str, timeout: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Get embedding vector for the given text.
+
+        Args:
+            text: Input text to get embedding for
+            timeout: Seconds per request (default: the service timeout)
+
+        Returns:
+            List of floats representing the embedding, or None if failed
+        """
+        embeddings, errors = await self.get_embeddings([text], timeout=timeout)
+        if errors:
+            logger.error(f"Error getting embedding: {errors[0]}")
+        return embeddings[0]
+
+    async def get_embeddings(
+        self,
+        texts: List[str],
+        batch_tokens: int = OPENAI_CONFIG['EMBEDDING_BATCH_TOKENS'],
+        batch_size: int = OPENAI_CONFIG['EMBEDDING_BATCH_SIZE'],
+        max_concurrency: int = OPENAI_CONFIG['EMBEDDING_MAX_WORKERS'],
+        max_retries: int = 5,
+        use_cache: bool = True,
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        """
+        Get embedding vectors for many texts using batched, concurrent requests.
+
+        Texts already in the embedding cache are served from it. The rest are
+        packed in input order into batches of at most batch_tokens tokens and
+        batch_size inputs. Up to max_concurrency batches of this call run at
+        once (within the service-wide limit) and are retried with exponential
+        backoff on rate limits, timeouts and server errors. A batch rejected as
+        invalid is split in half until the offending inputs are isolated, so
+        one bad text does not fail the rest.
+
+        Args:
+            texts: Input texts to get embeddings for
+            batch_tokens: Maximum total tokens per request
+            batch_size: Maximum number of inputs per request
+            max_concurrency: Maximum number of this call's requests in flight
+            max_retries: Attempts per batch before giving up on it
+            use_cache: Whether to read and populate the embedding cache
+            timeout: Seconds per request (default: the service timeout)
+
+        Returns:
+            Tuple of (embeddings in input order with None for failed items,
+            dict mapping the index of each failed item to its error message)
+
+        Raises:
+            ValueError: If max_retries is less than 1
+        """
+        if max_retries < 1:
+            # Checked up front, or every batch would fail with it as a per-item error
+            raise ValueError(f"max_retries must be at least 1, got {max_retries}")
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        errors: Dict[int, str] = {}
+        if not texts:
+            return embeddings, errors
+
+        cache = self.embedding_cache if use_cache else None
+        if cache:
+            for index, vector in enumerate(cache.get_many(texts)):
+                if vector is not None:
+                    embeddings[index] = vector.tolist()
+        pending = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if not pending:
+            return embeddings, errors
+
+        token_counts = dict(zip(pending, self.embedding_tokenizer.count_batch([texts[index] for index in pending])))
+
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        batch_total = 0
+        for index, count in token_counts.items():
+            if count == 0:
+                errors[index] = "Empty input"
+                continue
+            if count > EMBEDDING_MAX_INPUT_TOKENS:
+                errors[index] = f"Input has {count} tokens, more than the {EMBEDDING_MAX_INPUT_TOKENS} allowed"
+                continue
+            if batch and (batch_total + count > batch_tokens or len(batch) >= batch_size):
+                batches.append(batch)
+                batch, batch_total = [], 0
+            batch.append(index)
+            batch_total += count
+        if batch:
+            batches.append(batch)
+
+        call_limit = asyncio.Semaphore(max_concurrency)
+
+        async def embed(indices: List[int]) -> None:
+            try:
+                async with call_limit:
+                    response = await self._request(
+                        lambda request_timeout: self.client.embeddings.create(
+                            input=[texts[index] for index in indices],
+                            model=self.embedding_model,
+                            timeout=request_timeout
+                        ),
+                        max_retries,
+                        timeout,
+                        endpoint='openai_embeddings',
+                        tokens=sum(token_counts[index] for index in indices)
+                    )
+            except BadRequestError as e:
+                if len(indices) == 1:
+                    errors[indices[0]] = str(e)
+                else:
+                    middle = len(indices) // 2
+                    await asyncio.gather(embed(indices[:middle]), embed(indices[middle:]))
+                return
+            except Exception as e:
+                logger.error(f"Error getting embeddings for a batch of {len(indices)}: {str(e)}")
+                for index in indices:
+                    errors[index] = str(e)
+                return
+
+            for item in response.data:
+                embeddings[indices[item.index]] = item.embedding
+            if cache:
+                # The embeddings are good whether or not they can be cached
+                try:
+                    cache.put_many(
+                        [texts[indices[item.index]] for item in response.data],
+                        [item.embedding for item in response.data]
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to cache {len(response.data)} embeddings: {str(e)}")
+
+        await asyncio.gather(*(embed(batch) for batch in batches))
+
+        for index, embedding in enumerate(embeddings):
+            if embedding is None and index not in errors:
+                errors[index] = "No embedding returned"
+        return embeddings, errors
+
+    def build_answer_messages(
+        self,
+        context: Union[str, List[Dict]],
+        question: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+        max_tokens: int = 500
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Build the chat messages for a question, packing the context into the token budget.
+
+        The budget is what remains of the model's context window after the
+        system prompt, history, question and max_tokens, capped at
+        CONTEXT_MAX_TOKENS.
+
+        Args:
+            context: Ranked chunk dicts (best first), or plain text
+            question: The question to answer
+            history: Earlier chat messages ({'role', 'content'}) to include
+            model: The OpenAI model the prompt is for (default: this service's model)
+            max_tokens: Tokens reserved for the answer
+
+        Returns:
+            Tuple of (messages, packed context as returned by ContextPacker.pack)
+        """
+        model = model or self.model
+        history = list(history or [])
+        system_message = {"role": "system", "content": ANSWER_SYSTEM_PROMPT}
+        question_text = f"""\n\nQuestion: {question}"""
+
+        budget = self.context_packer.context_budget(
+            model,
+            max_tokens,
+            [system_message, *history, {"role": "user", "content": f"Context: {question_text}"}],
+            limit=APP_CONFIG['CONTEXT_MAX_TOKENS'],
+            window=OPENAI_CONFIG['CONTEXT_WINDOW']
+        )
+        chunks = [{'chunk_id': 'context', 'text': context}] if isinstance(context, str) else context
+        packed = self.context_packer.pack(chunks, budget)
+        if packed['skipped']:
+            logger.debug(f"Left {len(packed['skipped'])} chunks out of the context: {packed['skipped']}")
+
+        messages = [
+            system_message,
+            *history,
+            {
+                "role": "user",
+                "content": f"""Context: {packed['text']}
+                    {question_text}"""
+            }
+        ]
+        return messages, packed
+
+    async def cached_answer(
+        self,
+        page: Optional[Tuple[str, Any]],
+        question: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Tuple[Optional[str], Optional[List[float]], bool]:
+        """
+        Look up a cached answer to a question about a page.
+
+        Only standalone questions to this service's model are cached, since
+        answers to follow-ups depend on the conversation.
+
+        Args:
+            page: (page id, page version) the question is about, or None
+            question: The question
+            model: The OpenAI model the answer is for
+            history: Earlier chat messages
+
+        Returns:
+            Tuple of (cached answer or None, question embedding to store the
+            answer under, whether the answer may be cached)
+        """
+        if page is None or history or (model or self.model) != self.model:
+            return None, None, False
+        page_id, version = page
+        answer = self.answer_cache.get_exact(page_id, version, question)
+        if answer is not None:
+            return answer, None, True
+        embedding = await self.get_embedding(question)
+        return self.answer_cache.get(page_id, version, question, embedding), embedding, True
+
+    async def generate_answer(
+        self,
+        context: Union[str, List[Dict]],
+        question: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        page: Optional[Tuple[str, Any]] = None
+    ) -> str:
+        """
+        Generate an answer to a question based on the provided context.
+
+        Args:
+            context: Ranked chunk dicts (best first), or plain text; either is
+                packed into the model's token budget
+            question: The question to answer
+            model: The OpenAI model to use (default: this service's model)
+            history: Earlier chat messages ({'role', 'content'}) to include
+            max_tokens: Maximum length of the answer in tokens
+            timeout: Seconds per request (default: the service timeout)
+            page: (page id, page version) the context comes from; answers are
+                then served from and stored in the answer cache
+
+        Returns:
+            Generated answer as a string
+        """
+        try:
+            cached, embedding, cacheable = await self.cached_answer(page, question, model, history)
+            if cached is not None:
+                return cached
+
+            model = model or self.model
+            messages, _ = self.build_answer_messages(context, question, history, model, max_tokens)
+
+            # Identical prompts in flight at the same time share one request
+            key = hashlib.blake2b(
+                json.dumps([model, max_tokens, messages]).encode('utf-8'), digest_size=16
+            ).digest()
+            with metrics.time('answer_total'):
+                response = await self.single_flight.do(
+                    key,
+                    lambda: self._request(
+                        lambda request_timeout: self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=0.3,
+                            max_tokens=max_tokens,
+                            timeout=request_timeout
+                        ),
+                        timeout=timeout,
+                        tokens=self.context_packer.message_tokens(messages) + max_tokens
+                    )
+                )
+
+            answer = response.choices[0].message.content.strip()
+            if cacheable:
+                self.answer_cache.put(page[0], page[1], question, embedding, answer)
+            return answer
+
+        except RateLimitError as e:
+            logger.error(f"Rate limited generating answer: {str(e)}")
+            return RATE_LIMITED_MESSAGE
+
+        except Exception as e:
+            logger.error(f"Error generating answer: {str(e)}")
+            return "I'm sorry, I encountered an error while processing your request."
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the number of tokens in the given text.
+
+        Args:
+            text: Input text
+
+        Returns:
+            Number of tokens
+        """
+        return self.tokenizer.count(text)
+
+    async def summarize_text(
+        self,
+        text: str,
+        max_tokens: int = 300,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> Summary:
+        """
+        Generate a summary of the given text.
+
+        Texts too long for one request are summarized map-reduce style, see
+        MapReduceSummarizer.
+
+        Args:
+            text: Text to summarize
+            max_tokens: Maximum length of the summary in tokens
+            timeout: Seconds per request (default: the service timeout)
+            deadline: Seconds the whole summary may take (default: SUMMARY_DEADLINE_SECONDS)
+
+        Returns:
+            Generated summary, a Summary whose partial flag is set if parts of
+            it are the start of their text instead
+        """
+        return await self.summarizer.summarize(text, max_tokens=max_tokens, timeout=timeout, deadline=deadline)
+
+    async def summarize_once(self, text: str, max_tokens: int = 300, timeout: Optional[float] = None) -> str:
+        """
+        Summarize a text that fits in one request.
+
+        Args:
+            text: Text to summarize
+            max_tokens: Maximum length of the summary in tokens
+            timeout: Seconds per request (default: the service timeout)
+
+        Returns:
+            Generated summary
+
+        Raises:
+            OpenAIError: If the request fails
+        """
+        response = await self._request(
+            lambda request_timeout: self.client.chat.completions.create(
+                model=self.summary_model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a helpful assistant that summarizes text concisely while preserving key information."
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Please summarize the following text concisely:\n\n{text}"
+                    }
+                ],
+                temperature=0.3,
+                max_tokens=max_tokens,
+                timeout=request_timeout
+            ),
+            timeout=timeout,
+            tokens=self.count_tokens(text) + max_tokens
+        )
+
+        return response.choices[0].message.content.strip()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+class ChatMessage:
+    """One chat message, stored without a per-instance dict."""
+
+    __slots__ = ('role', 'content', 'timestamp')
+
+    def __init__(self, role: str, content: str, timestamp: Optional[float] = None):
+        self.role = role
+        self.content = content
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def to_dict(self) -> Dict[str, str]:
+        """The message as written to the log and exports."""
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+class ChatHistory:
+    """
+    A session's chat messages: the latest in memory, all of them on disk.
+
+    Every message is appended to a JSONL log as it is added, and only the
+    newest max_messages are kept in a ring buffer for display, so a
+    session's memory stays flat however long the conversation runs.
+    clear() empties the displayed conversation but not the log, which
+    exports read from. A log over max_log_bytes is cut to its newest half,
+    and logs not written to for max_log_age_days are deleted, so the log
+    directory does not grow forever.
+    """
+
+    # Seconds between sweeps of a log directory for expired logs
+    PRUNE_INTERVAL = 3600
+    # Log directory -> time of its last sweep in this process
+    _pruned: Dict[str, float] = {}
+    _prune_lock = threading.Lock()
+
+    def __init__(
+        self,
+        log_dir: str,
+        max_messages: int = 200,
+        session_id: Optional[str] = None,
+        max_log_bytes: Optional[int] = None,
+        max_log_age_days: Optional[float] = None
+    ):
+        """
+        Initialize an empty history.
+
+        Args:
+            log_dir: Directory the session's log file is written to
+            max_messages: Messages kept in memory
+            session_id: Names the log file (default: a random ID)
+            max_log_bytes: Size at which the log drops its older half (default: no limit)
+            max_log_age_days: Age after which untouched logs in log_dir are
+                deleted (default: kept forever)
+        """
+        self.session_id = session_id or uuid.uuid4().hex
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.log_dir / f"{self.session_id}.jsonl"
+        self.max_log_bytes = max_log_bytes
+        self._messages: Deque[ChatMessage] = deque(maxlen=max_messages)
+        # Messages since the last clear() that only remain in the log
+        self.dropped = 0
+        self._lock = threading.Lock()
+        if max_log_age_days is not None:
+            self.prune_logs(self.log_dir, max_log_age_days)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        with self._lock:
+            return iter(list(self._messages))
+
+    def add(self, role: str, content: str) -> ChatMessage:
+        """
+        Append a message to the conversation and the log.
+
+        Returns:
+            ChatMessage: The stored message
+        """
+        message = ChatMessage(role, content)
+        line = json.dumps(message.to_dict()) + "\n"
+        with self._lock:
+            if len(self._messages) == self._messages.maxlen:
+                self.dropped += 1
+            self._messages.append(message)
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                    size = f.tell()
+                if self.max_log_bytes is not None and size > self.max_log_bytes:
+                    self._trim_log()
+            except OSError as e:
+                logger.warning(f"Failed to write chat log {self.log_path}: {str(e)}")
+        return message
+
+    def _trim_log(self) -> None:
+        """Keep the newest messages filling half of max_log_bytes; call with the lock held."""
+        keep = self.max_log_bytes // 2
+        with open(self.log_path, 'rb') as f:
+            f.seek(max(0, f.seek(0, os.SEEK_END) - keep))
+            f.readline()  # Skip the partial message the cut landed in
+            tail = f.read()
+        temp_path = self.log_path.with_suffix('.jsonl.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(tail)
+        os.replace(temp_path, self.log_path)
+        logger.info(f"Chat log {self.log_path} passed {self.max_log_bytes} bytes; dropped its older messages")
+
+    @classmethod
+    def prune_logs(cls, log_dir: Path, max_age_days: float) -> int:
+        """
+        Delete logs in log_dir not written to for max_age_days.
+
+        Sweeps each directory at most once per PRUNE_INTERVAL, since every
+        new session calls it.
+
+        Returns:
+            Number of logs deleted
+        """
+        now = time.time()
+        with cls._prune_lock:
+            if now - cls._pruned.get(str(log_dir), 0.0) < cls.PRUNE_INTERVAL:
+                return 0
+            cls._pruned[str(log_dir)] = now
+
+        cutoff = now - max_age_days * 86400
+        deleted = 0
+        for path in Path(log_dir).glob('*.jsonl'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    deleted += 1
+            except OSError as e:
+                logger.warning(f"Failed to remove expired chat log {path}: {str(e)}")
+        if deleted:
+            logger.info(f"Removed {deleted} chat logs older than {max_age_days:g} days from {log_dir}")
+        return deleted
+
+    def clear(self) -> None:
+        """Forget the displayed conversation; the log keeps it."""
+        with self._lock:
+            self._messages.clear()
+            self.dropped = 0
+
+    def has_log(self) -> bool:
+        """Whether any message has been logged."""
+        return self.log_path.exists()
+
+    def iter_log(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """
+        Stream the log, one JSON message per line, in chunks of chunk_size bytes.
+
+        The file is closed once the iterator is exhausted or closed.
+        """
+        with open(self.log_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def read_log(self) -> bytes:
+        """
+        Read the whole log, for consumers that need it in one piece.
+
+        Streamlit's download button holds its data in memory whatever it is
+        given, so exports read the log in chunks and join them; max_log_bytes
+        bounds how big that gets.
+        """
+        return b''.join(self.iter_log())
@@ -0,0 +1,255 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_HEADING_RE = re.compile(r'(#{1,6}) +(.*)')
+_FENCE = '```'
+
+# Fraction of a window searched backwards for a whitespace token to split on
+_SPLIT_LOOKBACK = 0.2
+
+def split_blocks(text: str) -> List[Tuple[int, int, Tuple[str, ...], bool]]:
+    """
+    Split markdown into blocks separated by blank lines.
+
+    Fenced code blocks are kept whole and headings are blocks of their own.
+
+    Args:
+        text: Markdown text, e.g. from storage_to_markdown
+
+    Returns:
+        List of (start, end, heading_path, is_heading) tuples, where start/end
+        are character offsets into text and heading_path is the chain of
+        headings the block sits under (including itself for headings)
+    """
+    blocks = []
+    path: List[Tuple[int, str]] = []
+    start: Optional[int] = None
+    end = 0
+    in_fence = False
+    offset = 0
+
+    for line in text.split('\n'):
+        line_start, offset = offset, offset + len(line) + 1
+        stripped = line.strip()
+
+        if in_fence:
+            end = line_start + len(line)
+            if stripped.startswith(_FENCE):
+                in_fence = False
+            continue
+
+        if not stripped:
+            if start is not None:
+                blocks.append((start, end, tuple(title for _, title in path), False))
+                start = None
+            continue
+
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            if start is not None:
+                blocks.append((start, end, tuple(title for _, title in path), False))
+                start = None
+            level = len(heading.group(1))
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, heading.group(2).strip()))
+            blocks.append((line_start, line_start + len(line), tuple(title for _, title in path), True))
+            continue
+
+        if start is None:
+            start = line_start
+        end = line_start + len(line)
+        if stripped.startswith(_FENCE):
+            in_fence = True
+
+    if start is not None:
+        blocks.append((start, end, tuple(title for _, title in path), False))
+    return blocks
+
+def _char_offsets(text: str, tokens: List[int], tokenizer: Any) -> Tuple[List[bytes], Any]:
+    """
+    Map token positions in a block to character offsets.
+
+    Returns:
+        (bytes of each token, function from token index to character offset into text)
+    """
+    block = text.encode('utf-8')
+    token_bytes = tokenizer.decode_tokens_bytes(tokens)
+    byte_offsets = [0]
+    for piece in token_bytes:
+        byte_offsets.append(byte_offsets[-1] + len(piece))
+
+    def char_offset(token_index: int) -> int:
+        return len(block[:byte_offsets[token_index]].decode('utf-8', errors='ignore'))
+
+    return token_bytes, char_offset
+
+def _split_oversized(
+    text: str,
+    start: int,
+    tokens: List[int],
+    tokenizer: Any,
+    max_tokens: int,
+    overlap_tokens: int
+) -> List[Tuple[int, int, int]]:
+    """
+    Split a block longer than max_tokens into overlapping token windows.
+
+    Windows end on a whitespace token where possible so words are not cut,
+    and start after the whitespace the previous window ended on.
+
+    Returns:
+        List of (start, end, token_count) with character offsets into the page
+    """
+    token_bytes, char_offset = _char_offsets(text, tokens, tokenizer)
+
+    def window_start(first: int) -> int:
+        offset = char_offset(first)
+        return start + offset + len(text[offset:]) - len(text[offset:].lstrip())
+
+    windows = []
+    first = 0
+    while first < len(tokens):
+        last = min(first + max_tokens, len(tokens))
+        if last < len(tokens):
+            floor = last - max(1, int(max_tokens * _SPLIT_LOOKBACK))
+            for candidate in range(last, max(floor, first + 1), -1):
+                if token_bytes[candidate][:1] in (b' ', b'\n', b'\t'):
+                    last = candidate
+                    break
+        windows.append((window_start(first), start + char_offset(last), last - first))
+        if last >= len(tokens):
+            break
+        first = max(first + 1, last - overlap_tokens)
+    return windows
+
+def _tail_window(text: str, start: int, tokens: List[int], tokenizer: Any, count: int) -> Tuple[int, int]:
+    """
+    Find the last count tokens of a block, starting on a whitespace token where possible.
+
+    Returns:
+        (start, token_count): character offset into the page where the window
+        starts, after any leading whitespace, and the tokens it holds
+    """
+    token_bytes, char_offset = _char_offsets(text, tokens, tokenizer)
+    first = max(0, len(tokens) - count)
+    ceiling = min(len(tokens) - 1, first + max(1, int(count * _SPLIT_LOOKBACK)))
+    for candidate in range(first, ceiling + 1):
+        if token_bytes[candidate][:1] in (b' ', b'\n', b'\t'):
+            first = candidate
+            break
+    offset = char_offset(first)
+    offset += len(text[offset:]) - len(text[offset:].lstrip())
+    return start + offset, len(tokens) - first
+
+def chunk_text(
+    text: str,
+    tokenizer: Any,
+    max_tokens: int = 512,
+    overlap_tokens: int = 64,
+    min_tokens: Optional[int] = None
+) -> List[Dict]:
+    """
+    Split markdown into token-bounded chunks along section and paragraph boundaries.
+
+    The page is tokenized once (one batch over all blocks). Blocks are packed
+    greedily into chunks of at most max_tokens; a heading starts a new chunk
+    once the current one holds min_tokens. Consecutive chunks within a section
+    share the last overlap_tokens tokens of the earlier chunk, cut at a word
+    boundary, and blocks that are too big on their own are split into
+    overlapping token windows.
+
+    Args:
+        text: Markdown text, e.g. from storage_to_markdown
+        tokenizer: Tokenizer used to size chunks
+        max_tokens: Maximum tokens per chunk
+        overlap_tokens: Tokens repeated between consecutive chunks
+        min_tokens: Size a chunk must reach before a heading ends it
+            (default: a quarter of max_tokens)
+
+    Returns:
+        List of chunks with 'text', 'start', 'end' (character offsets into
+        text), 'heading_path' and 'token_count'
+    """
+    if not text:
+        return []
+    if min_tokens is None:
+        min_tokens = max_tokens // 4
+
+    blocks = split_blocks(text)
+    token_lists = tokenizer.encode_batch([text[start:end] for start, end, _, _ in blocks])
+
+    chunks: List[Dict] = []
+    # Blocks of the chunk being built: (start, end, token_count, heading_path, tokens)
+    current: List[Tuple[int, int, int, Tuple[str, ...], List[int]]] = []
+    carried = 0  # Leading blocks repeated from the previous chunk
+    headings = 0  # Trailing heading blocks, not yet followed by any content
+
+    def emit() -> None:
+        chunks.append({
+            'text': text[current[0][0]:current[-1][1]],
+            'start': current[0][0],
+            'end': current[-1][1],
+            'heading_path': list(current[min(carried, len(current) - 1)][3]),
+            'token_count': sum(block[2] + 1 for block in current) - 1,
+        })
+
+    def overlap(room: int) -> List[Tuple[int, int, int, Tuple[str, ...], List[int]]]:
+        """The last tokens of the current chunk that fit the overlap and the room left, as blocks."""
+        budget = min(overlap_tokens, room)
+        kept: List[Tuple[int, int, int, Tuple[str, ...], List[int]]] = []
+        for index in range(len(current) - 1, -1, -1):
+            block_start, block_end, count, block_path, block_tokens = current[index]
+            if budget <= 0:
+                break
+            # Whole blocks while they fit, but never the whole chunk again
+            if count + 1 <= budget and index > 0:
+                kept.insert(0, current[index])
+                budget -= count + 1
+                continue
+            # Otherwise the block's last tokens; a window carried from an earlier chunk has none kept to cut
+            if block_tokens:
+                window_start, window_tokens = _tail_window(
+                    text[block_start:block_end], block_start, block_tokens, tokenizer, min(budget, count - 1)
+                )
+                if window_tokens and window_start < block_end:
+                    kept.insert(0, (window_start, block_end, window_tokens, block_path, []))
+            break
+        return kept
+
+    for (start, end, path, is_heading), tokens in zip(blocks, token_lists):
+        # One token for the blank line joining blocks
+        size = len(tokens) + 1
+        current_tokens = sum(block[2] + 1 for block in current)
+
+        if is_heading and current and current_tokens >= min_tokens:
+            emit()
+            current, carried, headings = [], 0, 0
+        elif size > max_tokens:
+            # Headings right before the block lead its first window instead of making a chunk of their own
+            lead = current[len(current) - headings:] if headings else []
+            lead_tokens = sum(block[2] + 1 for block in lead)
+            if lead_tokens > max_tokens // 2:
+                lead, lead_tokens = [], 0
+            current = current[:len(current) - len(lead)]
+            if len(current) > carried:
+                emit()
+            current, carried, headings = lead, 0, 0
+            for window_start, window_end, window_tokens in _split_oversized(
+                text[start:end], start, tokens, tokenizer, max_tokens - lead_tokens, overlap_tokens
+            ):
+                current.append((window_start, window_end, window_tokens, path, []))
+                emit()
+                current = []
+            continue
+        elif current and current_tokens + size > max_tokens:
+            emit()
+            current = overlap(max_tokens - size)
+            carried, headings = len(current), 0
+
+        current.append((start, end, size - 1, path, tokens))
+        headings = headings + 1 if is_heading else 0
+
+    if current:
+        emit()
+    return chunks
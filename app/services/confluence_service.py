@@ -1,8 +1,9 @@
 import os
 import logging
 import sys
+from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 # Add the app directory to the Python path
 app_dir = str(Path(__file__).parent.parent.absolute())
@@ -11,22 +12,41 @@ if app_dir not in sys.path:
 
 # Import third-party libraries
 try:
+    import requests
     from atlassian import Confluence
-    from bs4 import BeautifulSoup
 except ImportError as e:
     print(f"Error importing required packages: {e}")
-    print("Please install the required packages with: pip install atlassian-python-api beautifulsoup4")
+    print("Please install the required packages with: pip install atlassian-python-api lxml")
     sys.exit(1)
 
+from config import APP_CONFIG, CONFLUENCE_CONFIG, OPENAI_CONFIG
+from .chunker import chunk_text
+from .extractor import CONTENT_FORMAT_VERSION, storage_to_markdown
+from .tokenizer import get_tokenizer
+from .page_cache import PageCache
+from .single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 class ConfluenceService:
     """Service for interacting with Confluence API."""
     
-    def __init__(self):
+    def __init__(
+        self,
+        page_cache: Optional[PageCache] = None,
+        session: Optional[requests.Session] = None,
+        check_connection: bool = True,
+        single_flight: Optional[SingleFlight] = None
+    ):
         """
         Initialize the Confluence client with environment variables.
         
+        Args:
+            page_cache: Cache for processed pages (default: the shared on-disk cache)
+            session: HTTP session to send requests through, e.g. one with a shared connection pool
+            check_connection: Whether to probe the server before returning
+            single_flight: Group coalescing concurrent loads of the same page (default: the shared one)
+            
         Raises:
             ValueError: If required environment variables are not set
             Exception: If client initialization fails
@@ -44,7 +64,19 @@ class ConfluenceService:
             logger.error(error_msg)
             raise ValueError(error_msg)
             
+        self.session = session
         self.client = self._get_client()
+        if check_connection:
+            self.check_connection()
+        self.page_cache = page_cache or PageCache.shared(
+            os.path.join(APP_CONFIG['CACHE_DIR'], 'pages'),
+            max_bytes=APP_CONFIG['PAGE_CACHE_MAX_MB'] * 1024 * 1024,
+            revalidate_after=APP_CONFIG['PAGE_CACHE_REVALIDATE_SECONDS'],
+            format_version=CONTENT_FORMAT_VERSION
+        )
+        self.single_flight = single_flight or SingleFlight.shared('confluence_pages')
+        # Optional local index answering search_pages(local=True), e.g. Retriever.search_pages
+        self.local_search: Optional[Callable[[str, int], List[Dict]]] = None
     
     def _get_client(self) -> Confluence:
         """
@@ -58,95 +90,301 @@ class ConfluenceService:
         """
         try:
             logger.info(f"Initializing Confluence client for {self.email} at {self.url}")
-            client = Confluence(
+            return Confluence(
                 url=self.url,
                 username=self.email,
                 password=self.api_token,
                 cloud=True,
+                timeout=CONFLUENCE_CONFIG['TIMEOUT'],
+                session=self.session,
                 verify_ssl=True  # Enable SSL verification for security
             )
             
-            # Test the connection
-            client.get_server_info()
-            logger.info("Successfully connected to Confluence")
-            return client
-            
         except Exception as e:
             error_msg = f"Failed to initialize Confluence client: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg) from e
     
-    def get_page(self, page_id: str) -> Optional[Dict]:
+    def check_connection(self) -> None:
+        """
+        Verify that the Confluence server is reachable with the configured credentials.
+        
+        Raises:
+            Exception: If the server cannot be reached
+        """
+        try:
+            self.client.get_server_info()
+            logger.info("Successfully connected to Confluence")
+        except Exception as e:
+            error_msg = f"Failed to connect to Confluence: {str(e)}"
+            logger.error(error_msg)
+            raise Exception(error_msg) from e
+    
+    def get_page(self, page_id: str, use_cache: bool = True) -> Optional[Dict]:
         """
         Get a Confluence page by ID.
         
         Args:
             page_id: The ID of the page to retrieve
+            use_cache: Whether to serve and store the page via the page cache
             
         Returns:
             Dict containing page data or None if not found
         """
+        try:
+            return self.fetch_page(page_id, use_cache=use_cache)
+        except Exception as e:
+            logger.error(f"Error fetching page {page_id}: {str(e)}")
+            return None
+    
+    def fetch_page(
+        self,
+        page_id: str,
+        use_cache: bool = True,
+        version: Optional[int] = None,
+        allow_stale: bool = True
+    ) -> Dict:
+        """
+        Get a Confluence page by ID, revalidating any cached copy by version.
+        
+        A cached page is returned without a request if it was validated within
+        the cache's revalidation window, after a version-only request if its
+        version is still current, and as a stale copy if Confluence cannot be
+        reached. Concurrent identical loads, e.g. from sessions opening the
+        same shared link, share one request.
+        
+        Args:
+            page_id: The ID of the page to retrieve
+            use_cache: Whether to serve and store the page via the page cache
+            version: Current version of the page if the caller already knows it,
+                e.g. from a listing; skips the version-only request
+            allow_stale: Whether to serve an outdated cached copy when Confluence fails
+            
+        Returns:
+            Dict containing page data
+            
+        Raises:
+            Exception: If the page cannot be fetched and no cached copy exists
+        """
+        return self.single_flight.do(
+            (page_id, use_cache, version, allow_stale),
+            lambda: self._fetch_page(page_id, use_cache, version, allow_stale)
+        )
+    
+    def _fetch_page(self, page_id: str, use_cache: bool, version: Optional[int], allow_stale: bool) -> Dict:
+        """Load a page for fetch_page, outside the single-flight group."""
+        cache = self.page_cache if use_cache else None
+        cached = cache.get(page_id) if cache else None
+        
+        if cached:
+            if version is None and cache.is_fresh(page_id):
+                cache.record('hits')
+                return cached['page']
+            
+            if version is None:
+                try:
+                    version = self.get_page_version(page_id)
+                except Exception as e:
+                    if not allow_stale:
+                        raise
+                    logger.warning(f"Could not revalidate page {page_id}, serving cached copy: {str(e)}")
+                    cache.record('stale_hits')
+                    return cached['page']
+                cache.record('revalidations')
+            
+            if version == cached['version']:
+                cache.mark_checked(page_id)
+                cache.record('hits')
+                return cached['page']
+        
+        if cache:
+            cache.record('misses')
+        
         try:
             page = self.client.get_page_by_id(
                 page_id=page_id,
                 expand='body.storage,version,ancestors,descendants.page,metadata.labels'
             )
+        except Exception as e:
+            if cached and allow_stale:
+                logger.warning(f"Failed to refresh page {page_id}, serving cached copy: {str(e)}")
+                cache.record('stale_hits')
+                return cached['page']
+            raise
+        
+        result = self._build_page(page)
+        if cache:
+            cache.put(page_id, result['version'], result)
+        return result
+    
+    def get_page_version(self, page_id: str) -> int:
+        """
+        Get the current version number of a page without fetching its body.
+        
+        Args:
+            page_id: The ID of the page
             
-            # Extract relevant data
-            return {
-                'id': page['id'],
-                'title': page['title'],
-                'url': f"{self.url.rstrip('/')}/wiki{page['_links']['webui']}",
-                'content': self._clean_html(page['body']['storage']['value']),
-                'version': page['version']['number'],
-                'last_updated': page['version']['when'],
-                'created': page['history']['createdDate'],
-                'space': page.get('space', {}).get('name', 'Unknown'),
-                'labels': [label['name'] for label in page.get('metadata', {}).get('labels', {}).get('results', [])],
-                'ancestors': [ancestor['title'] for ancestor in page.get('ancestors', [])],
-                'child_pages': [child['title'] for child in page.get('descendants', {}).get('page', {}).get('results', [])]
-            }
+        Returns:
+            The page's version number
+        """
+        page = self.client.get_page_by_id(page_id=page_id, expand='version')
+        return page['version']['number']
+    
+    def _build_page(self, page: Dict) -> Dict:
+        """
+        Extract relevant data from a raw Confluence page response.
+        
+        Args:
+            page: Page as returned by the Confluence API
             
-        except Exception as e:
-            logger.error(f"Error fetching page {page_id}: {str(e)}")
-            return None
+        Returns:
+            Dict containing page data
+        """
+        return {
+            'id': page['id'],
+            'title': page['title'],
+            'url': f"{self.url.rstrip('/')}/wiki{page['_links']['webui']}",
+            'content': self._clean_html(page['body']['storage']['value']),
+            'version': page['version']['number'],
+            'last_updated': page['version']['when'],
+            'created': page['history']['createdDate'],
+            'space': page.get('space', {}).get('name', 'Unknown'),
+            'labels': [label['name'] for label in page.get('metadata', {}).get('labels', {}).get('results', [])],
+            'ancestors': [ancestor['title'] for ancestor in page.get('ancestors', [])],
+            'child_pages': [child['title'] for child in page.get('descendants', {}).get('page', {}).get('results', [])]
+        }
     
     def _clean_html(self, html_content: str) -> str:
         """
-        Clean HTML content and extract text.
+        Convert storage-format HTML into text, keeping document structure.
         
         Args:
             html_content: Raw HTML content from Confluence
             
         Returns:
-            Cleaned text content
+            Markdown text with headings, lists, tables and code blocks preserved
         """
-        if not html_content:
-            return ""
+        return storage_to_markdown(html_content)
+    
+    def list_space_pages(self, space_key: str, start: int = 0, limit: int = 100) -> List[Dict]:
+        """
+        List one batch of pages in a space with their current versions.
+        
+        Args:
+            space_key: The key of the space
+            start: Offset of the first page to return
+            limit: Maximum number of pages to return
             
-        soup = BeautifulSoup(html_content, 'html.parser')
+        Returns:
+            List of dicts with 'id', 'title' and 'version'; empty once past the last page
+        """
+        pages = self.client.get_all_pages_from_space(
+            space_key,
+            start=start,
+            limit=limit,
+            expand='version',
+            content_type='page'
+        )
+        return [
+            {'id': page['id'], 'title': page['title'], 'version': page['version']['number']}
+            for page in pages or []
+        ]
+    
+    def list_descendant_pages(self, page_id: str, start: int = 0, limit: int = 100) -> List[Dict]:
+        """
+        List one batch of pages below a page, at any depth, with their current versions.
+        
+        Args:
+            page_id: The ID of the root page
+            start: Offset of the first page to return
+            limit: Maximum number of pages to return
+            
+        Returns:
+            List of dicts with 'id', 'title' and 'version'; empty once past the last page
+        """
+        results = self.client.cql(
+            f'ancestor = {int(page_id)} and type = page',
+            start=start,
+            limit=limit,
+            expand='content.version'
+        )
+        return [
+            {
+                'id': result['content']['id'],
+                'title': result['content']['title'],
+                'version': result['content']['version']['number']
+            }
+            for result in results.get('results', [])
+            if result.get('content')
+        ]
+    
+    def list_modified_pages(self, space_key: str, since: datetime, start: int = 0, limit: int = 100) -> List[Dict]:
+        """
+        List one batch of pages in a space modified after a point in time.
         
-        # Remove script and style elements
-        for element in soup(["script", "style", "noscript"]):
-            element.decompose()
+        Args:
+            space_key: The key of the space
+            since: Only pages modified after this time are returned
+            start: Offset of the first page to return
+            limit: Maximum number of pages to return
             
-        # Get text and clean up
-        text = soup.get_text(separator=' ', strip=True)
+        Returns:
+            List of dicts with 'id', 'title' and 'version'; empty once past the last page
+        """
+        results = self.client.cql(
+            f'space = "{self._cql_escape(space_key)}" and type = page '
+            f'and lastmodified > "{since.strftime("%Y-%m-%d %H:%M")}"',
+            start=start,
+            limit=limit,
+            expand='content.version'
+        )
+        return [
+            {
+                'id': result['content']['id'],
+                'title': result['content']['title'],
+                'version': result['content']['version']['number']
+            }
+            for result in results.get('results', [])
+            if result.get('content')
+        ]
+    
+    def count_space_pages(self, space_key: str) -> int:
+        """
+        Count the current pages in a space with a single request.
         
-        # Clean up multiple whitespace and newlines
-        return ' '.join(text.split())
+        Args:
+            space_key: The key of the space
+            
+        Returns:
+            Number of pages in the space
+        """
+        results = self.client.cql(f'space = "{self._cql_escape(space_key)}" and type = page', limit=1)
+        return int(results.get('totalSize', 0))
     
-    def search_pages(self, query: str, limit: int = 10) -> List[Dict]:
+    @staticmethod
+    def _cql_escape(value: str) -> str:
+        """Escape a value for use inside a double-quoted CQL string."""
+        return value.replace('\\', '\\\\').replace('"', '\\"')
+    
+    def search_pages(self, query: str, limit: int = 10, local: bool = False) -> List[Dict]:
         """
         Search for pages in Confluence.
         
         Args:
             query: Search query string
             limit: Maximum number of results to return
+            local: Search the locally indexed pages instead of calling Confluence,
+                when a local index is attached
             
         Returns:
             List of matching pages with basic info
         """
+        if local and self.local_search is not None:
+            try:
+                return self.local_search(query, limit)
+            except Exception as e:
+                logger.warning(f"Local search failed, falling back to Confluence: {str(e)}")
+        
         try:
             results = self.client.cql(
                 f'siteSearch ~ "{query}"',
@@ -169,32 +407,61 @@ class ConfluenceService:
             logger.error(f"Error searching pages: {str(e)}")
             return []
 
-    def get_page_content_chunked(self, page_id: str, chunk_size: int = 2000) -> List[Dict]:
+    def get_page_content_chunked(
+        self,
+        page_id: str,
+        max_tokens: int = APP_CONFIG['CHUNK_MAX_TOKENS'],
+        overlap_tokens: int = APP_CONFIG['CHUNK_OVERLAP_TOKENS']
+    ) -> List[Dict]:
         """
         Get page content split into chunks for processing.
         
         Args:
             page_id: The ID of the page
-            chunk_size: Maximum size of each chunk in characters
+            max_tokens: Maximum size of each chunk in tokens
+            overlap_tokens: Tokens repeated between consecutive chunks
             
         Returns:
             List of chunks with metadata
         """
         page = self.get_page(page_id)
-        if not page or not page.get('content'):
+        if not page:
             return []
+        return self.chunk_page(page, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    
+    def chunk_page(
+        self,
+        page: Dict,
+        max_tokens: int = APP_CONFIG['CHUNK_MAX_TOKENS'],
+        overlap_tokens: int = APP_CONFIG['CHUNK_OVERLAP_TOKENS']
+    ) -> List[Dict]:
+        """
+        Split an already fetched page into token-bounded chunks along its sections.
+        
+        Args:
+            page: Page dict as returned by get_page
+            max_tokens: Maximum size of each chunk in tokens
+            overlap_tokens: Tokens repeated between consecutive chunks
             
-        content = page['content']
-        chunks = []
-        
-        # Simple chunking by character count
-        for i in range(0, len(content), chunk_size):
-            chunk = content[i:i + chunk_size]
-            chunks.append({
-                'text': chunk,
-                'chunk_id': f"{page_id}_{len(chunks)}",
-                'page_id': page_id,
-                'page_title': page['title']
+        Returns:
+            List of chunks with text, character offsets, heading path and page metadata
+        """
+        if not page.get('content'):
+            return []
+        
+        chunks = chunk_text(
+            page['content'],
+            get_tokenizer(OPENAI_CONFIG['MODEL']),
+            max_tokens=max_tokens,
+            overlap_tokens=overlap_tokens
+        )
+        for index, chunk in enumerate(chunks):
+            chunk.update({
+                'chunk_id': f"{page['id']}_{index}",
+                'page_id': page['id'],
+                'page_title': page['title'],
+                'page_version': page['version'],
+                'page_space': page.get('space', 'Unknown'),
+                'page_last_updated': page.get('last_updated')
             })
-            
         return chunks
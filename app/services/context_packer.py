@@ -0,0 +1,207 @@
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Context window sizes by model name prefix; longest matching prefix wins
+CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4.1': 1047576,
+    'o1': 200000,
+    'o3': 200000,
+    'o4': 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens the chat format adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Headroom for tokenizer differences between the estimate and the API
+SAFETY_MARGIN_TOKENS = 64
+
+def context_window(model: str) -> int:
+    """Context window of a model in tokens (DEFAULT_CONTEXT_WINDOW if unknown)."""
+    matches = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+class ContextPacker:
+    """
+    Assembles ranked chunks into a prompt context that fits a token budget.
+
+    Chunks are taken in rank order until the budget is used up; chunks that
+    do not fit are skipped in favour of smaller, lower-ranked ones. Chunks of
+    the same page whose character ranges overlap (e.g. the overlap between
+    consecutive chunks) are merged so no text is sent twice. Each block is
+    labelled with the IDs of the chunks it came from so answers can cite them.
+    Token counts come from the tokenizer's memo, so repeated questions over
+    the same chunks do not re-tokenize them.
+    """
+
+    def __init__(self, tokenizer: Any):
+        """
+        Initialize the packer.
+
+        Args:
+            tokenizer: Tokenizer used to count tokens
+        """
+        self.tokenizer = tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens of a text, memoized by its hash."""
+        return self.tokenizer.count(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut a text down to at most max_tokens tokens."""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        return self.tokenizer.decode(self.tokenizer.encode(text)[:max(0, max_tokens)])
+
+    def message_tokens(self, messages: Sequence[Dict[str, str]]) -> int:
+        """Tokens taken up by chat messages, including per-message overhead."""
+        counts = self.tokenizer.count_batch([message['content'] for message in messages])
+        return sum(counts) + MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+    def context_budget(
+        self,
+        model: str,
+        max_tokens: int,
+        messages: Sequence[Dict[str, str]] = (),
+        limit: Optional[int] = None,
+        window: Optional[int] = None
+    ) -> int:
+        """
+        Tokens left for context once the other prompt parts and the answer are accounted for.
+
+        Args:
+            model: Chat model the prompt is for
+            max_tokens: Tokens reserved for the answer
+            messages: Other prompt messages (system prompt, history, question)
+            limit: Upper bound on the context regardless of the model window
+            window: Context window override (default: looked up from the model)
+
+        Returns:
+            Context budget in tokens (never negative)
+        """
+        available = (window or context_window(model)) - max_tokens - SAFETY_MARGIN_TOKENS - self.message_tokens(messages)
+        if limit is not None:
+            available = min(available, limit)
+        return max(0, available)
+
+    def pack(self, chunks: Sequence[Dict], budget: int) -> Dict[str, Any]:
+        """
+        Fill a token budget with ranked chunks.
+
+        Args:
+            chunks: Chunk dicts, best first, with 'text' and optionally
+                'chunk_id', 'page_id', 'page_title', 'heading_path', 'start' and 'end'
+            budget: Maximum tokens of the packed context
+
+        Returns:
+            Dict with 'text' (the context), 'chunk_ids' (cited IDs in context
+            order), 'token_count', and 'skipped' (IDs left out for lack of room
+            or as duplicates)
+        """
+        # Selected blocks per page, in order of first appearance
+        blocks: Dict[Any, List[Dict[str, Any]]] = {}
+        seen_texts = set()
+        skipped: List[str] = []
+        used = 0
+
+        for index, chunk in enumerate(chunks):
+            chunk_id = str(chunk.get('chunk_id', index))
+            text = chunk.get('text', '')
+            text_key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+            if not text.strip() or text_key in seen_texts:
+                skipped.append(chunk_id)
+                continue
+
+            page_blocks = blocks.get(chunk.get('page_id', chunk_id), [])
+            start = chunk.get('start')
+            end = chunk.get('end', start + len(text) if start is not None else None)
+            overlapping = [
+                block for block in page_blocks
+                if start is not None and block['start'] < end and start < block['end']
+            ]
+            if any(block['start'] <= start and end <= block['end'] for block in overlapping):
+                skipped.append(chunk_id)
+                continue
+
+            block = {
+                'start': start if start is not None else index,
+                'end': end if end is not None else index,
+                'chunk_ids': [chunk_id],
+                'parts': [(start, end, text)],
+                'chunk': chunk,
+            }
+            if overlapping:
+                # Merge with the blocks it overlaps; only the uncovered text costs extra
+                for other in overlapping:
+                    block['start'] = min(block['start'], other['start'])
+                    block['end'] = max(block['end'], other['end'])
+                    block['chunk_ids'] = other['chunk_ids'] + block['chunk_ids']
+                    block['parts'] = other['parts'] + block['parts']
+                block['chunk'] = overlapping[0]['chunk']
+            block['cost'] = self._block_tokens(block)
+            cost = block['cost'] - sum(other['cost'] for other in overlapping)
+
+            if used + cost > budget:
+                if used or overlapping or budget <= 0:
+                    skipped.append(chunk_id)
+                    continue
+                # Nothing fits yet: keep the start of the best chunk rather than nothing
+                header_tokens = self.count_tokens(self._header(chunk, [chunk_id])) + 1
+                text = self.truncate(text, budget - header_tokens)
+                if not text:
+                    skipped.append(chunk_id)
+                    continue
+                block['parts'] = [(start, start + len(text) if start is not None else None, text)]
+                block['cost'] = cost = self._block_tokens(block)
+
+            for other in overlapping:
+                page_blocks.remove(other)
+            page_blocks.append(block)
+            blocks.setdefault(chunk.get('page_id', chunk_id), page_blocks)
+            seen_texts.add(text_key)
+            used += cost
+
+        rendered = []
+        chunk_ids: List[str] = []
+        for page_blocks in blocks.values():
+            for block in sorted(page_blocks, key=lambda block: block['start']):
+                rendered.append(self._render(block))
+                chunk_ids.extend(block['chunk_ids'])
+        return {'text': "\n\n".join(rendered), 'chunk_ids': chunk_ids, 'token_count': used, 'skipped': skipped}
+
+    def _block_tokens(self, block: Dict[str, Any]) -> int:
+        # One token for the blank line between blocks
+        return self.count_tokens(self._render(block)) + 1
+
+    def _render(self, block: Dict[str, Any]) -> str:
+        return f"{self._header(block['chunk'], block['chunk_ids'])}\n{self._merge_text(block['parts'])}"
+
+    @staticmethod
+    def _header(chunk: Dict, chunk_ids: List[str]) -> str:
+        """Citation label for a block: its chunk IDs, page title and section."""
+        location = [chunk['page_title']] if chunk.get('page_title') else []
+        location.extend(chunk.get('heading_path') or [])
+        label = ', '.join(chunk_ids)
+        return f"[{label}] {' > '.join(location)}".rstrip()
+
+    @staticmethod
+    def _merge_text(parts: List[Tuple[Optional[int], Optional[int], str]]) -> str:
+        """Join overlapping page spans into one text without repeating the shared part."""
+        if len(parts) == 1:
+            return parts[0][2]
+        parts = sorted(parts, key=lambda part: part[0])
+        text = parts[0][2]
+        covered = parts[0][1]
+        for start, end, part_text in parts[1:]:
+            if end <= covered:
+                continue
+            text += part_text[max(0, covered - start):]
+            covered = end
+        return text
@@ -0,0 +1,145 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from .async_openai_service import run_background
+from .context_packer import MESSAGE_OVERHEAD_TOKENS
+
+logger = logging.getLogger(__name__)
+
+class ConversationMemory:
+    """
+    Chat history for follow-up questions, bounded by a token budget.
+
+    Recent messages are kept verbatim; older ones are folded into a rolling
+    summary once the verbatim part outgrows its share of the budget. Folding
+    runs on the background event loop after an answer has been shown, so it
+    never delays a question. Until a fold finishes, history() drops the
+    oldest messages that do not fit, so prompts stay within the budget either
+    way.
+    """
+
+    def __init__(self, service: Any, max_tokens: int = 1500, summary_tokens: int = 300):
+        """
+        Initialize an empty conversation.
+
+        Args:
+            service: AsyncOpenAIService used to count tokens and write summaries
+            max_tokens: Token budget for the history sent with each question
+            summary_tokens: Length in tokens of the summary of older messages
+        """
+        if summary_tokens >= max_tokens:
+            raise ValueError("summary_tokens must be smaller than max_tokens")
+        self.service = service
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.summary = ''
+        self._messages: List[Dict[str, str]] = []
+        self._folding: Optional[Future] = None
+        # Bumped by clear() so folds started before it are discarded
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def add(self, role: str, content: str) -> None:
+        """Append a message to the conversation."""
+        with self._lock:
+            self._messages.append({"role": role, "content": content})
+
+    def history(self) -> List[Dict[str, str]]:
+        """
+        Messages to send with the next question.
+
+        Returns:
+            The summary of older messages (as a system message, if any)
+            followed by as many recent messages as fit in the budget
+        """
+        with self._lock:
+            summary = self.summary
+            messages = list(self._messages)
+
+        history = []
+        budget = self.max_tokens
+        if summary:
+            history.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+            budget -= self.service.count_tokens(history[0]['content']) + MESSAGE_OVERHEAD_TOKENS
+
+        kept: List[Dict[str, str]] = []
+        costs = self.service.tokenizer.count_batch([message['content'] for message in messages])
+        for message, cost in zip(reversed(messages), reversed(costs)):
+            budget -= cost + MESSAGE_OVERHEAD_TOKENS
+            if budget < 0:
+                break
+            kept.append(message)
+        return history + kept[::-1]
+
+    def fold_in_background(self) -> Optional[Future]:
+        """
+        Start folding older messages into the summary if the verbatim part is too big.
+
+        Messages are folded until the rest takes at most half of the verbatim
+        budget, so folds happen every few turns rather than after every answer.
+        The latest question and answer always stay verbatim. Does nothing
+        while a fold is already running.
+
+        Returns:
+            Future of the fold, or None if none was started
+        """
+        with self._lock:
+            if self._folding is not None and not self._folding.done():
+                return None
+            messages = list(self._messages)
+            summary = self.summary
+            generation = self._generation
+
+        costs = [
+            cost + MESSAGE_OVERHEAD_TOKENS
+            for cost in self.service.tokenizer.count_batch([message['content'] for message in messages])
+        ]
+        verbatim_budget = self.max_tokens - self.summary_tokens - MESSAGE_OVERHEAD_TOKENS
+        if sum(costs) <= verbatim_budget:
+            return None
+
+        folded = 0
+        remaining = sum(costs)
+        while folded < len(messages) - 2 and remaining > verbatim_budget // 2:
+            remaining -= costs[folded]
+            folded += 1
+        if not folded:
+            return None
+
+        future = run_background(self._fold(summary, messages[:folded], generation))
+        with self._lock:
+            self._folding = future
+        return future
+
+    async def _fold(self, summary: str, messages: List[Dict[str, str]], generation: int) -> None:
+        """
+        Summarize the current summary plus the given oldest messages, then drop those messages.
+
+        Nothing changes if the summary fails or is partial.
+        """
+        transcript = "\n\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+        text = f"Summary of the conversation so far:\n{summary}\n\n{transcript}" if summary else transcript
+        try:
+            new_summary = await self.service.summarize_text(text, max_tokens=self.summary_tokens)
+        except Exception as e:
+            logger.error(f"Error summarizing the conversation: {str(e)}")
+            return
+        if getattr(new_summary, 'partial', False):
+            # Truncated text in place of a summary would lose the messages; keep them for the next fold
+            logger.warning(f"Summary of {len(messages)} messages is partial; keeping them verbatim")
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self.summary = new_summary
+            del self._messages[:len(messages)]
+
+    def clear(self) -> None:
+        """Forget the conversation, including any fold in progress."""
+        with self._lock:
+            self.summary = ''
+            self._messages = []
+            self._generation += 1
@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from config import APP_CONFIG
+from .confluence_service import ConfluenceService
+from .rate_limiter import BACKGROUND, request_priority
+
+logger = logging.getLogger(__name__)
+
+class CrawlCheckpoint:
+    """Set of page IDs already delivered by a crawl, persisted so it can resume."""
+
+    def __init__(self, path: Path, flush_every: int = 50):
+        """
+        Load the checkpoint at the given path, if any.
+
+        Args:
+            path: JSON file the checkpoint is stored in
+            flush_every: Number of completed pages between writes
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.completed: Set[str] = set()
+        self._unflushed = 0
+
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.completed = set(json.load(f).get('completed', []))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable crawl checkpoint {path}: {str(e)}")
+
+    def add(self, page_id: str) -> None:
+        """Mark a page as delivered."""
+        self.completed.add(page_id)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the checkpoint to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'completed': sorted(self.completed), 'updated_at': time.time()}, f)
+        os.replace(tmp_path, self.path)
+        self._unflushed = 0
+
+    def clear(self) -> None:
+        """Remove the checkpoint once a crawl has finished."""
+        self.completed.clear()
+        self._unflushed = 0
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+class PageCrawler:
+    """
+    Crawls a Confluence space or page tree with bounded concurrency.
+
+    Page listings (IDs and versions) are paged through sequentially while page
+    bodies are fetched on a thread pool. Pages whose listed version is already
+    in the page cache are served without a request. Processed pages are yielded
+    as soon as they are fetched, so callers can clean, chunk and embed while the
+    crawl is still running. Transient errors are retried with exponential
+    backoff; rate limits (HTTP 429) are handled by the rate limiter on the
+    Confluence session, which every worker shares. All requests are made at
+    background priority, so interactive page loads are served first.
+    """
+
+    def __init__(
+        self,
+        confluence_service: ConfluenceService,
+        max_workers: int = APP_CONFIG['CRAWL_MAX_WORKERS'],
+        max_retries: int = 5,
+        page_size: int = 100,
+        checkpoint_dir: Optional[str] = None
+    ):
+        """
+        Initialize the crawler.
+
+        Args:
+            confluence_service: Service used to list and fetch pages
+            max_workers: Maximum number of concurrent page fetches
+            max_retries: Attempts per request before giving up on it
+            page_size: Number of pages requested per listing call
+            checkpoint_dir: Directory for resume checkpoints (default: CACHE_DIR/crawl)
+        """
+        self.confluence_service = confluence_service
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.page_size = page_size
+        self.checkpoint_dir = Path(checkpoint_dir or os.path.join(APP_CONFIG['CACHE_DIR'], 'crawl'))
+
+        self._lock = threading.Lock()
+        self._stats = {'listed': 0, 'fetched': 0, 'skipped': 0, 'failed': 0}
+
+    def crawl_space(self, space_key: str, resume: bool = True) -> Iterator[Dict]:
+        """
+        Crawl every page in a space.
+
+        Args:
+            space_key: The key of the space
+            resume: Skip pages delivered by an interrupted earlier crawl of the same space
+
+        Yields:
+            Dict containing page data, in completion order
+        """
+        listing = self.paginate(lambda start: self.confluence_service.list_space_pages(
+            space_key, start=start, limit=self.page_size
+        ))
+        yield from self._crawl(f"space-{space_key}", listing, resume)
+
+    def crawl_tree(self, root_page_id: str, resume: bool = True) -> Iterator[Dict]:
+        """
+        Crawl a page and all of its descendants.
+
+        Args:
+            root_page_id: The ID of the root page
+            resume: Skip pages delivered by an interrupted earlier crawl of the same tree
+
+        Yields:
+            Dict containing page data, in completion order
+        """
+        def listing() -> Iterator[Dict]:
+            yield {'id': str(root_page_id), 'version': None}
+            yield from self.paginate(lambda start: self.confluence_service.list_descendant_pages(
+                root_page_id, start=start, limit=self.page_size
+            ))
+
+        yield from self._crawl(f"tree-{root_page_id}", listing(), resume)
+
+    def fetch_pages(self, refs: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Fetch pages concurrently.
+
+        Pages that fail after all retries are logged and skipped.
+
+        Args:
+            refs: Dicts with 'id' and optionally the current 'version' of each page
+
+        Yields:
+            Dict containing page data, in completion order
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='crawler')
+        pending: Set[Future] = set()
+        try:
+            for ref in refs:
+                if len(pending) >= self.max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._results(done)
+                pending.add(executor.submit(self._fetch, str(ref['id']), ref.get('version')))
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._results(done)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def paginate(self, list_batch: Callable[[int], List[Dict]]) -> Iterator[Dict]:
+        """
+        Page through a listing, retrying each batch on rate limits and transient errors.
+        
+        Args:
+            list_batch: Callable taking a start offset and returning one batch,
+                or an empty list once past the end
+
+        Yields:
+            Each item of each batch
+        """
+        start = 0
+        while True:
+            batch = self._call(list_batch, start)
+            if not batch:
+                return
+            yield from batch
+            start += len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        """Get counters for pages listed, fetched, skipped and failed."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _crawl(self, name: str, listing: Iterator[Dict], resume: bool) -> Iterator[Dict]:
+        checkpoint = CrawlCheckpoint(self.checkpoint_dir / f"{re.sub(r'[^A-Za-z0-9_-]', '_', name)}.json")
+        if not resume:
+            checkpoint.clear()
+        elif checkpoint.completed:
+            logger.info(f"Resuming crawl {name}, {len(checkpoint.completed)} pages already done")
+
+        def remaining() -> Iterator[Dict]:
+            for ref in listing:
+                self._count('listed')
+                if str(ref['id']) in checkpoint.completed:
+                    self._count('skipped')
+                    continue
+                yield ref
+
+        failed_before = self.stats()['failed']
+        finished = False
+        try:
+            for page in self.fetch_pages(remaining()):
+                yield page
+                # Only checkpoint once the caller has asked for the next page,
+                # i.e. after it finished processing this one
+                checkpoint.add(str(page['id']))
+            finished = True
+        finally:
+            if finished and self.stats()['failed'] == failed_before:
+                logger.info(f"Finished crawl {name}: {self.stats()}")
+                checkpoint.clear()
+            else:
+                checkpoint.flush()
+
+    def _fetch(self, page_id: str, version: Optional[int]) -> Optional[Dict]:
+        try:
+            return self._call(
+                self.confluence_service.fetch_page, page_id, version=version, allow_stale=False
+            )
+        except Exception as e:
+            logger.error(f"Giving up on page {page_id}: {str(e)}")
+            self._count('failed')
+            return None
+
+    def _results(self, futures: Iterable[Future]) -> Iterator[Dict]:
+        for future in futures:
+            page = future.result()
+            if page is not None:
+                self._count('fetched')
+                yield page
+
+    def _call(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Call func, backing off on transient errors; 429s are retried by the session's rate limiter."""
+        for attempt in range(self.max_retries):
+            try:
+                with request_priority(BACKGROUND):
+                    return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                backoff = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+                logger.warning(f"Request failed (attempt {attempt + 1}/{self.max_retries}): {str(e)}")
+                time.sleep(backoff)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    Persistent embedding store keyed by a hash of the model name and the input text.
+
+    Vectors are stored as float32 rows in a flat binary file that is read
+    through a memory map; a sqlite index maps each key to its row and tracks
+    when it was last used. When the cache holds more than max_rows vectors, the
+    least recently used ones are evicted and their rows reused.
+    """
+
+    _shared: Dict[str, 'EmbeddingCache'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str, model: str, max_rows: int = 1_000_000):
+        """
+        Open (or create) the cache for a model.
+
+        Args:
+            cache_dir: Directory the index and vector files are written to
+            model: Embedding model name; each model gets its own files
+            max_rows: Maximum number of vectors kept
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        self.max_rows = max_rows
+
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', model)
+        self.vectors_path = self.cache_dir / f"{name}.f32"
+        self.vectors_path.touch(exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.cache_dir / f"{name}.sqlite"), check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        self.dim: Optional[int] = int(meta['dim']) if 'dim' in meta else None
+        self._rows = int(meta.get('rows', 0))
+
+        self._vectors: Optional[np.memmap] = None
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    @classmethod
+    def shared(cls, cache_dir: str, model: str, **kwargs: Any) -> 'EmbeddingCache':
+        """
+        Return the process-wide cache for a directory and model, creating it on first use.
+
+        Args:
+            cache_dir: Directory the index and vector files are written to
+            model: Embedding model name
+            **kwargs: Passed to the constructor when the cache is created
+
+        Returns:
+            EmbeddingCache: The shared cache instance
+        """
+        key = f"{os.path.abspath(cache_dir)}:{model}"
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(cache_dir, model, **kwargs)
+            return cls._shared[key]
+
+    def key(self, text: str) -> bytes:
+        """Hash the model name and text into a cache key."""
+        return hashlib.blake2b(f"{self.model}\0{text}".encode('utf-8'), digest_size=16).digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up the embeddings of several texts.
+
+        Args:
+            texts: Input texts
+
+        Returns:
+            List of float32 vectors in input order, None where not cached
+        """
+        keys = [self.key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        with self._lock:
+            rows: Dict[bytes, int] = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows.update(self._db.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+
+            if rows:
+                vectors = self._map()
+                for index, key in enumerate(keys):
+                    if key in rows:
+                        results[index] = np.array(vectors[rows[key]])
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in rows])
+                self._db.commit()
+
+            hits = sum(result is not None for result in results)
+            self._stats['hits'] += hits
+            self._stats['misses'] += len(texts) - hits
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Store the embeddings of several texts.
+
+        Args:
+            texts: Input texts
+            vectors: Their embeddings, in the same order
+        """
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {matrix.shape[1]}")
+
+            now = time.time()
+            entries = []
+            unique = {self.key(text): vector for text, vector in zip(texts, matrix)}
+            with open(self.vectors_path, 'r+b') as f:
+                for key, vector in unique.items():
+                    existing = self._db.execute("SELECT row FROM entries WHERE key = ?", (key,)).fetchone()
+                    row = existing[0] if existing else self._allocate_row()
+                    f.seek(row * self.dim * 4)
+                    f.write(vector.tobytes())
+                    entries.append((key, row, now))
+
+            self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", entries)
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('rows', ?)", (str(self._rows),))
+            self._db.commit()
+            self._stats['writes'] += len(entries)
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters and current size.
+
+        Returns:
+            Dict of counters plus 'entries', 'bytes' and 'hit_rate'
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            stats['bytes'] = self._rows * (self.dim or 0) * 4
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _allocate_row(self) -> int:
+        free = self._db.execute("SELECT row FROM free_rows LIMIT 1").fetchone()
+        if free:
+            self._db.execute("DELETE FROM free_rows WHERE row = ?", free)
+            return free[0]
+        self._rows += 1
+        return self._rows - 1
+
+    def _map(self) -> np.memmap:
+        """Memory-map the vector file, remapping when it has grown."""
+        if self._vectors is None or self._vectors.shape[0] < self._rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self._rows, self.dim))
+        return self._vectors
+
+    def _evict(self) -> None:
+        """Drop least recently used vectors until at most max_rows remain."""
+        count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = count - self.max_rows
+        if excess <= 0:
+            return
+
+        evicted = self._db.execute(
+            "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (excess,)
+        ).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+        self._db.executemany("INSERT OR IGNORE INTO free_rows VALUES (?)", [(row,) for _, row in evicted])
+        self._db.commit()
+        self._stats['evictions'] += len(evicted)
+        logger.info(f"Evicted {len(evicted)} embeddings from the {self.model} cache")
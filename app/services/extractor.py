@@ -0,0 +1,388 @@
+import logging
+import re
+from html.entities import name2codepoint
+from typing import Dict, List, Optional
+
+from lxml import etree, html as lxml_html
+
+logger = logging.getLogger(__name__)
+
+# Bump when the extracted text changes so cached pages are rebuilt
+CONTENT_FORMAT_VERSION = 2
+
+_NAMESPACES = {
+    'http://atlassian.com/content': 'ac',
+    'http://atlassian.com/resource/identifier': 'ri',
+    'http://atlassian.com/template': 'at',
+}
+
+_WRAPPER_START = (
+    '<storage xmlns:ac="http://atlassian.com/content" '
+    'xmlns:ri="http://atlassian.com/resource/identifier" '
+    'xmlns:at="http://atlassian.com/template">'
+)
+_WRAPPER_END = '</storage>'
+
+_XML_ENTITIES = {'amp', 'lt', 'gt', 'quot', 'apos'}
+_ENTITY_RE = re.compile(r'&([A-Za-z][A-Za-z0-9]*);')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_HEADINGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+_BLOCKS = {
+    'p', 'div', 'section', 'article', 'header', 'footer', 'blockquote', 'hr',
+    'dl', 'dt', 'dd', 'figure', 'figcaption', 'ac:layout', 'ac:layout-section',
+    'ac:layout-cell', 'ac:rich-text-body',
+}
+_SKIPPED = {'script', 'style', 'noscript', 'ac:placeholder', 'ac:image', 'ac:emoticon', 'ac:task-id'}
+
+# Macros whose body is rendered as a quoted callout
+_CALLOUT_MACROS = {'info': 'Info', 'note': 'Note', 'warning': 'Warning', 'tip': 'Tip', 'panel': None}
+# Macros that only generate navigation or dynamic content
+_SKIPPED_MACROS = {
+    'toc', 'children', 'pagetree', 'recently-updated', 'anchor', 'attachments',
+    'contentbylabel', 'livesearch', 'create-from-template', 'gallery', 'view-file',
+}
+_CODE_MACROS = {'code', 'noformat'}
+# Macros rendered inline, inside the surrounding paragraph
+_INLINE_MACROS = {'jira', 'status', 'anchor'}
+
+# Formatting tags that need no handling beyond their text
+_PASSTHROUGH = {'strong', 'b', 'em', 'i', 'u', 's', 'span', 'a', 'sub', 'sup', 'small', 'tbody', 'thead', 'colgroup', 'col'}
+
+# Parser tag -> normalised name ('ac:structured-macro', 'p', ...)
+_TAG_NAMES: Dict[str, str] = {}
+
+def _replace_entity(match: 're.Match') -> str:
+    name = match.group(1)
+    if name in _XML_ENTITIES or name not in name2codepoint:
+        return match.group(0)
+    return f"&#{name2codepoint[name]};"
+
+class _MarkdownTarget:
+    """
+    lxml parser target that turns Confluence storage format into lightweight markdown.
+
+    The parser calls start/end/data as it reads, so no element tree is built.
+    Headings become '#' lines (section boundaries), lists keep their nesting,
+    tables become pipe tables, code macros become fenced blocks and callout
+    macros (info, note, warning, tip, panel) become block quotes.
+    """
+
+    def __init__(self):
+        self.blocks: List[str] = []
+        self.inline: List[str] = []
+        self.skip_depth = 0
+        self.pre_depth = 0
+        self.quote_depth = 0
+        self.heading: Optional[int] = None
+        self.lists: List[List] = []  # [ordered, counter]
+        self.item_prefix: Optional[str] = None
+        self.tables: List[Dict] = []
+        self.macros: List[Dict] = []
+        self.capture: Optional[List[str]] = None
+        self.links: List[Dict] = []
+        self.last_tight = False
+
+    @staticmethod
+    def _name(tag: str) -> str:
+        name = _TAG_NAMES.get(tag)
+        if name is None:
+            if tag[:1] == '{':
+                namespace, _, local = tag[1:].partition('}')
+                prefix = _NAMESPACES.get(namespace)
+                name = f"{prefix}:{local}" if prefix else local
+            else:
+                name = tag.lower()
+            _TAG_NAMES[tag] = name
+        return name
+
+    @staticmethod
+    def _attr(attrib: Dict, name: str) -> Optional[str]:
+        prefix, _, local = name.partition(':')
+        for namespace, ns_prefix in _NAMESPACES.items():
+            if ns_prefix == prefix:
+                return attrib.get(f"{{{namespace}}}{local}")
+        return attrib.get(name)
+
+    # Output helpers
+
+    def _flush(self) -> None:
+        """End the current paragraph, list item or heading."""
+        if not self.inline:
+            return
+        if self.tables:
+            cell = self.tables[-1]['cell']
+            if cell is not None and self.inline:
+                cell.append(''.join(self.inline))
+                self.inline = []
+            return
+
+        text = _WHITESPACE_RE.sub(' ', ''.join(self.inline)).strip()
+        self.inline = []
+        if not text:
+            return
+
+        if self.heading:
+            text = f"{'#' * self.heading} {text}"
+        elif self.lists:
+            indent = '  ' * (len(self.lists) - 1)
+            prefix = self.item_prefix or '  '
+            self.item_prefix = None
+            text = f"{indent}{prefix}{text}"
+        self._emit(text, tight=bool(self.lists) and not self.heading)
+
+    def _emit(self, text: str, tight: bool = False) -> None:
+        separator = '\n' if tight and self.last_tight else '\n\n'
+        if self.quote_depth:
+            quote = '> ' * self.quote_depth
+            text = '\n'.join(quote + line if line else quote.rstrip() for line in text.split('\n'))
+            if separator == '\n\n' and self.blocks and self.blocks[-1].startswith(quote):
+                separator = f"\n{quote.rstrip()}\n"
+        if self.blocks:
+            self.blocks.append(separator)
+        self.blocks.append(text)
+        self.last_tight = tight
+
+    # Parser target interface
+
+    def start(self, tag: str, attrib: Dict) -> None:
+        name = self._name(tag)
+        if name in _PASSTHROUGH:
+            return
+
+        if self.skip_depth:
+            self.skip_depth += 1
+            return
+
+        if name in _SKIPPED:
+            self.skip_depth = 1
+            return
+
+        if name == 'ac:structured-macro' or name == 'ac:macro':
+            macro_name = (self._attr(attrib, 'ac:name') or '').lower()
+            if macro_name not in _INLINE_MACROS:
+                self._flush()
+            self.macros.append({'name': macro_name, 'params': {}, 'body': []})
+            if macro_name in _SKIPPED_MACROS:
+                self.skip_depth = 1
+            elif macro_name in _CALLOUT_MACROS:
+                self.quote_depth += 1
+            return
+
+        if name == 'ac:parameter':
+            if self.macros:
+                self.macros[-1]['params'][(self._attr(attrib, 'ac:name') or '').lower()] = param = []
+                self.capture = param
+            else:
+                self.skip_depth = 1
+            return
+
+        if name == 'ac:plain-text-body':
+            if self.macros:
+                self.capture = self.macros[-1]['body']
+            return
+
+        if name == 'ac:rich-text-body' and self.macros:
+            macro = self.macros[-1]
+            title = ''.join(macro['params'].get('title', [])).strip()
+            label = _CALLOUT_MACROS.get(macro['name'])
+            if title or label:
+                self._emit(f"**{title or label}**" if not self.quote_depth else f"**{title or label}:**")
+            return
+
+        if name in _HEADINGS:
+            self._flush()
+            self.heading = _HEADINGS[name]
+        elif name in ('ul', 'ol', 'ac:task-list'):
+            self._flush()
+            self.lists.append([name == 'ol', 0])
+        elif name in ('li', 'ac:task'):
+            self._flush()
+            if self.lists:
+                self.lists[-1][1] += 1
+                ordered, counter = self.lists[-1]
+                self.item_prefix = f"{counter}. " if ordered else '- '
+        elif name == 'ac:task-status':
+            self.capture = []
+            self.macros.append({'name': 'task-status', 'params': {}, 'body': self.capture})
+        elif name == 'table':
+            self._flush()
+            self.tables.append({'rows': [], 'row': None, 'cell': None, 'header': False})
+        elif name == 'tr' and self.tables:
+            self.tables[-1]['row'] = []
+        elif name in ('td', 'th') and self.tables:
+            table = self.tables[-1]
+            if table['row'] is None:
+                table['row'] = []
+            if name == 'th' and not table['rows']:
+                table['header'] = True
+            table['cell'] = []
+        elif name == 'pre':
+            self._flush()
+            self.pre_depth += 1
+        elif name == 'code' and not self.pre_depth:
+            self.inline.append('`')
+        elif name == 'br':
+            self.inline.append('\n' if self.pre_depth else ' ')
+        elif name == 'ac:link':
+            self.links.append({'title': None, 'body': False})
+        elif name in ('ac:link-body', 'ac:plain-text-link-body') and self.links:
+            self.links[-1]['body'] = True
+        elif name in ('ri:page', 'ri:attachment', 'ri:user') and self.links:
+            self.links[-1]['title'] = (
+                self._attr(attrib, 'ri:content-title') or self._attr(attrib, 'ri:filename')
+            )
+        elif name == 'time':
+            self.inline.append(attrib.get('datetime', ''))
+        elif name in _BLOCKS:
+            self._flush()
+
+    def end(self, tag: str) -> None:
+        name = self._name(tag)
+        if name in _PASSTHROUGH:
+            return
+
+        if self.skip_depth:
+            self.skip_depth -= 1
+            if self.skip_depth == 0 and name in ('ac:structured-macro', 'ac:macro') and self.macros:
+                self.macros.pop()
+            return
+
+        if name == 'ac:parameter' or name == 'ac:plain-text-body':
+            self.capture = None
+            return
+
+        if name == 'ac:link':
+            # Links without their own text show the title of the page they point to
+            link = self.links.pop() if self.links else None
+            if link and link['title'] and not link['body']:
+                self.inline.append(link['title'])
+            return
+
+        if name == 'ac:structured-macro' or name == 'ac:macro':
+            if not self.macros:
+                return
+            macro = self.macros.pop()
+            if macro['name'] in _CODE_MACROS:
+                language = ''.join(macro['params'].get('language', [])).strip()
+                body = ''.join(macro['body']).strip('\n')
+                self._emit(f"```{language}\n{body}\n```")
+            elif macro['name'] in _CALLOUT_MACROS:
+                self._flush()
+                self.quote_depth -= 1
+            elif macro['name'] == 'jira':
+                key = ''.join(macro['params'].get('key', [])).strip()
+                if key:
+                    self.inline.append(key)
+            elif macro['name'] == 'status':
+                title = ''.join(macro['params'].get('title', [])).strip()
+                if title:
+                    self.inline.append(f"[{title}]")
+            else:
+                self._flush()
+            return
+
+        if name == 'ac:task-status':
+            self.capture = None
+            status = ''.join(self.macros.pop()['body']).strip()
+            self.item_prefix = '- [x] ' if status == 'complete' else '- [ ] '
+            return
+
+        if name in _HEADINGS:
+            self._flush()
+            self.heading = None
+        elif name in ('li', 'ac:task'):
+            self._flush()
+            self.item_prefix = None
+        elif name in ('ul', 'ol', 'ac:task-list'):
+            self._flush()
+            if self.lists:
+                self.lists.pop()
+            if not self.lists:
+                self.last_tight = False
+        elif name in ('td', 'th') and self.tables:
+            table = self.tables[-1]
+            self._flush()
+            if table['cell'] is not None:
+                cell = _WHITESPACE_RE.sub(' ', ' '.join(table['cell'])).strip()
+                table['row'].append(cell.replace('|', '\\|'))
+            table['cell'] = None
+        elif name == 'tr' and self.tables:
+            table = self.tables[-1]
+            if table['row']:
+                table['rows'].append(table['row'])
+            table['row'] = None
+        elif name == 'table' and self.tables:
+            self._emit_table(self.tables.pop())
+        elif name == 'pre':
+            self.pre_depth -= 1
+            text = ''.join(self.inline).strip('\n')
+            self.inline = []
+            if text.strip():
+                self._emit(f"```\n{text}\n```")
+        elif name == 'code' and not self.pre_depth:
+            self.inline.append('`')
+        elif name in _BLOCKS:
+            self._flush()
+
+    def data(self, text: str) -> None:
+        if self.skip_depth:
+            return
+        if self.capture is not None:
+            self.capture.append(text)
+        else:
+            self.inline.append(text)
+
+    def comment(self, text: str) -> None:
+        pass
+
+    def close(self) -> str:
+        self._flush()
+        while self.tables:
+            self._emit_table(self.tables.pop())
+        return ''.join(self.blocks).strip()
+
+    def _emit_table(self, table: Dict) -> None:
+        rows = table['rows']
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        rows = [row + [''] * (width - len(row)) for row in rows]
+        lines = [f"| {' | '.join(rows[0])} |", f"|{' --- |' * width}"]
+        lines.extend(f"| {' | '.join(row)} |" for row in rows[1:])
+        if self.tables:
+            # Nested table: flatten into the enclosing cell
+            outer = self.tables[-1]
+            if outer['cell'] is not None:
+                outer['cell'].append(' '.join(' '.join(row) for row in rows))
+            return
+        self._emit('\n'.join(lines))
+
+def storage_to_markdown(storage: str) -> str:
+    """
+    Convert Confluence storage format (XHTML with ac:/ri: macros) into lightweight markdown.
+
+    Args:
+        storage: Page body in storage format
+
+    Returns:
+        Markdown text with headings, lists, tables, code blocks and callouts preserved
+    """
+    if not storage:
+        return ""
+
+    document = _WRAPPER_START + _ENTITY_RE.sub(_replace_entity, storage) + _WRAPPER_END
+    parser = etree.XMLParser(
+        target=_MarkdownTarget(),
+        recover=True,
+        resolve_entities=False,
+        huge_tree=True,
+        strip_cdata=False
+    )
+    try:
+        parser.feed(document)
+        return parser.close()
+    except etree.LxmlError as e:
+        logger.warning(f"Falling back to plain text extraction: {str(e)}")
+        text = lxml_html.fromstring(storage).text_content()
+        return _WHITESPACE_RE.sub(' ', text).strip()
@@ -0,0 +1,381 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .confluence_service import ConfluenceService
+from .page_store import PageHandle, PageStore
+from .rate_limiter import BACKGROUND, request_priority
+from .retrieval import Retriever
+from .sync import SpaceSync
+
+logger = logging.getLogger(__name__)
+
+# Job kinds
+PAGE = 'page'
+SPACE = 'space'
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+class IngestionJob:
+    """
+    Ingestion of one page or space, shared by every session that asked for it.
+
+    Progress counters are updated by the worker thread and read by the UI
+    without locking; each is a single attribute assignment.
+    """
+
+    def __init__(self, job_id: int, kind: str, target: str):
+        """
+        Initialize a queued job.
+
+        Args:
+            job_id: Number identifying the job within its runner
+            kind: PAGE or SPACE
+            target: Page ID or space key
+        """
+        self.id = job_id
+        self.kind = kind
+        self.target = target
+        self.status = QUEUED
+        self.stage = 'Waiting to start'
+        self.pages_done = 0
+        # Pages of a resumed space crawl that were already ingested by an earlier job
+        self.pages_skipped = 0
+        # Pages removed from the index because they left the space
+        self.pages_deleted = 0
+        self.pages_total: Optional[int] = 1 if kind == PAGE else None
+        self.chunks = 0
+        self.failed_pages = 0
+        self.error: Optional[str] = None
+        # Handle on the fetched page in the page store, for page jobs, until every requester has its own
+        self.page_handle: Optional[PageHandle] = None
+        self.pages_acquired = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Sessions waiting on the job; release() cancels it once none are left
+        self.requesters = 1
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """Identifies jobs for the same target."""
+        return (self.kind, self.target)
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job has stopped, successfully or not."""
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation was requested."""
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Stop the job at the next page boundary, for every session waiting on it."""
+        self._cancelled.set()
+
+    def add_requester(self) -> None:
+        """Record another session waiting on the job."""
+        with self._lock:
+            self.requesters += 1
+
+    def release(self) -> None:
+        """Withdraw one session's request; the job is cancelled when no session wants it any more."""
+        with self._lock:
+            self.requesters -= 1
+            unwanted = self.requesters <= 0
+        if unwanted and not self.finished:
+            self.cancel()
+
+    def progress(self) -> Optional[float]:
+        """Fraction of pages done, or None while the total is unknown."""
+        if self.status == DONE:
+            return 1.0
+        if not self.pages_total:
+            return None
+        return min(1.0, (self.pages_done + self.pages_skipped) / self.pages_total)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the job's state for display.
+
+        Returns:
+            Dict of the job's fields plus 'elapsed' seconds, 'progress',
+            'pages_per_second' and 'chunks_per_second'
+        """
+        if self.started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'target': self.target,
+            'status': self.status,
+            'stage': self.stage,
+            'pages_done': self.pages_done,
+            'pages_skipped': self.pages_skipped,
+            'pages_deleted': self.pages_deleted,
+            'pages_total': self.pages_total,
+            'chunks': self.chunks,
+            'failed_pages': self.failed_pages,
+            'error': self.error,
+            'requesters': self.requesters,
+            'elapsed': elapsed,
+            'progress': self.progress(),
+            'pages_per_second': self.pages_done / elapsed if elapsed else 0.0,
+            'chunks_per_second': self.chunks / elapsed if elapsed else 0.0,
+        }
+
+class IngestionRunner:
+    """
+    Runs page and space ingestion (fetch, clean, chunk, embed, index) on background threads.
+
+    Sessions submit jobs and poll their progress instead of blocking their
+    script thread. A job submitted for a page or space that already has a
+    job queued or running returns that job, so sessions opening the same
+    target share one ingestion. Page jobs run at normal priority, since a
+    user is waiting on them; space jobs run at background priority. The
+    first ingestion of a space crawls all of it; later ones sync only the
+    pages changed or deleted since (see SpaceSync). A cancelled crawl keeps
+    its checkpoint and resumes where it stopped the next time the space is
+    ingested.
+
+    The indexes are written to disk in batches: every save_every pages, and
+    once no page job is left running, so a burst of page loads does not
+    rewrite them after every page.
+
+    A page job puts the page it fetched in the page store and holds a
+    handle on it only until each waiting session has taken its own through
+    acquire_page(), or the job drops out of the finished-job history, so
+    finished jobs keep no pages alive.
+    """
+
+    def __init__(
+        self,
+        retriever: Retriever,
+        confluence_service: ConfluenceService,
+        max_jobs: int = 2,
+        history: int = 20,
+        save_every: int = 50,
+        page_store: Optional[PageStore] = None
+    ):
+        """
+        Initialize the runner.
+
+        Args:
+            retriever: Index the pages are added to
+            confluence_service: Service used to fetch and chunk pages
+            max_jobs: Jobs run at the same time; further jobs are queued
+            history: Finished jobs kept for display
+            save_every: Pages indexed between index saves while jobs keep running
+            page_store: Store fetched pages are handed to sessions through
+                (default: the shared store)
+        """
+        self.retriever = retriever
+        self.confluence_service = confluence_service
+        self.page_store = page_store or PageStore.shared()
+        self.save_every = save_every
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='ingest')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._active: Dict[Tuple[str, str], IngestionJob] = {}
+        self._finished: Deque[IngestionJob] = deque(maxlen=history)
+        # Pages indexed by page jobs since the indexes were last saved
+        self._unsaved_pages = 0
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'done': 0, 'failed': 0, 'cancelled': 0}
+
+    def submit(self, kind: str, target: str) -> IngestionJob:
+        """
+        Start ingesting a page or space, or join the job already doing it.
+
+        Args:
+            kind: PAGE or SPACE
+            target: Page ID or space key
+
+        Returns:
+            IngestionJob: The new or existing job
+        """
+        if kind not in (PAGE, SPACE):
+            raise ValueError(f"Unknown ingestion job kind: {kind}")
+        key = (kind, str(target))
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None and not job.cancelled:
+                job.add_requester()
+                self._stats['deduplicated'] += 1
+                return job
+            job = IngestionJob(next(self._ids), kind, str(target))
+            self._active[key] = job
+            self._stats['submitted'] += 1
+        self._executor.submit(self._run, job)
+        return job
+
+    def jobs(self) -> List[IngestionJob]:
+        """Active jobs followed by recently finished ones, newest first."""
+        with self._lock:
+            active = sorted(self._active.values(), key=lambda job: -job.id)
+            return active + list(reversed(self._finished))
+
+    def get(self, job_id: int) -> Optional[IngestionJob]:
+        """Look up a job that is active or recently finished."""
+        for job in self.jobs():
+            if job.id == job_id:
+                return job
+        return None
+
+    def acquire_page(self, job: IngestionJob) -> Optional[PageHandle]:
+        """
+        Get a session's own handle on the page a finished page job fetched.
+
+        Once every session waiting on the job has taken one, the job's own
+        handle is released.
+
+        Returns:
+            PageHandle, or None if the job fetched no page or it has since
+            been evicted from the page store
+        """
+        with self._lock:
+            job_handle = job.page_handle
+            if job_handle is None:
+                return None
+            handle = self.page_store.get(*job_handle.key)
+            job.pages_acquired += 1
+            if job.pages_acquired >= job.requesters:
+                job.page_handle = None
+                job_handle.release()
+        return handle
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get job counters.
+
+        Returns:
+            Dict of counters plus 'active' (queued or running jobs)
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats['active'] = len(self._active)
+        return stats
+
+    def _run(self, job: IngestionJob) -> None:
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            if job.kind == PAGE:
+                self._ingest_page(job)
+            else:
+                with request_priority(BACKGROUND):
+                    self._ingest_space(job)
+        except Exception as e:
+            logger.error(f"Ingestion of {job.kind} {job.target} failed: {str(e)}")
+            job.error = str(e)
+            self._finish(job, FAILED)
+            return
+        self._finish(job, CANCELLED if job.cancelled else DONE)
+
+    def _ingest_page(self, job: IngestionJob) -> None:
+        job.stage = 'Fetching page'
+        page = self.confluence_service.fetch_page(job.target)
+        if job.cancelled:
+            return
+        job.page_handle = self.page_store.acquire(page)
+        job.stage = 'Chunking and embedding'
+        try:
+            job.chunks = self.retriever.index_page(page)
+        except Exception as e:
+            # The page itself is usable; answers fall back to its full text
+            logger.warning(f"Could not index page {job.target}: {str(e)}")
+            job.error = f"Could not index page: {str(e)}"
+            job.failed_pages = 1
+        else:
+            if job.chunks:
+                with self._lock:
+                    self._unsaved_pages += 1
+        job.pages_done = 1
+
+    def _ingest_space(self, job: IngestionJob) -> None:
+        space_sync = SpaceSync(self.confluence_service)
+        if space_sync.has_synced(job.target):
+            # Only changes are fetched, and how many there are is not known up front
+            job.pages_total = None
+            job.stage = 'Syncing changed pages'
+        else:
+            job.stage = 'Counting pages'
+            try:
+                job.pages_total = self.confluence_service.count_space_pages(job.target)
+            except Exception as e:
+                logger.warning(f"Could not count pages in space {job.target}: {str(e)}")
+            job.stage = 'Fetching and indexing pages'
+
+        def on_change(event: Dict) -> bool:
+            job.pages_skipped = space_sync.crawler.stats()['skipped']
+            if 'error' in event:
+                job.failed_pages += 1
+                return not job.cancelled
+            if event['type'] == 'deleted':
+                job.pages_deleted += 1
+            else:
+                job.chunks += event['chunks']
+                job.pages_done += 1
+            if (job.pages_done + job.pages_deleted) % self.save_every == 0:
+                self._save()
+            return not job.cancelled
+
+        # Saves the indexes when it stops; a cancelled full crawl keeps its checkpoint
+        self.retriever.sync_space(space_sync, job.target, on_change=on_change)
+        stats = space_sync.crawler.stats()
+        job.pages_skipped = stats['skipped']
+        job.failed_pages += stats['failed']
+
+    def _finish(self, job: IngestionJob, status: str) -> None:
+        job.status = status
+        job.stage = status.capitalize()
+        job.finished_at = time.time()
+        with self._lock:
+            if status == CANCELLED:
+                # Nobody wants the page any more; do not hand it to a session as loaded
+                self._release_page(job)
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            if len(self._finished) == self._finished.maxlen:
+                # Sessions that have not taken the oldest job's page by now are gone
+                self._release_page(self._finished[0])
+            self._finished.append(job)
+            self._stats[status] += 1
+            pages_running = any(active.kind == PAGE for active in self._active.values())
+            save = self._unsaved_pages and (self._unsaved_pages >= self.save_every or not pages_running)
+        logger.info(f"Ingestion job {job.id} ({job.kind} {job.target}) {status}: {job.snapshot()}")
+        if save:
+            try:
+                self._save()
+            except Exception as e:
+                logger.error(f"Failed to save the indexes after job {job.id}: {str(e)}")
+
+    def _release_page(self, job: IngestionJob) -> None:
+        """Drop the job's handle on its page; call with the lock held."""
+        if job.page_handle is not None:
+            job.page_handle.release()
+            job.page_handle = None
+
+    def _save(self) -> None:
+        """Write the indexes to disk, covering every page indexed so far."""
+        with self._lock:
+            self._unsaved_pages = 0
+        self.retriever.save()
@@ -0,0 +1,570 @@
+import logging
+import math
+import os
+import re
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vector_index import top_k
+
+logger = logging.getLogger(__name__)
+
+# Words joined by -, _, ., : or / stay one token (error codes, ticket keys, config flags)
+_TOKEN_RE = re.compile(r'[A-Za-z0-9]+(?:[-_.:/][A-Za-z0-9]+)*')
+_PART_RE = re.compile(r'[A-Za-z0-9]+')
+
+_STOPWORDS = frozenset(
+    'a an and are as at be but by can do does for from has have how i if in is it its of on or '
+    'so that the their there these this to was what when where which who why will with you your'.split()
+)
+
+def tokenize(text: str, parts: bool = True) -> List[str]:
+    """
+    Split text into lowercase search terms.
+
+    Compound identifiers such as PROJ-123, ERR_TIMEOUT or db.pool.size are kept
+    whole and, with parts=True, also split into their parts, so both exact and
+    partial lookups match.
+
+    Args:
+        text: Text to tokenize
+        parts: Whether to add the parts of compound identifiers
+
+    Returns:
+        List of terms, with stopwords removed
+    """
+    terms = []
+    for match in _TOKEN_RE.finditer(text):
+        term = match.group().lower()
+        if term not in _STOPWORDS:
+            terms.append(term)
+        if parts and not term.isalnum():
+            terms.extend(part for part in _PART_RE.findall(term) if part not in _STOPWORDS)
+    return terms
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None
+) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked lists of IDs with reciprocal rank fusion.
+
+    Each list contributes weight / (k + rank) for every ID it contains, so
+    items ranked well by several retrievers rise to the top without having to
+    calibrate their raw scores against each other.
+
+    Args:
+        rankings: Ranked lists of IDs, best first
+        k: Damping constant; larger values flatten the rank curve
+        weights: Optional weight per list (default: 1.0 each)
+
+    Returns:
+        List of (id, fused score) pairs, best first
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class _ImpactList:
+    """The highest-impact postings of a common term, as of when they were selected."""
+
+    __slots__ = ('covered', 'removals', 'document_frequency', 'docs', 'frequencies', 'cutoff', 'average_length')
+
+    def __init__(
+        self,
+        covered: int,
+        removals: int,
+        document_frequency: int,
+        docs: np.ndarray,
+        frequencies: np.ndarray,
+        cutoff: float,
+        average_length: float
+    ):
+        # Postings examined, and removals seen, when the list was built
+        self.covered = covered
+        self.removals = removals
+        self.document_frequency = document_frequency
+        self.docs = docs
+        self.frequencies = frequencies
+        # Largest weight of a live posting left out of the list, at average_length
+        self.cutoff = cutoff
+        self.average_length = average_length
+
+class BM25Index:
+    """
+    In-memory inverted index scored with Okapi BM25.
+
+    Postings are compact typed arrays of document numbers and term
+    frequencies, one pair per term, appended to as documents arrive. Deleting a
+    document only marks it dead; document frequencies are counted over live
+    postings at query time, and the arrays are compacted once a quarter of the
+    documents are dead. Queries touch only the postings of their own terms.
+
+    Common terms have postings too long to score in well under a millisecond,
+    so a term with more than MAX_SCORED_POSTINGS postings keeps a cached list
+    of its highest-impact documents (those where its BM25 contribution is
+    largest) and a bound on its contribution to every other document. A query
+    scores the lists, rescores the best candidates over the full postings
+    and stops once no unscored document can beat the k-th best score
+    (MaxScore-style early termination); if the bounds cannot prove that, it
+    scores every posting. Results are therefore the same as an exhaustive
+    search. Set MAX_SCORED_POSTINGS to None to always search exhaustively.
+    """
+
+    # Compact once this fraction of documents has been deleted
+    COMPACT_RATIO = 0.25
+    # Impact list length for common terms; None disables early termination
+    MAX_SCORED_POSTINGS: Optional[int] = 2048
+    # Candidates rescored over the full postings in the first round of a pruned search
+    RESCORED = 256
+    # A pruned search that would rescore more candidates than this scores every posting instead
+    MAX_RESCORED = 2048
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Create an empty index.
+
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._terms: Dict[str, int] = {}
+        self._postings: List[Tuple[array, array]] = []
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_numbers: Dict[str, int] = {}
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._total_length = 0
+        # Bumped by every removal, so cached impact lists know when documents died
+        self._removals = 0
+        # Term number -> _ImpactList of its highest-impact live postings
+        self._impacts: Dict[int, _ImpactList] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_numbers)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_numbers
+
+    def add(self, doc_id: str, text: str) -> None:
+        """
+        Index a document, replacing any previous version with the same ID.
+
+        Args:
+            doc_id: Unique document ID
+            text: Document text
+        """
+        counts: Dict[str, int] = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+
+        with self._lock:
+            self.remove([doc_id])
+            number = len(self._doc_ids)
+            self._doc_ids.append(doc_id)
+            self._doc_numbers[doc_id] = number
+            if number >= len(self._lengths):
+                capacity = max(64, len(self._lengths) * 2)
+                self._lengths = np.resize(self._lengths, capacity)
+                self._alive = np.resize(self._alive, capacity)
+            length = sum(counts.values())
+            self._lengths[number] = length
+            self._alive[number] = True
+            self._total_length += length
+
+            for term, count in counts.items():
+                term_number = self._terms.get(term)
+                if term_number is None:
+                    term_number = self._terms[term] = len(self._postings)
+                    self._postings.append((array('i'), array('i')))
+                docs, frequencies = self._postings[term_number]
+                docs.append(number)
+                frequencies.append(count)
+
+    def remove(self, doc_ids: Iterable[str]) -> int:
+        """
+        Remove documents by ID; unknown IDs are ignored.
+
+        Args:
+            doc_ids: IDs to remove
+
+        Returns:
+            Number of documents removed
+        """
+        removed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                number = self._doc_numbers.pop(doc_id, None)
+                if number is None:
+                    continue
+                self._alive[number] = False
+                self._doc_ids[number] = None
+                self._total_length -= int(self._lengths[number])
+                removed += 1
+            self._removals += removed
+            dead = len(self._doc_ids) - len(self._doc_numbers)
+            if removed and dead > 64 and dead > self.COMPACT_RATIO * len(self._doc_ids):
+                self.compact()
+        return removed
+
+    def search(self, query: str, k: int = 10, candidates: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Find the documents that best match a query.
+
+        Args:
+            query: Query text
+            k: Number of results
+            candidates: Restrict the search to these IDs
+
+        Returns:
+            List of (id, BM25 score) pairs, best first; documents sharing no
+            term with the query are not returned
+        """
+        with self._lock:
+            if not self._doc_numbers:
+                return []
+            term_numbers = list(dict.fromkeys(self._query_terms(query)))
+            if not term_numbers:
+                return []
+
+            doc_count = len(self._doc_numbers)
+            average_length = self._total_length / doc_count or 1.0
+            hits = None
+            # Page-restricted searches score every posting, since the page's chunks may not be high-impact
+            if candidates is None and self.MAX_SCORED_POSTINGS and any(
+                len(self._postings[term_number][0]) > self.MAX_SCORED_POSTINGS for term_number in term_numbers
+            ):
+                hits = self._search_pruned(term_numbers, k, doc_count, average_length)
+            if hits is None:
+                docs, scores = self._score_all(term_numbers, doc_count, average_length)
+                if candidates is not None:
+                    allowed = np.fromiter(
+                        (self._doc_numbers[doc_id] for doc_id in candidates if doc_id in self._doc_numbers),
+                        dtype=np.intc
+                    )
+                    keep = np.isin(docs, allowed)
+                    docs, scores = docs[keep], scores[keep]
+                hits = docs, scores
+            docs, scores = hits
+            if len(scores) > k:
+                # Break ties at the cut-off by document number, so pruned and exhaustive searches agree
+                tied = np.flatnonzero(scores >= scores[top_k(scores, k)[-1]])
+                best = tied[np.lexsort((docs[tied], -scores[tied]))[:k]]
+            else:
+                best = np.lexsort((docs, -scores))
+            return [(self._doc_ids[docs[i]], float(scores[i])) for i in best]
+
+    def _idf(self, document_frequency: int, doc_count: int) -> float:
+        return math.log(1.0 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _term_weights(self, docs: np.ndarray, frequencies: np.ndarray, average_length: float) -> np.ndarray:
+        """BM25 contribution of one term to each of the given documents, before multiplying by its idf."""
+        frequencies = frequencies.astype(np.float32)
+        norms = self.k1 * (1.0 - self.b + self.b * self._lengths.take(docs) / average_length)
+        return frequencies * (self.k1 + 1.0) / (frequencies + norms)
+
+    def _score_all(self, term_numbers: List[int], doc_count: int, average_length: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Score every live posting of the query terms; returns matching document numbers and their scores."""
+        all_docs, all_scores = [], []
+        for term_number in term_numbers:
+            docs = np.frombuffer(self._postings[term_number][0], dtype=np.intc)
+            frequencies = np.frombuffer(self._postings[term_number][1], dtype=np.intc)
+            live = self._alive.take(docs)
+            docs = docs[live]
+            if not len(docs):
+                continue
+            all_docs.append(docs)
+            all_scores.append(self._idf(len(docs), doc_count) * self._term_weights(docs, frequencies[live], average_length))
+        if not all_docs:
+            return np.zeros(0, dtype=np.intc), np.zeros(0)
+        if len(all_docs) == 1:
+            return all_docs[0], all_scores[0]
+        docs, scores = np.concatenate(all_docs), np.concatenate(all_scores)
+        if len(docs) > len(self._doc_ids) // 8:
+            # Long postings: accumulating into a dense array beats sorting them
+            dense = np.bincount(docs, weights=scores, minlength=len(self._doc_ids))
+            docs = np.flatnonzero(dense).astype(np.intc)
+            return docs, dense[docs]
+        docs, inverse = np.unique(docs, return_inverse=True)
+        return docs, np.bincount(inverse, weights=scores)
+
+    def _search_pruned(
+        self,
+        term_numbers: List[int],
+        k: int,
+        doc_count: int,
+        average_length: float
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Find the exact top k over the impact lists of the query terms.
+
+        Every document in a term's list (or appended since it was built) is
+        a candidate with a known partial score and an upper bound: the
+        partial score plus the bounds of the terms whose lists it is not in.
+        Candidates are rescored over the full postings best bound first
+        until every remaining bound is below the k-th best exact score,
+        including the bound of documents in no list at all.
+
+        Returns:
+            (document numbers, exact scores) including the top k, or None if
+            the bounds cannot rule out documents outside the lists or too
+            many candidates would need rescoring
+        """
+        all_docs, all_scores, all_bounds = [], [], []
+        idfs: Dict[int, float] = {}
+        outside_bound = 0.0
+        for term_number in term_numbers:
+            document_frequency, docs, frequencies, bound = self._impact_postings(term_number, average_length)
+            if not document_frequency:
+                continue
+            idfs[term_number] = idf = self._idf(document_frequency, doc_count)
+            all_docs.append(docs)
+            all_scores.append(idf * self._term_weights(docs, frequencies, average_length))
+            all_bounds.append(np.full(len(docs), idf * bound))
+            outside_bound += idf * bound
+        if not all_docs:
+            return np.zeros(0, dtype=np.intc), np.zeros(0)
+        docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+        partial = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if not outside_bound:
+            # No list was cut: the partial scores are the exact scores
+            return docs, partial
+        # Bounds are summed in the same order as outside_bound, so a document in every list gets exactly 0
+        upper = partial + (outside_bound - np.bincount(inverse, weights=np.concatenate(all_bounds)))
+        if len(docs) >= k and outside_bound >= upper[top_k(upper, k)[-1]]:
+            # The k-th best score cannot exceed the bound of documents in no list
+            return None
+
+        unscored = np.ones(len(docs), dtype=bool)
+        scored = top_k(upper, max(4 * k, self.RESCORED))
+        unscored[scored] = False
+        scores = self._exact_scores(docs[scored], idfs, average_length)
+
+        def rescore(floor: float) -> Optional[float]:
+            # Score the remaining candidates bounded at or above floor; returns the new k-th best score,
+            # or None if there are so many that scoring every posting is cheaper
+            nonlocal scored, scores
+            extra = np.flatnonzero(unscored & (upper >= floor))
+            if len(scored) + len(extra) > self.MAX_RESCORED:
+                return None
+            if len(extra):
+                unscored[extra] = False
+                scored = np.concatenate([scored, extra])
+                scores = np.concatenate([scores, self._exact_scores(docs[extra], idfs, average_length)])
+            return scores[top_k(scores, k)[-1]] if len(scores) >= k else -math.inf
+
+        threshold = rescore(math.inf)
+        if outside_bound >= threshold:
+            # Only candidates bounded above the documents in no list can lift the k-th best past them
+            threshold = rescore(outside_bound)
+            if threshold is None or outside_bound >= threshold:
+                return None
+        # Candidates that could still beat or tie the k-th best
+        if rescore(threshold) is None:
+            return None
+        return docs[scored], scores
+
+    def _exact_scores(self, docs: np.ndarray, idfs: Dict[int, float], average_length: float) -> np.ndarray:
+        """BM25 scores of the given documents over the full postings of the query terms."""
+        order = np.argsort(docs)
+        docs = docs[order]
+        scores = np.zeros(len(docs))
+        for term_number, idf in idfs.items():
+            term_docs = np.frombuffer(self._postings[term_number][0], dtype=np.intc)
+            # Postings are in document order, so a binary search finds each document's entry
+            positions = np.minimum(np.searchsorted(term_docs, docs), len(term_docs) - 1)
+            found = term_docs.take(positions) == docs
+            frequencies = np.frombuffer(self._postings[term_number][1], dtype=np.intc).take(positions[found])
+            scores[found] += idf * self._term_weights(docs[found], frequencies, average_length)
+        result = np.empty(len(docs))
+        result[order] = scores
+        return result
+
+    def _impact_postings(self, term_number: int, average_length: float) -> Tuple[int, np.ndarray, np.ndarray, float]:
+        """
+        A term's postings for a pruned search.
+
+        Returns:
+            (live document frequency, document numbers, term frequencies,
+            bound): short postings are returned whole with a bound of 0;
+            long ones as their impact list plus any postings appended since
+            it was built, with a bound on the term's weight (see
+            _term_weights) in every other live document
+        """
+        docs = np.frombuffer(self._postings[term_number][0], dtype=np.intc)
+        frequencies = np.frombuffer(self._postings[term_number][1], dtype=np.intc)
+        if len(docs) <= self.MAX_SCORED_POSTINGS:
+            live = self._alive.take(docs)
+            docs = docs[live]
+            return len(docs), docs, frequencies[live], 0.0
+
+        impacts = self._impacts.get(term_number)
+        # Postings appended since the list was built are returned whole, up to a quarter of its length
+        if (impacts is None or impacts.removals != self._removals
+                or len(docs) - impacts.covered > self.MAX_SCORED_POSTINGS // 4):
+            impacts = self._impacts[term_number] = self._build_impacts(docs, frequencies, average_length)
+
+        # A higher average length lowers every document's length norm, raising weights by at most its ratio;
+        # the extra 1e-6 covers float32 rounding, so a posting that ties the cutoff stays below the bound
+        bound = impacts.cutoff * max(1.0, average_length / impacts.average_length) * (1.0 + 1e-6)
+        if impacts.covered == len(docs):
+            return impacts.document_frequency, impacts.docs, impacts.frequencies, bound
+        # No removals since the list was built, so the appended postings are all live
+        return (
+            impacts.document_frequency + len(docs) - impacts.covered,
+            np.concatenate([impacts.docs, docs[impacts.covered:]]),
+            np.concatenate([impacts.frequencies, frequencies[impacts.covered:]]),
+            bound
+        )
+
+    def _build_impacts(self, docs: np.ndarray, frequencies: np.ndarray, average_length: float) -> _ImpactList:
+        live = self._alive.take(docs)
+        live_docs, live_frequencies = docs[live], frequencies[live]
+        weights = self._term_weights(live_docs, live_frequencies, average_length)
+        size = self.MAX_SCORED_POSTINGS
+        if len(weights) <= size:
+            top, cutoff = np.arange(len(weights)), 0.0
+        else:
+            order = np.argpartition(-weights, size)
+            # The largest weight left out of the list bounds every other posting
+            top, cutoff = order[:size], float(weights[order[size]])
+        return _ImpactList(
+            len(docs), self._removals, len(live_docs), live_docs[top], live_frequencies[top], cutoff, average_length
+        )
+
+    def _query_terms(self, query: str) -> Iterable[int]:
+        """
+        Term numbers for a query.
+
+        A compound identifier is looked up whole when it is indexed; only
+        unknown ones fall back to their parts, which keeps exact lookups from
+        scanning the long postings of common parts like "err".
+        """
+        for term in tokenize(query, parts=False):
+            if term in self._terms:
+                yield self._terms[term]
+            elif not term.isalnum():
+                for part in _PART_RE.findall(term):
+                    if part in self._terms and part not in _STOPWORDS:
+                        yield self._terms[part]
+
+    def compact(self) -> None:
+        """Drop deleted documents from the postings and renumber the live ones."""
+        with self._lock:
+            size = len(self._doc_ids)
+            keep = np.flatnonzero(self._alive[:size])
+            remap = np.full(max(size, 1), -1, dtype=np.intc)
+            remap[keep] = np.arange(len(keep), dtype=np.intc)
+
+            terms: Dict[str, int] = {}
+            postings: List[Tuple[array, array]] = []
+            for term, term_number in self._terms.items():
+                docs = np.frombuffer(self._postings[term_number][0], dtype=np.intc)
+                frequencies = np.frombuffer(self._postings[term_number][1], dtype=np.intc)
+                live = self._alive[docs]
+                if not live.any():
+                    continue
+                terms[term] = len(postings)
+                postings.append((array('i', remap[docs[live]].tobytes()), array('i', frequencies[live].tobytes())))
+                del docs, frequencies
+
+            self._terms, self._postings = terms, postings
+            self._impacts = {}
+            self._doc_ids = [self._doc_ids[number] for number in keep]
+            self._doc_numbers = {doc_id: number for number, doc_id in enumerate(self._doc_ids)}
+            self._lengths = np.array(self._lengths[keep], dtype=np.int32)
+            self._alive = np.ones(len(keep), dtype=bool)
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """
+        Copy the (compacted) index into the arrays save() writes.
+
+        The copy is independent of the index, so it can be written to disk
+        while documents keep being added and searched.
+
+        Returns:
+            Dict of arrays to pass to save()
+        """
+        with self._lock:
+            if len(self._doc_ids) != len(self._doc_numbers):
+                self.compact()
+            terms = list(self._terms)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            for position, term in enumerate(terms):
+                offsets[position + 1] = offsets[position] + len(self._postings[self._terms[term]][0])
+            docs = np.empty(offsets[-1], dtype=np.intc)
+            frequencies = np.empty(offsets[-1], dtype=np.intc)
+            for position, term in enumerate(terms):
+                term_docs, term_frequencies = self._postings[self._terms[term]]
+                docs[offsets[position]:offsets[position + 1]] = np.frombuffer(term_docs, dtype=np.intc)
+                frequencies[offsets[position]:offsets[position + 1]] = np.frombuffer(term_frequencies, dtype=np.intc)
+            return {
+                'terms': np.array(terms, dtype=str),
+                'offsets': offsets,
+                'docs': docs,
+                'frequencies': frequencies,
+                'doc_ids': np.array(self._doc_ids, dtype=str),
+                'lengths': np.array(self._lengths[:len(self._doc_ids)]),
+                'params': np.array([self.k1, self.b])
+            }
+
+    def save(self, path: str, snapshot: Optional[Dict[str, np.ndarray]] = None) -> None:
+        """
+        Write the (compacted) index to a single .npz file.
+
+        Args:
+            path: Target file
+            snapshot: Arrays from snapshot() to write (default: a snapshot taken now)
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.stem}.tmp.npz")
+        np.savez(tmp_path, **snapshot)
+        os.replace(tmp_path, target)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        """
+        Load an index written by save().
+
+        Args:
+            path: File written by save()
+
+        Returns:
+            BM25Index: The loaded index, or an empty one if nothing was saved
+        """
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable lexical index {path}: {str(e)}")
+            return cls()
+
+        k1, b = arrays['params']
+        index = cls(k1=float(k1), b=float(b))
+        offsets, docs, frequencies = arrays['offsets'], arrays['docs'], arrays['frequencies']
+        for position, term in enumerate(arrays['terms'].tolist()):
+            start, end = offsets[position], offsets[position + 1]
+            index._terms[term] = position
+            index._postings.append((array('i', docs[start:end].tobytes()), array('i', frequencies[start:end].tobytes())))
+        index._doc_ids = arrays['doc_ids'].tolist()
+        index._doc_numbers = {doc_id: number for number, doc_id in enumerate(index._doc_ids)}
+        index._lengths = np.array(arrays['lengths'], dtype=np.int32)
+        index._alive = np.ones(len(index._doc_ids), dtype=bool)
+        index._total_length = int(index._lengths.sum())
+        return index
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+class LatencyRecorder:
+    """
+    Process-wide latency samples per metric name, kept in bounded ring buffers.
+
+    Used for user-facing timings such as time-to-first-token, so percentiles
+    reflect recent traffic rather than everything since startup.
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        """
+        Initialize an empty recorder.
+
+        Args:
+            max_samples: Samples kept per metric; older ones are dropped
+        """
+        self.max_samples = max_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add a sample to a metric."""
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.max_samples)
+                self._counts[name] = 0
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+
+    @contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        """Record how long the with-block takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def last(self, name: str) -> Optional[float]:
+        """Most recent sample of a metric, or None."""
+        with self._lock:
+            samples = self._samples.get(name)
+            return samples[-1] if samples else None
+
+    def summary(self, name: str) -> Optional[Dict[str, float]]:
+        """
+        Summarize a metric over its recent samples.
+
+        Returns:
+            Dict with 'count' (all time), 'last', 'mean', 'p50', 'p95' and 'p99'
+            in seconds, or None if nothing was recorded
+        """
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+            count = self._counts.get(name, 0)
+        if not samples:
+            return None
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            'count': count,
+            'last': samples[-1],
+            'mean': float(np.mean(samples)),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+        }
+
+    def summaries(self) -> Dict[str, Dict[str, float]]:
+        """Summaries of all recorded metrics."""
+        with self._lock:
+            names = list(self._samples)
+        return {name: self.summary(name) for name in names}
+
+metrics = LatencyRecorder()
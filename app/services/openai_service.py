@@ -1,8 +1,8 @@
-import os
 import logging
 import sys
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 # Add the app directory to the Python path
 app_dir = str(Path(__file__).parent.parent.absolute())
@@ -11,108 +11,278 @@ if app_dir not in sys.path:
 
 # Import third-party libraries
 try:
-    from openai import OpenAI, OpenAIError
-    import tiktoken
+    from openai import OpenAI, RateLimitError
 except ImportError as e:
     print(f"Error importing required packages: {e}")
     print("Please install the required packages with: pip install openai tiktoken")
     sys.exit(1)
 
+from config import OPENAI_CONFIG
+from .async_openai_service import RATE_LIMITED_MESSAGE, AsyncOpenAIService, run_sync
+from .metrics import metrics
+from .rate_limiter import retry_after_header, scheduler
+
 logger = logging.getLogger(__name__)
 
 class OpenAIService:
-    """Service for interacting with OpenAI's API."""
+    """
+    Service for interacting with OpenAI's API.
+    
+    A thin synchronous wrapper around AsyncOpenAIService for Streamlit code:
+    requests run on a shared background event loop, so they share its
+    concurrency limit and timeouts. Streaming uses a synchronous client so
+    tokens can be yielded straight to st.write_stream.
+    """
     
-    def __init__(self, model: str = "gpt-3.5-turbo"):
+    def __init__(
+        self,
+        model: str = "gpt-3.5-turbo",
+        http_client: Optional[Any] = None,
+        async_http_client: Optional[Any] = None
+    ):
         """
-        Initialize the OpenAI client with API key from environment variables.
+        Initialize the OpenAI clients with API key from environment variables.
         
         Args:
             model: The name of the OpenAI model to use (default: "gpt-3.5-turbo")
+            http_client: httpx client for streaming and health checks, e.g. one with a shared connection pool
+            async_http_client: httpx.AsyncClient for all other requests
             
         Raises:
             ValueError: If OPENAI_API_KEY environment variable is not set
             Exception: If client initialization fails
         """
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            error_msg = "OPENAI_API_KEY environment variable not set"
-            logger.error(error_msg)
-            raise ValueError(error_msg)
-        
+        self.async_service = AsyncOpenAIService(model=model, http_client=async_http_client)
+        self.api_key = self.async_service.api_key
         self.model = model
+        self.embedding_model = self.async_service.embedding_model
+        self.embedding_cache = self.async_service.embedding_cache
+        self.tokenizer = self.async_service.tokenizer
+        self.embedding_tokenizer = self.async_service.embedding_tokenizer
+        self.context_packer = self.async_service.context_packer
+        self.answer_cache = self.async_service.answer_cache
         self.max_tokens = 1000
         self.temperature = 0.3
         
         try:
             logger.info(f"Initializing OpenAI client with model: {self.model}")
-            self.client = OpenAI(api_key=self.api_key)
-            self.encoding = tiktoken.encoding_for_model(self.model)
+            # Retries are left to _create_stream so they go through the rate limiter
+            self.client = OpenAI(api_key=self.api_key, http_client=http_client, max_retries=0)
             logger.info("Successfully initialized OpenAI client")
         except Exception as e:
             error_msg = f"Failed to initialize OpenAI client: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg) from e
     
-    def get_embedding(self, text: str) -> Optional[List[float]]:
+    def check_connection(self) -> None:
+        """
+        Verify that the OpenAI API is reachable and the configured model is available.
+        
+        Raises:
+            Exception: If the API cannot be reached
+        """
+        try:
+            self.client.models.retrieve(self.model)
+        except Exception as e:
+            error_msg = f"Failed to connect to OpenAI: {str(e)}"
+            logger.error(error_msg)
+            raise Exception(error_msg) from e
+    
+    def get_embedding(self, text: str, timeout: Optional[float] = None) -> Optional[List[float]]:
         """
         Get embedding vector for the given text.
         
         Args:
             text: Input text to get embedding for
+            timeout: Seconds per request (default: OPENAI_TIMEOUT)
             
         Returns:
             List of floats representing the embedding, or None if failed
         """
-        try:
-            response = self.client.embeddings.create(
-                input=text,
-                model="text-embedding-3-small"
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            logger.error(f"Error getting embedding: {str(e)}")
-            return None
+        return run_sync(self.async_service.get_embedding(text, timeout=timeout))
+    
+    def get_embeddings(
+        self,
+        texts: List[str],
+        batch_tokens: int = OPENAI_CONFIG['EMBEDDING_BATCH_TOKENS'],
+        batch_size: int = OPENAI_CONFIG['EMBEDDING_BATCH_SIZE'],
+        max_workers: int = OPENAI_CONFIG['EMBEDDING_MAX_WORKERS'],
+        max_retries: int = 5,
+        use_cache: bool = True,
+        timeout: Optional[float] = None
+    ) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        """
+        Get embedding vectors for many texts using batched, concurrent requests.
+        
+        See AsyncOpenAIService.get_embeddings; max_workers is the number of
+        batches in flight at once.
+        
+        Returns:
+            Tuple of (embeddings in input order with None for failed items,
+            dict mapping the index of each failed item to its error message)
+        """
+        return run_sync(self.async_service.get_embeddings(
+            texts,
+            batch_tokens=batch_tokens,
+            batch_size=batch_size,
+            max_concurrency=max_workers,
+            max_retries=max_retries,
+            use_cache=use_cache,
+            timeout=timeout
+        ))
     
-    def generate_answer(self, context: str, question: str, model: str = "gpt-3.5-turbo") -> str:
+    def build_answer_messages(
+        self,
+        context: Union[str, List[Dict]],
+        question: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+        max_tokens: int = 500
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Build the chat messages for a question, packing the context into the token budget.
+        
+        See AsyncOpenAIService.build_answer_messages.
+        """
+        return self.async_service.build_answer_messages(context, question, history, model, max_tokens)
+    
+    def generate_answer(
+        self,
+        context: Union[str, List[Dict]],
+        question: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        page: Optional[Tuple[str, Any]] = None
+    ) -> str:
         """
         Generate an answer to a question based on the provided context.
         
         Args:
-            context: The context to base the answer on
+            context: Ranked chunk dicts (best first), or plain text; either is
+                packed into the model's token budget
             question: The question to answer
-            model: The OpenAI model to use
+            model: The OpenAI model to use (default: this service's model)
+            history: Earlier chat messages ({'role', 'content'}) to include
+            max_tokens: Maximum length of the answer in tokens
+            timeout: Seconds per request (default: OPENAI_TIMEOUT)
+            page: (page id, page version) the context comes from; answers are
+                then served from and stored in the answer cache
             
         Returns:
             Generated answer as a string
         """
+        return run_sync(self.async_service.generate_answer(
+            context, question, model=model, history=history, max_tokens=max_tokens, timeout=timeout, page=page
+        ))
+    
+    def stream_answer(
+        self,
+        context: Union[str, List[Dict]],
+        question: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        page: Optional[Tuple[str, Any]] = None
+    ) -> Iterator[str]:
+        """
+        Stream an answer to a question as it is generated.
+        
+        Takes the same arguments as generate_answer. Time to the first token is
+        recorded as the 'answer_ttft' metric and the full duration as
+        'answer_total'. Errors are not raised: before the first token the
+        generator yields the same apology as generate_answer, after it a note
+        that the answer was cut short, so callers always get displayable text.
+        A cached answer is yielded whole; complete streamed answers are cached.
+        
+        Args:
+            context: Ranked chunk dicts (best first), or plain text
+            question: The question to answer
+            model: The OpenAI model to use (default: this service's model)
+            history: Earlier chat messages ({'role', 'content'}) to include
+            max_tokens: Maximum length of the answer in tokens
+            timeout: Seconds to wait for the response (default: OPENAI_TIMEOUT)
+            page: (page id, page version) the context comes from, for the answer cache
+            
+        Yields:
+            Pieces of the answer text
+        """
+        start = time.perf_counter()
+        received = False
         try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": """You are a helpful assistant that answers questions based on the provided context. 
-                    If the answer cannot be found in the context, say \"I couldn't find the answer in the provided content.\"
-                    Be concise and to the point in your responses."""
-                },
-                {
-                    "role": "user",
-                    "content": f"""Context: {context}
-                    \n\nQuestion: {question}"""
-                }
-            ]
+            cached, embedding, cacheable = run_sync(
+                self.async_service.cached_answer(page, question, model, history)
+            )
+            if cached is not None:
+                metrics.record('answer_ttft', time.perf_counter() - start)
+                yield cached
+                return
+            
+            model = model or self.model
+            messages, _ = self.build_answer_messages(context, question, history, model, max_tokens)
             
-            response = self.client.chat.completions.create(
+            parts: List[str] = []
+            stream = self._create_stream(
                 model=model,
                 messages=messages,
                 temperature=0.3,
-                max_tokens=500
+                max_tokens=max_tokens,
+                stream=True,
+                timeout=timeout or self.async_service.timeout
             )
+            try:
+                for event in stream:
+                    if not event.choices or not event.choices[0].delta.content:
+                        continue
+                    if not received:
+                        received = True
+                        metrics.record('answer_ttft', time.perf_counter() - start)
+                    parts.append(event.choices[0].delta.content)
+                    yield event.choices[0].delta.content
+            finally:
+                # Release the connection even if the consumer stops early
+                stream.close()
+            metrics.record('answer_total', time.perf_counter() - start)
+            if cacheable and parts:
+                self.answer_cache.put(page[0], page[1], question, embedding, "".join(parts).strip())
             
-            return response.choices[0].message.content.strip()
+        except RateLimitError as e:
+            logger.error(f"Rate limited streaming answer: {str(e)}")
+            yield RATE_LIMITED_MESSAGE
             
         except Exception as e:
-            logger.error(f"Error generating answer: {str(e)}")
-            return "I'm sorry, I encountered an error while processing your request."
+            logger.error(f"Error streaming answer: {str(e)}")
+            if received:
+                yield "\n\n_The answer was interrupted by an error. Please try again._"
+            else:
+                yield "I'm sorry, I encountered an error while processing your request."
+    
+    def _create_stream(self, max_retries: int = 3, **kwargs: Any) -> Any:
+        """
+        Start a streamed chat completion once the rate limiter grants quota.
+        
+        A 429 pauses the chat endpoint for every caller and the request is
+        retried, up to max_retries attempts.
+
+        Raises:
+            ValueError: If max_retries is less than 1
+        """
+        if max_retries < 1:
+            raise ValueError(f"max_retries must be at least 1, got {max_retries}")
+        limiter = scheduler.endpoint('openai_chat')
+        tokens = self.context_packer.message_tokens(kwargs['messages']) + kwargs['max_tokens']
+        for attempt in range(max_retries):
+            limiter.acquire(tokens)
+            try:
+                stream = self.client.chat.completions.create(**kwargs)
+                limiter.success()
+                return stream
+            except RateLimitError as e:
+                limiter.backoff(retry_after_header(getattr(e.response, 'headers', None)))
+                if attempt == max_retries - 1:
+                    raise
     
     def count_tokens(self, text: str) -> int:
         """
@@ -124,38 +294,29 @@ class OpenAIService:
         Returns:
             Number of tokens
         """
-        return len(self.encoding.encode(text))
+        return self.tokenizer.count(text)
     
-    def summarize_text(self, text: str, max_tokens: int = 300) -> str:
+    def summarize_text(
+        self,
+        text: str,
+        max_tokens: int = 300,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> str:
         """
         Generate a summary of the given text.
         
+        Long texts are summarized map-reduce style, see MapReduceSummarizer.
+        
         Args:
             text: Text to summarize
             max_tokens: Maximum length of the summary in tokens
+            timeout: Seconds per request (default: OPENAI_TIMEOUT)
+            deadline: Seconds the whole summary may take (default: SUMMARY_DEADLINE_SECONDS)
             
         Returns:
             Generated summary
         """
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that summarizes text concisely while preserving key information."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Please summarize the following text concisely:\n\n{text}"
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=max_tokens
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            logger.error(f"Error summarizing text: {str(e)}")
-            return text[:500] + "..."  # Fallback to first 500 chars if summarization fails
+        return run_sync(self.async_service.summarize_text(
+            text, max_tokens=max_tokens, timeout=timeout, deadline=deadline
+        ))
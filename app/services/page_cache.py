@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class PageCache:
+    """
+    Persistent, size-bounded cache of processed Confluence pages.
+
+    Each page is stored as a single JSON file holding the page ID, the version
+    number it was built from and the processed page dict. Callers revalidate an
+    entry by comparing its version against a cheap version-only request; entries
+    that were checked recently can be served without touching Confluence at all.
+    """
+
+    _shared: Dict[str, 'PageCache'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 200 * 1024 * 1024,
+        revalidate_after: float = 30.0,
+        format_version: int = 1
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory the page files are written to
+            max_bytes: Upper bound on the total size of cached files
+            revalidate_after: Seconds an entry is trusted without a version check
+            format_version: Version of the processed page format; entries written
+                with a different format are treated as missing
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.format_version = format_version
+
+        self._lock = threading.RLock()
+        self._checked: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidations': 0,
+            'stale_hits': 0,
+            'writes': 0,
+            'evictions': 0,
+        }
+
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                self._sizes[path.stem] = path.stat().st_size
+            except OSError:
+                continue
+
+    @classmethod
+    def shared(cls, cache_dir: str, **kwargs: Any) -> 'PageCache':
+        """
+        Return the process-wide cache for a directory, creating it on first use.
+
+        Args:
+            cache_dir: Directory the page files are written to
+            **kwargs: Passed to the constructor when the cache is created
+
+        Returns:
+            PageCache: The shared cache instance
+        """
+        key = os.path.abspath(cache_dir)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(cache_dir, **kwargs)
+            return cls._shared[key]
+
+    @staticmethod
+    def _key(page_id: str) -> str:
+        """Turn a page ID into a safe file name."""
+        return re.sub(r'[^A-Za-z0-9_-]', '_', str(page_id))
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, page_id: str, version: Optional[int] = None) -> Optional[Dict]:
+        """
+        Read a cached entry.
+
+        Args:
+            page_id: The ID of the page
+            version: If given, only return the entry when it matches this version
+
+        Returns:
+            Dict with 'version' and 'page' keys, or None if not cached
+        """
+        key = self._key(page_id)
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)  # Access time drives eviction order
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry for page {page_id}: {str(e)}")
+            self.invalidate(page_id)
+            return None
+
+        if entry.get('format', 1) != self.format_version:
+            return None
+        if version is not None and entry.get('version') != version:
+            return None
+        return entry
+
+    def put(self, page_id: str, version: int, page: Dict) -> None:
+        """
+        Store a processed page.
+
+        Args:
+            page_id: The ID of the page
+            version: The Confluence version number the page was built from
+            page: The processed page dict
+        """
+        key = self._key(page_id)
+        path = self._path(key)
+        entry = {
+            'page_id': str(page_id),
+            'version': version,
+            'format': self.format_version,
+            'cached_at': time.time(),
+            'page': page,
+        }
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+            size = path.stat().st_size
+        except OSError as e:
+            logger.warning(f"Failed to cache page {page_id}: {str(e)}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._sizes[key] = size
+            self._checked[key] = time.time()
+            self._stats['writes'] += 1
+        self._evict()
+
+    def invalidate(self, page_id: str) -> None:
+        """Remove a page from the cache."""
+        key = self._key(page_id)
+        with self._lock:
+            self._sizes.pop(key, None)
+            self._checked.pop(key, None)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def is_fresh(self, page_id: str) -> bool:
+        """Whether the entry was validated recently enough to skip a version check."""
+        checked_at = self._checked.get(self._key(page_id))
+        return checked_at is not None and time.time() - checked_at < self.revalidate_after
+
+    def mark_checked(self, page_id: str) -> None:
+        """Record that the cached version was just confirmed to be current."""
+        with self._lock:
+            self._checked[self._key(page_id)] = time.time()
+
+    def record(self, event: str) -> None:
+        """Increment one of the cache counters."""
+        with self._lock:
+            self._stats[event] = self._stats.get(event, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters and current size.
+
+        Returns:
+            Dict of counters plus 'entries', 'bytes' and 'hit_rate'
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._sizes)
+            stats['bytes'] = sum(self._sizes.values())
+        lookups = stats['hits'] + stats['misses'] + stats['stale_hits']
+        stats['hit_rate'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            total = sum(self._sizes.values())
+            if total <= self.max_bytes:
+                return
+
+            def last_access(key: str) -> float:
+                try:
+                    return self._path(key).stat().st_mtime
+                except OSError:
+                    return 0.0
+
+            for key in sorted(self._sizes, key=last_access):
+                if total <= self.max_bytes:
+                    break
+                total -= self._sizes.pop(key)
+                self._checked.pop(key, None)
+                try:
+                    self._path(key).unlink()
+                except OSError:
+                    pass
+                self._stats['evictions'] += 1
@@ -0,0 +1,202 @@
+import logging
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Hashable, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PageKey = Tuple[str, Any]
+
+def _freeze(value: Any) -> Any:
+    """Turn lists and dicts into tuples and read-only mappings, recursively."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _size(value: Any) -> int:
+    """Approximate bytes held by a frozen page."""
+    size = sys.getsizeof(value)
+    if isinstance(value, Mapping):
+        size += sum(sys.getsizeof(key) + _size(item) for key, item in value.items())
+    elif isinstance(value, tuple):
+        size += sum(_size(item) for item in value)
+    return size
+
+class _Entry:
+    """A stored page and the number of handles open on it."""
+
+    __slots__ = ('page', 'size', 'refs')
+
+    def __init__(self, page: Mapping[str, Any], size: int):
+        self.page = page
+        self.size = size
+        self.refs = 0
+
+class PageHandle:
+    """
+    A session's reference to a page in a PageStore.
+
+    The page stays resident while any handle on it is open. A handle is
+    released by release() or, failing that, when it is garbage collected,
+    e.g. when Streamlit drops the session state of a closed tab.
+    """
+
+    __slots__ = ('key', 'page', '_finalizer', '__weakref__')
+
+    def __init__(self, store: 'PageStore', key: PageKey, page: Mapping[str, Any]):
+        self.key = key
+        self.page = page
+        self._finalizer = weakref.finalize(self, store._release, key)
+
+    @property
+    def released(self) -> bool:
+        """Whether the handle no longer holds its page."""
+        return not self._finalizer.alive
+
+    def release(self) -> None:
+        """Give up this handle's reference; calling it again does nothing."""
+        self._finalizer()
+
+class PageStore:
+    """
+    Process-wide store of loaded pages shared by all sessions.
+
+    Pages are keyed by (page id, version) and stored once, frozen into
+    read-only mappings so no session can change what the others see.
+    Sessions keep a PageHandle instead of their own copy, so a page open in
+    many tabs is held in memory once. Pages no session references stay
+    around for reuse until the store exceeds max_bytes, then the least
+    recently used of them are dropped. Referenced pages are never dropped,
+    so the store can exceed max_bytes while they are open.
+    """
+
+    _shared: Optional['PageStore'] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_bytes: int = 100 * 1024 * 1024):
+        """
+        Initialize an empty store.
+
+        Args:
+            max_bytes: Resident size above which unreferenced pages are evicted
+        """
+        self.max_bytes = max_bytes
+        # Reentrant because handles may be garbage collected, and released, while it is held
+        self._lock = threading.RLock()
+        self._entries: Dict[PageKey, _Entry] = {}
+        # Unreferenced entries, least recently released first
+        self._idle: 'OrderedDict[PageKey, None]' = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @classmethod
+    def shared(cls, **kwargs: Any) -> 'PageStore':
+        """
+        Return the process-wide store, creating it on first use.
+
+        Args:
+            **kwargs: Passed to the constructor when the store is created
+
+        Returns:
+            PageStore: The shared store instance
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(**kwargs)
+            return cls._shared
+
+    @staticmethod
+    def key(page_id: Hashable, version: Any) -> PageKey:
+        """Key a page is stored under."""
+        return (str(page_id), version)
+
+    def acquire(self, page: Dict[str, Any]) -> PageHandle:
+        """
+        Get a handle on a page, storing it if this version is not stored yet.
+
+        Args:
+            page: Page dict as returned by ConfluenceService.get_page; it is
+                not kept if the same version is already stored
+
+        Returns:
+            PageHandle: Handle whose page is the shared read-only copy
+        """
+        key = self.key(page['id'], page.get('version'))
+        with self._lock:
+            entry = self._entries.get(key)
+        # Freeze outside the lock; of concurrent acquires of a new page, the first to store its copy wins
+        frozen = _freeze(page) if entry is None else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if frozen is None:
+                    frozen = _freeze(page)
+                entry = self._entries[key] = _Entry(frozen, _size(frozen))
+                self._bytes += entry.size
+                self._stats['misses'] += 1
+            else:
+                self._stats['hits'] += 1
+            entry.refs += 1
+            self._idle.pop(key, None)
+            handle = PageHandle(self, key, entry.page)
+            self._evict()
+        return handle
+
+    def get(self, page_id: Hashable, version: Any) -> Optional[PageHandle]:
+        """
+        Get a handle on a stored page version without loading it.
+
+        Returns:
+            PageHandle, or None if that version is not stored
+        """
+        key = self.key(page_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._stats['hits'] += 1
+            entry.refs += 1
+            self._idle.pop(key, None)
+            return PageHandle(self, key, entry.page)
+
+    def _release(self, key: PageKey) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs == 0:
+                self._idle[key] = None
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used unreferenced pages until the store fits in max_bytes."""
+        while self._bytes > self.max_bytes and self._idle:
+            key, _ = self._idle.popitem(last=False)
+            self._bytes -= self._entries.pop(key).size
+            self._stats['evictions'] += 1
+            logger.debug(f"Evicted page {key} from the page store")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get store counters and resident size.
+
+        Returns:
+            Dict of counters plus 'pages', 'referenced' (pages with open
+            handles), 'handles', 'bytes', 'max_bytes' and 'hit_rate'
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats['pages'] = len(self._entries)
+            stats['referenced'] = len(self._entries) - len(self._idle)
+            stats['handles'] = sum(entry.refs for entry in self._entries.values())
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,371 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import CONFLUENCE_CONFIG, OPENAI_CONFIG
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority classes; lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# Seconds of quota a bucket can save up for bursts
+BURST_SECONDS = 10.0
+# Share of each bucket background requests may not use, kept free for interactive bursts
+BACKGROUND_RESERVE = 0.2
+# Bounds of the adaptive backoff after a 429 without Retry-After
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+_priority: contextvars.ContextVar = contextvars.ContextVar('request_priority', default=INTERACTIVE)
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """
+    Run the with-block's API requests at a priority.
+
+    The priority is a context variable, so it follows the code into coroutines
+    started with run_sync/run_background and into threads started with a
+    copied context.
+
+    Args:
+        priority: INTERACTIVE or BACKGROUND
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> int:
+    """Priority of requests made from the current context."""
+    return _priority.get()
+
+class TokenBucket:
+    """Refilling quota of some unit (requests or tokens) per minute."""
+
+    def __init__(self, per_minute: float):
+        """
+        Initialize a full bucket.
+
+        Args:
+            per_minute: Quota per minute; 0 means unlimited
+        """
+        self.per_minute = per_minute
+        self.capacity = per_minute / 60.0 * BURST_SECONDS
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float = 1.0) -> None:
+        """Add the quota accrued since the last refill, at scale times the nominal rate."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_minute / 60.0 * scale)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0, scale: float = 1.0) -> float:
+        """
+        Seconds until amount can be taken while leaving reserve (a share of capacity).
+
+        Amounts larger than the bucket are granted once it is full, leaving it
+        in debt, so oversized requests are slowed down rather than blocked.
+        """
+        if not self.per_minute or not amount:
+            return 0.0
+        needed = min(amount, self.capacity) + reserve * self.capacity
+        if needed > self.capacity:
+            needed = self.capacity
+        missing = needed - self.level
+        return max(0.0, missing / (self.per_minute / 60.0 * scale))
+
+    def take(self, amount: float) -> None:
+        if self.per_minute:
+            self.level -= amount
+
+class _Waiter:
+    __slots__ = ('priority', 'tokens', 'wake', 'enqueued', 'granted', 'cancelled')
+
+    def __init__(self, priority: int, tokens: float, wake: Callable[[], None]):
+        self.priority = priority
+        self.tokens = tokens
+        self.wake = wake
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+
+class EndpointLimiter:
+    """
+    Request and token budgets for one API endpoint, shared by every caller.
+
+    Callers queue for quota by priority, then in arrival order, so interactive
+    requests overtake queued background work, and background requests leave
+    a reserve of each bucket untouched so interactive bursts do not queue
+    behind them. On a 429 the endpoint pauses for the server's Retry-After
+    (or an adaptive, doubling backoff) and its rate is halved, recovering
+    gradually as requests succeed again.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        """
+        Initialize the limiter.
+
+        Args:
+            name: Endpoint name used in metrics and logs
+            requests_per_minute: Request budget (0 for unlimited)
+            tokens_per_minute: Token budget (0 for unlimited)
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._queue: List[Any] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_at = 0.0
+        self._paused_until = 0.0
+        self._backoff = MIN_BACKOFF
+        self._scale = 1.0
+        self._stats = {'granted': 0, 'throttled': 0, 'max_queue_depth': 0}
+
+    def acquire(self, tokens: float = 0, priority: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        """
+        Wait for quota for one request from a thread.
+
+        Args:
+            tokens: Tokens the request will use
+            priority: INTERACTIVE or BACKGROUND (default: the current context's)
+            timeout: Seconds to wait at most
+
+        Raises:
+            TimeoutError: If no quota was granted within timeout
+        """
+        event = threading.Event()
+        waiter = self._enqueue(tokens, priority, event.set)
+        if not event.wait(timeout):
+            if self._cancel(waiter):
+                raise TimeoutError(f"No {self.name} quota within {timeout}s")
+
+    async def acquire_async(self, tokens: float = 0, priority: Optional[int] = None) -> None:
+        """
+        Wait for quota for one request from a coroutine.
+
+        Args:
+            tokens: Tokens the request will use
+            priority: INTERACTIVE or BACKGROUND (default: the current context's)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(tokens, priority, wake)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self._cancel(waiter)
+            raise
+
+    def backoff(self, retry_after: Optional[float] = None) -> None:
+        """
+        Record a rate-limited (429) response and pause the endpoint.
+
+        Args:
+            retry_after: Seconds the server asked to wait, if it said
+        """
+        with self._lock:
+            delay = retry_after if retry_after else self._backoff
+            self._backoff = min(MAX_BACKOFF, self._backoff * 2)
+            self._scale = max(0.1, self._scale / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._stats['throttled'] += 1
+            logger.warning(f"Rate limited on {self.name}, pausing for {delay:.1f}s")
+            self._dispatch()
+
+    def success(self) -> None:
+        """Record a successful request, letting the rate recover after a backoff."""
+        with self._lock:
+            self._backoff = MIN_BACKOFF
+            self._scale = min(1.0, self._scale + 0.05)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue and throttling counters.
+
+        Returns:
+            Dict with 'granted', 'throttled' (429s), 'max_queue_depth',
+            'queue_depth' per priority name, 'rate_scale' and 'paused_for'
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for _, _, waiter in self._queue:
+                if not waiter.cancelled:
+                    depth[PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))] += 1
+            stats['queue_depth'] = depth
+            stats['rate_scale'] = self._scale
+            stats['paused_for'] = max(0.0, self._paused_until - time.monotonic())
+        return stats
+
+    def _enqueue(self, tokens: float, priority: Optional[int], wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(current_priority() if priority is None else priority, tokens, wake)
+        with self._lock:
+            heapq.heappush(self._queue, (waiter.priority, next(self._sequence), waiter))
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], len(self._queue))
+            self._dispatch()
+        return waiter
+
+    def _cancel(self, waiter: _Waiter) -> bool:
+        """Withdraw a waiter; returns False if it was granted quota in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            return True
+
+    def _dispatch(self) -> None:
+        """Grant quota to queued waiters in priority order while it lasts (lock held)."""
+        now = time.monotonic()
+        self.requests.refill(now, self._scale)
+        self.tokens.refill(now, self._scale)
+
+        wait = 0.0
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            reserve = BACKGROUND_RESERVE if waiter.priority > INTERACTIVE else 0.0
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, reserve, self._scale),
+                self.tokens.wait_time(waiter.tokens, reserve, self._scale)
+            )
+            if wait > 0:
+                break
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            waiter.granted = True
+            self._stats['granted'] += 1
+            metrics.record(
+                f"queue_wait:{self.name}:{PRIORITY_NAMES.get(waiter.priority, waiter.priority)}",
+                now - waiter.enqueued
+            )
+            waiter.wake()
+
+        if self._queue and wait > 0 and (self._timer is None or now + wait < self._timer_at):
+            # Wake up when the head of the queue can be served, sooner if it changed
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(wait, self._on_timer)
+            self._timer.daemon = True
+            self._timer_at = now + wait
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+class RequestScheduler:
+    """Process-wide set of endpoint limiters that all outbound API calls go through."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            limits: Maps endpoint name to (requests per minute, tokens per minute)
+        """
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointLimiter] = {
+            name: EndpointLimiter(name, requests_per_minute, tokens_per_minute)
+            for name, (requests_per_minute, tokens_per_minute) in (limits or {}).items()
+        }
+
+    def configure(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0) -> EndpointLimiter:
+        """
+        Set an endpoint's budgets, replacing any earlier limiter for it.
+
+        Returns:
+            EndpointLimiter: The endpoint's limiter
+        """
+        with self._lock:
+            self._endpoints[name] = EndpointLimiter(name, requests_per_minute, tokens_per_minute)
+            return self._endpoints[name]
+
+    def endpoint(self, name: str) -> EndpointLimiter:
+        """Get an endpoint's limiter, unlimited unless configured."""
+        with self._lock:
+            if name not in self._endpoints:
+                self._endpoints[name] = EndpointLimiter(name)
+            return self._endpoints[name]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Stats of every endpoint."""
+        with self._lock:
+            endpoints = dict(self._endpoints)
+        return {name: limiter.stats() for name, limiter in endpoints.items()}
+
+scheduler = RequestScheduler({
+    'confluence': (CONFLUENCE_CONFIG['REQUESTS_PER_MINUTE'], 0),
+    'openai_chat': (OPENAI_CONFIG['CHAT_REQUESTS_PER_MINUTE'], OPENAI_CONFIG['CHAT_TOKENS_PER_MINUTE']),
+    'openai_embeddings': (OPENAI_CONFIG['EMBEDDING_REQUESTS_PER_MINUTE'], OPENAI_CONFIG['EMBEDDING_TOKENS_PER_MINUTE']),
+})
+
+def retry_after_header(headers: Any) -> Optional[float]:
+    """Seconds to wait from Retry-After / retry-after-ms response headers, if present."""
+    if headers is None:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('Retry-After'):
+            return float(headers['Retry-After'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    requests transport adapter that sends every request through an endpoint limiter.
+
+    Responses with status 429 pause the endpoint and are retried, up to
+    max_retries times, once quota is granted again.
+    """
+
+    def __init__(self, limiter: EndpointLimiter, max_retries_on_429: int = 3, **kwargs: Any):
+        """
+        Initialize the adapter.
+
+        Args:
+            limiter: Limiter the requests are scheduled by
+            max_retries_on_429: Times a rate-limited request is retried
+            **kwargs: Passed to HTTPAdapter, e.g. pool sizes
+        """
+        super().__init__(**kwargs)
+        self.limiter = limiter
+        self.max_retries_on_429 = max_retries_on_429
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        for attempt in range(self.max_retries_on_429 + 1):
+            self.limiter.acquire()
+            response = super().send(request, **kwargs)
+            if response.status_code != 429:
+                self.limiter.success()
+                return response
+            self.limiter.backoff(retry_after_header(response.headers))
+            if attempt < self.max_retries_on_429:
+                response.close()
+        return response
@@ -0,0 +1,263 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+import requests
+
+from config import APP_CONFIG, CONFLUENCE_CONFIG, OPENAI_CONFIG
+from .async_openai_service import run_sync
+from .confluence_service import ConfluenceService
+from .ingestion import IngestionRunner
+from .openai_service import OpenAIService
+from .page_store import PageStore
+from .rate_limiter import RateLimitedAdapter, scheduler
+from .retrieval import Retriever
+
+logger = logging.getLogger(__name__)
+
+# Failed health checks are retried sooner than successful ones are repeated
+FAILED_HEALTH_CHECK_TTL = 30.0
+
+class ServiceRegistry:
+    """
+    Process-wide registry of shared service instances.
+
+    Services are created once per process and share keep-alive HTTP connection
+    pools, so Streamlit sessions reuse warm connections and loaded encodings
+    instead of building their own. Health checks run at most once per TTL.
+    """
+
+    def __init__(self, health_check_ttl: float = APP_CONFIG['HEALTH_CHECK_TTL_SECONDS']):
+        """
+        Initialize an empty registry.
+
+        Args:
+            health_check_ttl: Seconds a successful health check stays valid
+        """
+        self.health_check_ttl = health_check_ttl
+        self._lock = threading.RLock()
+        self._services: Dict[str, Any] = {}
+        self._health: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._health_locks: Dict[str, threading.Lock] = {}
+
+    def _get_or_create(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if name not in self._services:
+                logger.info(f"Creating shared service: {name}")
+                self._services[name] = factory()
+            return self._services[name]
+
+    def _check_health(self, name: str, check: Callable[[], None], force: bool = False) -> None:
+        """
+        Run a health check unless a recent result is cached.
+
+        Args:
+            name: Service name the result is cached under
+            check: Callable that raises if the service is unhealthy
+            force: Ignore any cached result
+
+        Raises:
+            Exception: If the (possibly cached) check failed
+        """
+        with self._lock:
+            health_lock = self._health_locks.setdefault(name, threading.Lock())
+
+        # Only one session runs the check; the others wait and reuse its result
+        with health_lock:
+            checked_at, error = self._health.get(name, (0.0, None))
+            ttl = FAILED_HEALTH_CHECK_TTL if error else self.health_check_ttl
+            if force or time.time() - checked_at >= ttl:
+                try:
+                    check()
+                    error = None
+                except Exception as e:
+                    error = str(e)
+                self._health[name] = (time.time(), error)
+
+        if error:
+            raise Exception(error)
+
+    @staticmethod
+    def _confluence_session() -> requests.Session:
+        """Create a requests session with a connection pool sized for concurrent sessions, sent through the rate limiter."""
+        pool_size = CONFLUENCE_CONFIG['POOL_SIZE']
+        session = requests.Session()
+        adapter = RateLimitedAdapter(
+            scheduler.endpoint('confluence'), pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @staticmethod
+    def _openai_http_client() -> httpx.Client:
+        """Create an httpx client with a connection pool sized for concurrent sessions."""
+        pool_size = OPENAI_CONFIG['POOL_SIZE']
+        return httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=OPENAI_CONFIG['TIMEOUT']
+        )
+
+    @staticmethod
+    def _openai_async_http_client() -> httpx.AsyncClient:
+        """Create an async httpx client with a connection pool sized for the concurrency limit."""
+        pool_size = max(OPENAI_CONFIG['POOL_SIZE'], OPENAI_CONFIG['MAX_CONCURRENCY'])
+        return httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=OPENAI_CONFIG['TIMEOUT']
+        )
+
+    def get_confluence_service(self, check_health: bool = True) -> ConfluenceService:
+        """
+        Get the shared Confluence service.
+
+        Args:
+            check_health: Whether to verify the connection (cached for the TTL)
+
+        Returns:
+            ConfluenceService: The shared service instance
+
+        Raises:
+            Exception: If the service cannot be created or is unhealthy
+        """
+        service = self._get_or_create(
+            'confluence',
+            lambda: ConfluenceService(session=self._confluence_session(), check_connection=False)
+        )
+        if check_health:
+            self._check_health('confluence', service.check_connection)
+        return service
+
+    def get_openai_service(self, model: Optional[str] = None, check_health: bool = True) -> OpenAIService:
+        """
+        Get the shared OpenAI service for a model.
+
+        Args:
+            model: The name of the OpenAI model (default: OPENAI_MODEL)
+            check_health: Whether to verify the connection (cached for the TTL)
+
+        Returns:
+            OpenAIService: The shared service instance
+
+        Raises:
+            Exception: If the service cannot be created or is unhealthy
+        """
+        model = model or OPENAI_CONFIG['MODEL']
+        name = f"openai:{model}"
+        with self._lock:
+            if 'openai_http_client' not in self._services:
+                self._services['openai_http_client'] = self._openai_http_client()
+            if 'openai_async_http_client' not in self._services:
+                self._services['openai_async_http_client'] = self._openai_async_http_client()
+            http_client = self._services['openai_http_client']
+            async_http_client = self._services['openai_async_http_client']
+        service = self._get_or_create(
+            name,
+            lambda: OpenAIService(model=model, http_client=http_client, async_http_client=async_http_client)
+        )
+        if check_health:
+            self._check_health(name, service.check_connection)
+        return service
+
+    def get_retriever(self) -> Retriever:
+        """
+        Get the shared retriever backed by the on-disk vector index.
+
+        Returns:
+            Retriever: The shared retriever instance
+
+        Raises:
+            Exception: If the underlying services cannot be created
+        """
+        def create() -> Retriever:
+            confluence_service = self.get_confluence_service(check_health=False)
+            retriever = Retriever(
+                openai_service=self.get_openai_service(check_health=False),
+                confluence_service=confluence_service
+            )
+            confluence_service.local_search = retriever.search_pages
+            return retriever
+
+        return self._get_or_create('retriever', create)
+
+    def get_ingestion_runner(self) -> IngestionRunner:
+        """
+        Get the shared runner for background page and space ingestion.
+
+        Returns:
+            IngestionRunner: The shared runner instance
+
+        Raises:
+            Exception: If the underlying services cannot be created
+        """
+        return self._get_or_create(
+            'ingestion_runner',
+            lambda: IngestionRunner(
+                retriever=self.get_retriever(),
+                confluence_service=self.get_confluence_service(check_health=False),
+                max_jobs=APP_CONFIG['INGEST_MAX_JOBS'],
+                page_store=self.get_page_store()
+            )
+        )
+
+    def get_page_store(self) -> PageStore:
+        """
+        Get the store of loaded pages shared by all sessions.
+
+        Returns:
+            PageStore: The shared store instance
+        """
+        return self._get_or_create(
+            'page_store',
+            lambda: PageStore.shared(max_bytes=APP_CONFIG['PAGE_STORE_MAX_MB'] * 1024 * 1024)
+        )
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the last health check result for each service.
+
+        Returns:
+            Dict mapping service name to 'healthy', 'checked_at' and 'error'
+        """
+        with self._lock:
+            return {
+                name: {'healthy': error is None, 'checked_at': checked_at, 'error': error}
+                for name, (checked_at, error) in self._health.items()
+            }
+
+    def reset(self) -> None:
+        """Drop all shared services and cached health checks."""
+        with self._lock:
+            http_client = self._services.get('openai_http_client')
+            if http_client is not None:
+                http_client.close()
+            async_http_client = self._services.get('openai_async_http_client')
+            if async_http_client is not None:
+                # Async clients belong to the background loop the services run on
+                run_sync(async_http_client.aclose())
+            self._services.clear()
+            self._health.clear()
+
+registry = ServiceRegistry()
+
+def get_confluence_service(check_health: bool = True) -> ConfluenceService:
+    """Get the process-wide Confluence service."""
+    return registry.get_confluence_service(check_health=check_health)
+
+def get_openai_service(model: Optional[str] = None, check_health: bool = True) -> OpenAIService:
+    """Get the process-wide OpenAI service."""
+    return registry.get_openai_service(model=model, check_health=check_health)
+
+def get_retriever() -> Retriever:
+    """Get the process-wide retriever."""
+    return registry.get_retriever()
+
+def get_page_store() -> PageStore:
+    """Get the process-wide page store."""
+    return registry.get_page_store()
+
+def get_ingestion_runner() -> IngestionRunner:
+    """Get the process-wide ingestion runner."""
+    return registry.get_ingestion_runner()
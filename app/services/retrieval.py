@@ -0,0 +1,376 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from config import APP_CONFIG
+from .confluence_service import ConfluenceService
+from .lexical_index import BM25Index, reciprocal_rank_fusion
+from .openai_service import OpenAIService
+from .rate_limiter import BACKGROUND, request_priority
+from .sync import SpaceSync
+from .vector_index import load_index
+
+logger = logging.getLogger(__name__)
+
+class ChunkStore:
+    """sqlite-backed store of chunk text and metadata, keyed by chunk ID."""
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: sqlite database file
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, page_id TEXT NOT NULL, data TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_page_id ON chunks (page_id);
+            CREATE TABLE IF NOT EXISTS pages (page_id TEXT PRIMARY KEY, version INTEGER);
+        """)
+
+    def page_version(self, page_id: str) -> Optional[int]:
+        """Version of a page whose chunks are completely indexed, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT version FROM pages WHERE page_id = ?", (str(page_id),)).fetchone()
+        return row[0] if row else None
+
+    def page_chunk_ids(self, page_id: str) -> List[str]:
+        """IDs of the stored chunks of a page."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT chunk_id FROM chunks WHERE page_id = ?", (str(page_id),)
+            )]
+
+    def replace_page(self, page_id: str, version: Optional[int], chunks: List[Dict]) -> None:
+        """
+        Replace all chunks of a page.
+
+        Args:
+            page_id: The ID of the page
+            version: Version the chunks were built from; None if incomplete
+            chunks: New chunks of the page
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE page_id = ?", (str(page_id),))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+                [(chunk['chunk_id'], str(page_id), json.dumps(chunk)) for chunk in chunks]
+            )
+            self._db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?)", (str(page_id), version))
+            self._db.commit()
+
+    def delete_page(self, page_id: str) -> None:
+        """Remove all chunks of a page."""
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE page_id = ?", (str(page_id),))
+            self._db.execute("DELETE FROM pages WHERE page_id = ?", (str(page_id),))
+            self._db.commit()
+
+    def get(self, chunk_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Look up chunks by ID."""
+        chunk_ids = list(chunk_ids)
+        found: Dict[str, Dict] = {}
+        with self._lock:
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                found.update(
+                    (chunk_id, json.loads(data)) for chunk_id, data in self._db.execute(
+                        f"SELECT chunk_id, data FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                    )
+                )
+        return found
+
+    def iter_chunks(self) -> Iterable[Dict]:
+        """Iterate over all stored chunks."""
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM chunks").fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def count(self) -> int:
+        """Number of stored chunks."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+class Retriever:
+    """
+    Indexes page chunks and answers questions with the top-k chunks.
+
+    Every chunk is embedded into a vector index and added to a BM25 lexical
+    index; searches run both and merge them with reciprocal rank fusion, so
+    exact identifiers (error codes, ticket keys, config flags) are found even
+    when embeddings miss them. The indexes and chunk store are persisted under
+    CACHE_DIR/index and the vectors are memory-mapped on load, so a restart
+    does not re-embed anything. VECTOR_INDEX selects exact ('flat') or
+    approximate ('ivf') vector search. Pages are re-indexed only when their
+    version changes.
+    """
+
+    def __init__(
+        self,
+        openai_service: OpenAIService,
+        confluence_service: ConfluenceService,
+        index_dir: Optional[str] = None,
+        top_k: int = APP_CONFIG['RETRIEVAL_TOP_K']
+    ):
+        """
+        Load (or create) the index.
+
+        Args:
+            openai_service: Service used to embed chunks and questions
+            confluence_service: Service used to chunk pages
+            index_dir: Directory for the index (default: CACHE_DIR/index)
+            top_k: Default number of chunks returned per question
+        """
+        self.openai_service = openai_service
+        self.confluence_service = confluence_service
+        self.index_dir = Path(index_dir or os.path.join(APP_CONFIG['CACHE_DIR'], 'index'))
+        self.top_k = top_k
+
+        self._lock = threading.RLock()
+        # Serializes saves, so an older snapshot never overwrites a newer one
+        self._save_lock = threading.Lock()
+        kind = APP_CONFIG['VECTOR_INDEX']
+        options = {'nprobe': APP_CONFIG['IVF_NPROBE']} if kind == 'ivf' else {}
+        self.index = load_index(str(self.index_dir / 'vectors'), kind, **options)
+        self.store = ChunkStore(str(self.index_dir / 'chunks.sqlite'))
+        self.lexical = BM25Index.load(str(self.index_dir / 'lexical.npz'))
+        if len(self.lexical) != self.store.count():
+            self._rebuild_lexical()
+
+    def is_indexed(self, page: Dict) -> bool:
+        """Whether the current version of a page is completely indexed."""
+        return self.store.page_version(page['id']) == page['version']
+
+    def index_page(self, page: Dict, save: bool = False) -> int:
+        """
+        Chunk, embed and index a page unless its current version is already indexed.
+
+        Args:
+            page: Page dict as returned by ConfluenceService.get_page
+            save: Whether to write the indexes to disk afterwards; callers
+                indexing many pages save once per batch instead
+
+        Returns:
+            Number of chunks indexed (0 if the page was already up to date)
+        """
+        if self.is_indexed(page):
+            return 0
+
+        chunks = self.confluence_service.chunk_page(page)
+        embeddings, errors = self.openai_service.get_embeddings([self._embedding_text(chunk) for chunk in chunks])
+        embedded = [(chunk['chunk_id'], embedding) for chunk, embedding in zip(chunks, embeddings) if embedding is not None]
+        if errors:
+            logger.warning(f"Failed to embed {len(errors)} of {len(chunks)} chunks of page {page['id']}")
+
+        with self._lock:
+            old_ids = self.store.page_chunk_ids(page['id'])
+            self.index.remove(old_ids)
+            self.index.add([chunk_id for chunk_id, _ in embedded], [embedding for _, embedding in embedded])
+            self.lexical.remove(old_ids)
+            for chunk in chunks:
+                self.lexical.add(chunk['chunk_id'], self._lexical_text(chunk))
+            # Leave the version unset when chunks are missing so the page is retried
+            self.store.replace_page(page['id'], None if errors else page['version'], chunks)
+        if save:
+            self.save()
+        return len(embedded)
+
+    def remove_page(self, page_id: str, save: bool = False) -> None:
+        """
+        Remove all chunks of a page from the index.
+
+        Args:
+            page_id: The ID of the page
+            save: Whether to write the indexes to disk afterwards
+        """
+        with self._lock:
+            chunk_ids = self.store.page_chunk_ids(page_id)
+            self.index.remove(chunk_ids)
+            self.lexical.remove(chunk_ids)
+            self.store.delete_page(page_id)
+        if save:
+            self.save()
+
+    def sync_space(
+        self,
+        space_sync: SpaceSync,
+        space_key: str,
+        on_change: Optional[Callable[[Dict], bool]] = None
+    ) -> Dict[str, int]:
+        """
+        Bring the indexes up to date with a space using incremental sync.
+
+        Runs at background priority, so chat requests are served first. A
+        page that fails to index is logged and counted, and the sync goes on
+        with the rest; it is indexed again once it next changes.
+
+        Args:
+            space_sync: Sync helper tracking the space's watermark
+            space_key: The key of the space
+            on_change: Called after each change with the sync event plus
+                'chunks' indexed, or 'error' if indexing failed; returning
+                False stops the sync, which is then repeated next time
+
+        Returns:
+            Dict with the number of 'updated', 'deleted' and 'failed' pages
+        """
+        counts = {'updated': 0, 'deleted': 0, 'failed': 0}
+        changes = space_sync.sync_space(space_key)
+        try:
+            with request_priority(BACKGROUND):
+                for event in changes:
+                    try:
+                        if event['type'] == 'deleted':
+                            self.remove_page(event['page_id'], save=False)
+                            event['chunks'] = 0
+                        else:
+                            event['chunks'] = self.index_page(event['page'], save=False)
+                        counts[event['type']] += 1
+                    except Exception as e:
+                        logger.error(f"Failed to sync page {event['page_id']} of space {space_key}: {str(e)}")
+                        event['error'] = str(e)
+                        counts['failed'] += 1
+                    if on_change is not None and on_change(event) is False:
+                        break
+        finally:
+            # Stopping early leaves the sync state as it was, so the changes are picked up again
+            changes.close()
+            self.save()
+        return counts
+
+    def search(self, question: str, k: Optional[int] = None, page_id: Optional[str] = None) -> List[Dict]:
+        """
+        Find the chunks most relevant to a question with hybrid vector and lexical search.
+
+        Args:
+            question: The user's question
+            k: Number of chunks to return (default: top_k)
+            page_id: Restrict the search to one page
+
+        Returns:
+            List of chunk dicts with an added fused 'score' plus 'vector_score'
+            and 'lexical_score' where available, best first. If the question
+            could not be embedded, only lexical matches are returned.
+        """
+        k = k or self.top_k
+        # Each retriever contributes a deeper list than k so fusion can reorder them
+        depth = max(4 * k, 20)
+        query = self.openai_service.get_embedding(question)
+
+        with self._lock:
+            candidates = self.store.page_chunk_ids(page_id) if page_id is not None else None
+            vector_hits = self.index.search(query, depth, candidates=candidates) if query is not None else []
+            lexical_hits = self.lexical.search(question, depth, candidates=candidates)
+        fused = reciprocal_rank_fusion([
+            [chunk_id for chunk_id, _ in vector_hits],
+            [chunk_id for chunk_id, _ in lexical_hits],
+        ])[:k]
+
+        vector_scores, lexical_scores = dict(vector_hits), dict(lexical_hits)
+        chunks = self.store.get(chunk_id for chunk_id, _ in fused)
+        results = []
+        for chunk_id, score in fused:
+            if chunk_id not in chunks:
+                continue
+            result = dict(chunks[chunk_id], score=score)
+            if chunk_id in vector_scores:
+                result['vector_score'] = vector_scores[chunk_id]
+            if chunk_id in lexical_scores:
+                result['lexical_score'] = lexical_scores[chunk_id]
+            results.append(result)
+        return results
+
+    def lexical_search(self, query: str, k: Optional[int] = None, page_id: Optional[str] = None) -> List[Dict]:
+        """
+        Find chunks matching a query with BM25 alone, without calling the embeddings API.
+
+        Args:
+            query: Search text
+            k: Number of chunks to return (default: top_k)
+            page_id: Restrict the search to one page
+
+        Returns:
+            List of chunk dicts with an added 'score', best first
+        """
+        with self._lock:
+            candidates = self.store.page_chunk_ids(page_id) if page_id is not None else None
+            hits = self.lexical.search(query, k or self.top_k, candidates=candidates)
+        chunks = self.store.get(chunk_id for chunk_id, _ in hits)
+        return [dict(chunks[chunk_id], score=score) for chunk_id, score in hits if chunk_id in chunks]
+
+    def search_pages(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Search indexed pages locally, in the same shape as ConfluenceService.search_pages.
+
+        Args:
+            query: Search text
+            limit: Maximum number of pages to return
+
+        Returns:
+            List of pages with 'id', 'title', 'space' and 'last_updated', best first
+        """
+        pages: Dict[str, Dict] = {}
+        for chunk in self.lexical_search(query, k=limit * 5):
+            if chunk['page_id'] in pages:
+                continue
+            pages[chunk['page_id']] = {
+                'id': chunk['page_id'],
+                'title': chunk['page_title'],
+                'space': chunk.get('page_space', 'Unknown'),
+                'last_updated': chunk.get('page_last_updated')
+            }
+            if len(pages) == limit:
+                break
+        return list(pages.values())
+
+    def save(self) -> None:
+        """
+        Write the vector and lexical indexes to disk.
+
+        The indexes are copied under the lock and written outside it, so
+        searches are not held up by the disk writes. Each file is written to
+        a temporary name and renamed over the old one.
+        """
+        with self._save_lock:
+            with self._lock:
+                vectors = self.index.snapshot()
+                lexical = self.lexical.snapshot()
+            self.index.save(str(self.index_dir / 'vectors'), vectors)
+            self.lexical.save(str(self.index_dir / 'lexical.npz'), lexical)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number of indexed vectors, lexical documents and stored chunks."""
+        return {
+            'vectors': len(self.index),
+            'lexical_documents': len(self.lexical),
+            'chunks': self.store.count(),
+            'index': self.index.kind
+        }
+
+    def _rebuild_lexical(self) -> None:
+        """Rebuild the lexical index from the chunk store, e.g. after an upgrade."""
+        logger.info("Rebuilding lexical index from the chunk store")
+        self.lexical = BM25Index()
+        for chunk in self.store.iter_chunks():
+            self.lexical.add(chunk['chunk_id'], self._lexical_text(chunk))
+
+    @staticmethod
+    def _embedding_text(chunk: Dict) -> str:
+        """Text embedded for a chunk: its heading path followed by its content."""
+        if chunk.get('heading_path'):
+            return f"{' > '.join(chunk['heading_path'])}\n\n{chunk['text']}"
+        return chunk['text']
+
+    @classmethod
+    def _lexical_text(cls, chunk: Dict) -> str:
+        """Text indexed for lexical search: the page title plus the embedded text."""
+        return f"{chunk.get('page_title', '')}\n{cls._embedding_text(chunk)}"
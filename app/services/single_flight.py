@@ -0,0 +1,173 @@
+import asyncio
+import copy
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class _Call:
+    """One in-flight call and the callers waiting for it."""
+
+    __slots__ = ('done', 'result', 'error', 'waiters', 'task')
+
+    def __init__(self, done: Any):
+        self.done = done
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        # The shared call, for async groups; held here so the loop does not drop it
+        self.task: Optional['asyncio.Future[Any]'] = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls made from threads.
+
+    The first caller for a key runs the call; callers arriving with the same
+    key while it is in flight wait and get its result (or exception) instead
+    of making their own. Every caller gets its own shallow copy of the
+    result, so one caller adding or replacing keys of a returned dict does not
+    change what the others see; nested values are still shared and must not
+    be changed in place. Nothing is cached once the call returns. Used to
+    flatten bursts such as many sessions opening the same shared page link.
+    """
+
+    _shared: Dict[str, 'SingleFlight'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, name: str):
+        """
+        Initialize an empty group.
+
+        Args:
+            name: Name used in logs and stats
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {'calls': 0, 'coalesced': 0, 'max_waiters': 0}
+
+    @classmethod
+    def shared(cls, name: str) -> 'SingleFlight':
+        """Return the process-wide group with this name, creating it on first use."""
+        with cls._shared_lock:
+            if name not in cls._shared:
+                cls._shared[name] = cls(name)
+            return cls._shared[name]
+
+    def do(self, key: Hashable, call: Callable[[], T]) -> T:
+        """
+        Run call, or wait for the identical call already in flight.
+
+        Args:
+            key: Identifies identical calls
+            call: Performs the request
+
+        Returns:
+            A shallow copy of the call's result
+        """
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Call(threading.Event())
+                self._stats['calls'] += 1
+            else:
+                flight.waiters += 1
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.copy(flight.result)
+
+        try:
+            flight.result = call()
+            return copy.copy(flight.result)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(key, flight)
+            flight.done.set()
+
+    def _finish(self, key: Hashable, flight: _Call) -> None:
+        with self._lock:
+            del self._calls[key]
+            self._stats['max_waiters'] = max(self._stats['max_waiters'], flight.waiters)
+        if flight.waiters:
+            logger.info(f"{self.name}: {flight.waiters} callers shared one call for {key}")
+
+    def waiters(self) -> Dict[Hashable, int]:
+        """Callers currently waiting on each in-flight key."""
+        with self._lock:
+            return {key: flight.waiters for key, flight in self._calls.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing counters.
+
+        Returns:
+            Dict with 'calls' (made), 'coalesced' (served by another caller's
+            call), 'max_waiters', 'in_flight' (per-key waiter counts) and
+            'coalesced_rate'
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats['in_flight'] = {key: flight.waiters for key, flight in self._calls.items()}
+        requests = stats['calls'] + stats['coalesced']
+        stats['coalesced_rate'] = stats['coalesced'] / requests if requests else 0.0
+        return stats
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    Coalesces concurrent identical calls made from coroutines on one event loop.
+
+    Same behaviour and stats as SingleFlight. The shared call runs as its own
+    task, so cancelling any caller, including the one that started it, does
+    not cancel it for the others.
+    """
+
+    _shared: Dict[str, 'AsyncSingleFlight'] = {}
+    _shared_lock = threading.Lock()
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await call, or the identical call already in flight.
+
+        Args:
+            key: Identifies identical calls
+            call: Coroutine function performing the request
+
+        Returns:
+            A shallow copy of the call's result
+        """
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Call(asyncio.get_running_loop().create_future())
+                self._stats['calls'] += 1
+            else:
+                flight.waiters += 1
+                self._stats['coalesced'] += 1
+
+        if leader:
+            flight.task = asyncio.ensure_future(call())
+            flight.task.add_done_callback(lambda task: self._settle(key, flight, task))
+        return copy.copy(await asyncio.shield(flight.done))
+
+    def _settle(self, key: Hashable, flight: _Call, task: 'asyncio.Future[Any]') -> None:
+        """Hand the finished shared call's outcome to every caller."""
+        self._finish(key, flight)
+        if task.cancelled():
+            flight.done.cancel()
+        elif task.exception() is not None:
+            flight.done.set_exception(task.exception())
+            # Mark the exception retrieved so it is not reported when nobody waited
+            flight.done.exception()
+        else:
+            flight.done.set_result(task.result())
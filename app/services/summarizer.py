@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .chunker import chunk_text
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class Summary(str):
+    """
+    Summary text that also records whether it is partial.
+
+    A partial summary has parts replaced by the start of their text, after
+    requests failed or ran out of time. It is a str, so callers that only
+    want the text need not change.
+    """
+
+    def __new__(cls, text: str, partial: bool = False) -> 'Summary':
+        summary = super().__new__(cls, text)
+        summary.partial = partial
+        return summary
+
+class SummaryCache:
+    """
+    Persistent store of summaries keyed by a hash of the summarized text.
+
+    Holds the intermediate summaries of MapReduceSummarizer, so re-summarizing
+    an edited page only calls the API for the chunks that changed and the
+    reductions above them. Least recently used entries are evicted beyond
+    max_entries.
+    """
+
+    _shared: Dict[str, 'SummaryCache'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str, max_entries: int = 100_000):
+        """
+        Open (or create) the cache.
+
+        Args:
+            cache_dir: Directory the sqlite file is written to
+            max_entries: Maximum number of summaries kept
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.cache_dir / "summaries.sqlite"), check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS summaries (key BLOB PRIMARY KEY, summary TEXT NOT NULL, last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used);
+        """)
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    @classmethod
+    def shared(cls, cache_dir: str, **kwargs: Any) -> 'SummaryCache':
+        """
+        Return the process-wide cache for a directory, creating it on first use.
+
+        Args:
+            cache_dir: Directory the sqlite file is written to
+            **kwargs: Passed to the constructor when the cache is created
+
+        Returns:
+            SummaryCache: The shared cache instance
+        """
+        key = os.path.abspath(cache_dir)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(cache_dir, **kwargs)
+            return cls._shared[key]
+
+    @staticmethod
+    def key(model: str, max_tokens: int, text: str) -> bytes:
+        """Hash the model, summary length and text into a cache key."""
+        return hashlib.blake2b(f"{model}\0{max_tokens}\0{text}".encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[str]:
+        """Look up a summary, or None if it is not cached."""
+        with self._lock:
+            row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            self._db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self._stats['hits'] += 1
+            return row[0]
+
+    def put(self, key: bytes, summary: str) -> None:
+        """Store a summary."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", (key, summary, time.time()))
+            self._db.commit()
+            self._stats['writes'] += 1
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters and current size.
+
+        Returns:
+            Dict of counters plus 'entries' and 'hit_rate'
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _evict(self) -> None:
+        """Drop least recently used summaries until at most max_entries remain."""
+        excess = self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return
+        self._db.execute(
+            "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._db.commit()
+        self._stats['evictions'] += excess
+
+class MapReduceSummarizer:
+    """
+    Summarizes texts of any length within a bounded time.
+
+    Texts that fit in one request are summarized directly. Longer texts are
+    split into chunks along section boundaries and the chunks summarized in
+    parallel (map); the chunk summaries are then grouped into requests that
+    fit and summarized again, level by level, until one request can produce
+    the final summary (reduce). Each level runs in parallel, so the number of
+    sequential requests grows with the logarithm of the text length.
+
+    Every intermediate summary is cached by the hash of its input, so editing
+    one section of a page only re-summarizes that chunk and its ancestors.
+    The whole run shares a deadline: each level gets a slice of the remaining
+    time, and a request that does not finish in its slice is replaced by the
+    start of its input, so a summary always comes back in time. Such a
+    summary is partial: it is logged as such and counted in stats(), and the
+    truncated text is never cached as a summary.
+    """
+
+    def __init__(
+        self,
+        service: Any,
+        cache: Optional[SummaryCache] = None,
+        chunk_tokens: int = 3000,
+        map_tokens: int = 256,
+        deadline: float = 60.0
+    ):
+        """
+        Initialize the summarizer.
+
+        Args:
+            service: AsyncOpenAIService the summary requests go through
+            cache: Cache for intermediate summaries (default: none)
+            chunk_tokens: Maximum input tokens per summary request
+            map_tokens: Length in tokens of each intermediate summary
+            deadline: Default seconds a whole summarization may take
+        """
+        if chunk_tokens < 2 * map_tokens:
+            raise ValueError("chunk_tokens must be at least twice map_tokens so each reduce level shrinks the text")
+        self.service = service
+        self.cache = cache
+        self.chunk_tokens = chunk_tokens
+        self.map_tokens = map_tokens
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._stats = {'summaries': 0, 'partial': 0, 'fallbacks': 0}
+
+    async def summarize(
+        self,
+        text: str,
+        max_tokens: int = 300,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> Summary:
+        """
+        Summarize a text of any length.
+
+        Args:
+            text: Text to summarize
+            max_tokens: Maximum length of the summary in tokens
+            timeout: Seconds per request (default: the service timeout)
+            deadline: Seconds the whole summarization may take (default: the
+                summarizer's deadline)
+
+        Returns:
+            The summary, or the start of the text if no request succeeded;
+            a summary with parts replaced by the start of their text is
+            logged and marked partial
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + (deadline or self.deadline)
+        # Lengths of the texts whose requests were replaced by their start
+        fallbacks: List[int] = []
+        with metrics.time('summary_total'):
+            summary = await self._map_reduce(text, max_tokens, timeout, end, fallbacks)
+        with self._lock:
+            self._stats['summaries'] += 1
+            self._stats['partial'] += bool(fallbacks)
+            self._stats['fallbacks'] += len(fallbacks)
+        if fallbacks:
+            logger.warning(
+                f"Summary of a {len(text)} character text is partial: "
+                f"{len(fallbacks)} requests were replaced by the start of their text"
+            )
+        return Summary(summary, partial=bool(fallbacks))
+
+    async def _map_reduce(
+        self,
+        text: str,
+        max_tokens: int,
+        timeout: Optional[float],
+        end: float,
+        fallbacks: List[int]
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        if self.service.count_tokens(text) <= self.chunk_tokens:
+            return await self._summarize(text, max_tokens, timeout, end, fallbacks)
+
+        chunks = chunk_text(text, self.service.tokenizer, max_tokens=self.chunk_tokens, overlap_tokens=0)
+        parts = [chunk['text'] for chunk in chunks]
+        logger.info(f"Summarizing {len(parts)} chunks of a {len(text)} character text")
+
+        while True:
+            levels = self._levels_left(len(parts))
+            level_end = loop.time() + (end - loop.time()) / levels
+            parts = await asyncio.gather(
+                *(self._summarize(part, self.map_tokens, timeout, level_end, fallbacks) for part in parts)
+            )
+            combined = "\n\n".join(parts)
+            if self.service.count_tokens(combined) <= self.chunk_tokens:
+                return await self._summarize(combined, max_tokens, timeout, end, fallbacks)
+            parts = self._group(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get summarization counters.
+
+        Returns:
+            Dict with 'summaries' (completed runs), 'partial' (runs where a
+            request fell back to the start of its text), 'fallbacks' (such
+            requests) and 'partial_rate'
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats['partial_rate'] = stats['partial'] / stats['summaries'] if stats['summaries'] else 0.0
+        return stats
+
+    def _levels_left(self, count: int) -> int:
+        """Estimate the sequential request rounds needed for count parts, including the final one."""
+        fan_in = max(2, self.chunk_tokens // self.map_tokens)
+        levels = 2
+        while count * self.map_tokens > self.chunk_tokens:
+            count = math.ceil(count / fan_in)
+            levels += 1
+        return levels
+
+    def _group(self, summaries: List[str]) -> List[str]:
+        """Join consecutive summaries into texts of at most chunk_tokens tokens."""
+        groups: List[str] = []
+        group: List[str] = []
+        total = 0
+        for summary in summaries:
+            tokens = self.service.count_tokens(summary) + 1
+            if group and total + tokens > self.chunk_tokens:
+                groups.append("\n\n".join(group))
+                group, total = [], 0
+            group.append(summary)
+            total += tokens
+        if group:
+            groups.append("\n\n".join(group))
+        return groups
+
+    async def _summarize(
+        self,
+        text: str,
+        max_tokens: int,
+        timeout: Optional[float],
+        end: float,
+        fallbacks: List[int]
+    ) -> str:
+        """
+        Summarize one request's worth of text, from the cache if possible, by the end time.
+
+        The sqlite cache is read and written on a worker thread so the event
+        loop is not blocked. A request that fails or runs out of time returns
+        the start of its text instead and appends the text's length to fallbacks.
+        """
+        key = SummaryCache.key(self.service.summary_model, max_tokens, text)
+        if self.cache:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+
+        remaining = end - asyncio.get_running_loop().time()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            summary = await asyncio.wait_for(
+                self.service.summarize_once(text, max_tokens=max_tokens, timeout=timeout),
+                remaining
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Summary request ran out of time, using the start of its text instead")
+            fallbacks.append(len(text))
+            return self.service.context_packer.truncate(text, max_tokens)
+        except Exception as e:
+            logger.error(f"Error summarizing text: {str(e)}")
+            fallbacks.append(len(text))
+            return self.service.context_packer.truncate(text, max_tokens)
+
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, key, summary)
+        return summary
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from config import APP_CONFIG
+from .confluence_service import ConfluenceService
+from .crawler import PageCrawler
+
+logger = logging.getLogger(__name__)
+
+class SpaceSync:
+    """
+    Incremental synchronisation of a space using CQL lastmodified watermarks.
+
+    The first sync of a space is a full crawl. After that, only pages modified
+    since the stored watermark are listed, and only those whose version changed
+    are fetched. Deletions are detected by comparing the space's page count with
+    the locally known pages and, only when they disagree, a listing of page IDs.
+
+    State (watermark and known page versions) is stored per space as JSON under
+    CACHE_DIR/sync and is only written once the caller has consumed every change,
+    so an interrupted sync is simply repeated.
+    """
+
+    def __init__(
+        self,
+        confluence_service: ConfluenceService,
+        crawler: Optional[PageCrawler] = None,
+        state_dir: Optional[str] = None,
+        overlap: timedelta = timedelta(hours=APP_CONFIG['SYNC_OVERLAP_HOURS'])
+    ):
+        """
+        Initialize the sync.
+
+        Args:
+            confluence_service: Service used to list and fetch pages
+            crawler: Crawler used for full syncs and concurrent fetches
+            state_dir: Directory for sync state (default: CACHE_DIR/sync)
+            overlap: How far before the watermark to query, to absorb clock and
+                timezone differences (CQL dates are in the user's timezone)
+        """
+        self.confluence_service = confluence_service
+        self.crawler = crawler or PageCrawler(confluence_service)
+        self.state_dir = Path(state_dir or os.path.join(APP_CONFIG['CACHE_DIR'], 'sync'))
+        self.overlap = overlap
+
+    def sync_space(self, space_key: str) -> Iterator[Dict]:
+        """
+        Bring a space up to date.
+
+        Args:
+            space_key: The key of the space
+
+        Yields:
+            Dicts with 'type' ('updated' or 'deleted'), 'page_id' and, for
+            updates, the fetched 'page'
+        """
+        state = self._load_state(space_key)
+        started_at = datetime.now(timezone.utc)
+        calls = 0
+
+        if state is None:
+            logger.info(f"No sync state for space {space_key}, running a full crawl")
+            known: Dict[str, int] = {}
+            for page in self.crawler.crawl_space(space_key):
+                known[str(page['id'])] = page['version']
+                yield {'type': 'updated', 'page_id': str(page['id']), 'page': page}
+            self._save_state(space_key, started_at, known)
+            return
+
+        known = {page_id: version for page_id, version in state['pages'].items()}
+        since = datetime.fromisoformat(state['watermark']) - self.overlap
+
+        # Pages modified since the watermark whose version we don't have yet
+        page_size = self.crawler.page_size
+        modified = list(self.crawler.paginate(lambda start: self.confluence_service.list_modified_pages(
+            space_key, since, start=start, limit=page_size
+        )))
+        calls += len(modified) // page_size + 1
+        changed = [ref for ref in modified if known.get(str(ref['id'])) != ref['version']]
+
+        fetched = 0
+        for page in self.crawler.fetch_pages(changed):
+            known[str(page['id'])] = page['version']
+            fetched += 1
+            yield {'type': 'updated', 'page_id': str(page['id']), 'page': page}
+        calls += len(changed)
+
+        # Deletions (and moves out of the space) are the only way the count can drop
+        # below what we know about, so only list IDs when the counts disagree
+        deleted = 0
+        remote_count = self.confluence_service.count_space_pages(space_key)
+        calls += 1
+        if remote_count != len(known):
+            current = {
+                str(ref['id']): ref['version']
+                for ref in self.crawler.paginate(lambda start: self.confluence_service.list_space_pages(
+                    space_key, start=start, limit=page_size
+                ))
+            }
+            calls += len(current) // page_size + 1
+
+            for page_id in [page_id for page_id in known if page_id not in current]:
+                del known[page_id]
+                deleted += 1
+                yield {'type': 'deleted', 'page_id': page_id}
+
+            # Pages missed earlier, e.g. by an interrupted or partially failed crawl
+            missing = [
+                {'id': page_id, 'version': version}
+                for page_id, version in current.items()
+                if known.get(page_id) != version
+            ]
+            for page in self.crawler.fetch_pages(missing):
+                known[str(page['id'])] = page['version']
+                fetched += 1
+                yield {'type': 'updated', 'page_id': str(page['id']), 'page': page}
+            changed.extend(missing)
+            calls += len(missing)
+
+        # Keep the old watermark if any fetch failed so those pages are retried next time
+        if fetched < len(changed):
+            logger.warning(f"{len(changed) - fetched} pages in space {space_key} failed to sync")
+            watermark = datetime.fromisoformat(state['watermark'])
+        else:
+            watermark = started_at
+        self._save_state(space_key, watermark, known)
+        logger.info(
+            f"Synced space {space_key}: {fetched} updated, {deleted} deleted, ~{calls} API calls"
+        )
+
+    def has_synced(self, space_key: str) -> bool:
+        """Whether the space has been synced before, so the next sync is incremental."""
+        return self._load_state(space_key) is not None
+
+    def reset(self, space_key: str) -> None:
+        """Forget the sync state of a space so the next sync is a full crawl."""
+        try:
+            self._state_path(space_key).unlink()
+        except OSError:
+            pass
+
+    def _state_path(self, space_key: str) -> Path:
+        return self.state_dir / f"{re.sub(r'[^A-Za-z0-9_-]', '_', space_key)}.json"
+
+    def _load_state(self, space_key: str) -> Optional[Dict]:
+        try:
+            with open(self._state_path(space_key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable sync state for space {space_key}: {str(e)}")
+            return None
+
+    def _save_state(self, space_key: str, watermark: datetime, pages: Dict[str, int]) -> None:
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        path = self._state_path(space_key)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'space_key': space_key,
+                'watermark': watermark.isoformat(),
+                'synced_at': time.time(),
+                'pages': pages,
+            }, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Encoding used for models tiktoken does not know
+DEFAULT_ENCODING = 'cl100k_base'
+
+# Texts per thread-pool task when encoding a batch
+_BATCH_SLICE = 64
+
+_encodings: Dict[str, Any] = {}
+_tokenizers: Dict[str, 'Tokenizer'] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_encoding(model: str):
+    """
+    Get the tiktoken encoding for a model, loading it once per process.
+
+    Models tiktoken does not know (e.g. fine-tunes or newer releases) get
+    DEFAULT_ENCODING instead of an error. tiktoken downloads an encoding's
+    BPE file on first use (unless it is in TIKTOKEN_CACHE_DIR); a failed
+    load is not cached, so the next call tries again.
+
+    Args:
+        model: The name of the OpenAI model
+
+    Returns:
+        The tiktoken encoding for the model
+
+    Raises:
+        RuntimeError: If the encoding could not be loaded, e.g. because the
+            BPE file could not be downloaded
+    """
+    with _lock:
+        if model not in _encodings:
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    logger.warning(f"No tiktoken encoding known for {model}, using {DEFAULT_ENCODING}")
+                    encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+            except Exception as e:
+                logger.error(f"Failed to load the tiktoken encoding for {model}: {str(e)}")
+                raise RuntimeError(
+                    f"Could not load the tokenizer for {model}: {str(e)}. tiktoken downloads its encodings "
+                    f"on first use; check network access, or point TIKTOKEN_CACHE_DIR at a pre-populated cache."
+                ) from e
+            _encodings[model] = encoding
+        return _encodings[model]
+
+def get_tokenizer(model: str) -> 'Tokenizer':
+    """
+    Get the process-wide tokenizer for a model.
+
+    The encoding itself is loaded on first use, not here.
+
+    Args:
+        model: The name of the OpenAI model
+
+    Returns:
+        Tokenizer: The shared tokenizer for the model
+    """
+    with _lock:
+        if model not in _tokenizers:
+            _tokenizers[model] = Tokenizer(model)
+        return _tokenizers[model]
+
+def _pool() -> ThreadPoolExecutor:
+    """Thread pool shared by all tokenizers for batch encoding."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix='tokenizer')
+        return _executor
+
+class Tokenizer:
+    """
+    Token counting and encoding for one model.
+
+    tiktoken releases the GIL while encoding, so batches are split across a
+    shared thread pool. Token counts are memoized in an LRU keyed by the
+    hash of the text, so texts that are counted repeatedly (chunks packed
+    into prompts, chat history, embedding inputs) are only encoded once.
+    """
+
+    def __init__(self, model: str, encoding: Optional[Any] = None, cache_size: int = 50000):
+        """
+        Initialize the tokenizer.
+
+        Args:
+            model: The name of the OpenAI model
+            encoding: tiktoken encoding to use (default: the model's, loaded on first use)
+            cache_size: Maximum number of memoized token counts
+        """
+        self.model = model
+        self.cache_size = cache_size
+        self._encoding = encoding
+        self._counts: 'OrderedDict[bytes, int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    @property
+    def encoding(self) -> Any:
+        """The tiktoken encoding, loaded on first access."""
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        """Hash a text into a count cache key."""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def encode(self, text: str) -> List[int]:
+        """Encode a text, treating special tokens as plain text."""
+        return self.encoding.encode(text, disallowed_special=())
+
+    def encode_batch(self, texts: Sequence[str]) -> List[List[int]]:
+        """
+        Encode many texts, in parallel on the shared thread pool.
+
+        Args:
+            texts: Texts to encode
+
+        Returns:
+            Token lists in input order
+        """
+        encoding = self.encoding
+        if len(texts) <= _BATCH_SLICE:
+            return [encoding.encode(text, disallowed_special=()) for text in texts]
+
+        def encode_slice(start: int) -> List[List[int]]:
+            return [encoding.encode(text, disallowed_special=()) for text in texts[start:start + _BATCH_SLICE]]
+
+        tokens: List[List[int]] = []
+        for part in _pool().map(encode_slice, range(0, len(texts), _BATCH_SLICE)):
+            tokens.extend(part)
+        return tokens
+
+    def decode(self, tokens: Sequence[int]) -> str:
+        """Decode tokens back into text."""
+        return self.encoding.decode(list(tokens))
+
+    def decode_tokens_bytes(self, tokens: Sequence[int]) -> List[bytes]:
+        """Decode tokens into the bytes of each token."""
+        return self.encoding.decode_tokens_bytes(list(tokens))
+
+    def count(self, text: str) -> int:
+        """Count the tokens of a text, memoized by its hash."""
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        """
+        Count the tokens of many texts, encoding only those not counted before.
+
+        Args:
+            texts: Texts to count
+
+        Returns:
+            Token counts in input order
+        """
+        keys = [self.key(text) for text in texts]
+        counts: List[Optional[int]] = [None] * len(texts)
+        with self._lock:
+            for index, key in enumerate(keys):
+                count = self._counts.get(key)
+                if count is not None:
+                    self._counts.move_to_end(key)
+                    counts[index] = count
+        missing = [index for index, count in enumerate(counts) if count is None]
+        if missing:
+            for index, tokens in zip(missing, self.encode_batch([texts[index] for index in missing])):
+                counts[index] = len(tokens)
+        with self._lock:
+            self._stats['hits'] += len(texts) - len(missing)
+            self._stats['misses'] += len(missing)
+            for index in missing:
+                self._counts[keys[index]] = counts[index]
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get count cache counters and current size.
+
+        Returns:
+            Dict of counters plus 'entries' and 'hit_rate'
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._counts)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,598 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale vectors to unit length so dot products are cosine similarities.
+
+    Args:
+        vectors: Array of shape (n, dim) or (dim,)
+
+    Returns:
+        float32 array of the same shape; zero vectors are left as zeros
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+class FlatIndex:
+    """
+    Exact cosine-similarity index over a contiguous float32 matrix.
+
+    Vectors are normalized on insert, so a query is a single matrix-vector
+    product followed by a partial sort. Rows are kept dense: removing an ID
+    moves the last row into its slot. Saved indexes are loaded as read-only
+    memory maps and only copied into memory on the first change.
+    """
+
+    kind = 'flat'
+
+    def __init__(self, dim: Optional[int] = None):
+        """
+        Create an empty index.
+
+        Args:
+            dim: Vector dimension; inferred from the first add if not given
+        """
+        self.dim = dim
+        self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._positions
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The stored (normalized) vectors, one row per ID."""
+        return self._vectors[:self._size]
+
+    @property
+    def ids(self) -> List[str]:
+        """The stored IDs, in row order."""
+        return self._ids
+
+    def add(self, ids: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Add vectors, replacing any already stored under the same IDs.
+
+        Args:
+            ids: Unique ID per vector
+            vectors: Array-like of shape (len(ids), dim)
+        """
+        if not len(ids):
+            return
+        vectors = normalize(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+        self._ensure_capacity(self._size + len(ids))
+        for item_id, vector in zip(ids, vectors):
+            position = self._positions.get(item_id)
+            if position is None:
+                position = self._size
+                self._positions[item_id] = position
+                self._ids.append(item_id)
+                self._size += 1
+            self._vectors[position] = vector
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """
+        Remove vectors by ID; unknown IDs are ignored.
+
+        Args:
+            ids: IDs to remove
+
+        Returns:
+            Number of vectors removed
+        """
+        removed = 0
+        for item_id in ids:
+            position = self._positions.pop(item_id, None)
+            if position is None:
+                continue
+            self._make_writable()
+            last = self._size - 1
+            if position != last:
+                moved_id = self._ids[last]
+                self._vectors[position] = self._vectors[last]
+                self._ids[position] = moved_id
+                self._positions[moved_id] = position
+            self._ids.pop()
+            self._size -= 1
+            removed += 1
+        return removed
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int = 5,
+        candidates: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the stored vectors most similar to a query.
+
+        Args:
+            query: Query vector
+            k: Number of results
+            candidates: Restrict the search to these IDs
+
+        Returns:
+            List of (id, cosine similarity) pairs, best first
+        """
+        if not self._size:
+            return []
+        query = normalize(query)
+
+        if candidates is None:
+            scores = self.vectors @ query
+            return [(self._ids[i], float(scores[i])) for i in top_k(scores, k)]
+
+        rows = np.fromiter(
+            (self._positions[item_id] for item_id in candidates if item_id in self._positions),
+            dtype=np.int64
+        )
+        if not len(rows):
+            return []
+        scores = self._vectors[rows] @ query
+        return [(self._ids[rows[i]], float(scores[i])) for i in top_k(scores, k)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Copy the state save() writes, independent of later changes to the index.
+
+        Returns:
+            Dict of arrays and metadata to pass to save()
+        """
+        # A read-only memory map is replaced, not changed, on the next write, so it needs no copy
+        vectors = self.vectors if not self._vectors.flags.writeable else self.vectors.copy()
+        return {'vectors': vectors, 'meta': {'kind': self.kind, 'dim': self.dim, 'ids': list(self._ids)}}
+
+    def save(self, directory: str, snapshot: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Write the index to a directory as vectors.npy and ids.json.
+
+        Args:
+            directory: Target directory, created if needed
+            snapshot: State from snapshot() to write (default: a snapshot taken now)
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        with open(path / 'vectors.tmp.npy', 'wb') as f:
+            np.save(f, snapshot['vectors'])
+        with open(path / 'ids.tmp.json', 'w', encoding='utf-8') as f:
+            json.dump(snapshot['meta'], f)
+        os.replace(path / 'vectors.tmp.npy', path / 'vectors.npy')
+        os.replace(path / 'ids.tmp.json', path / 'ids.json')
+
+    @classmethod
+    def load(cls, directory: str) -> 'FlatIndex':
+        """
+        Load a saved index, memory-mapping its vectors.
+
+        Args:
+            directory: Directory written by save()
+
+        Returns:
+            FlatIndex: The loaded index, or an empty one if nothing was saved
+        """
+        path = Path(directory)
+        try:
+            with open(path / 'ids.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            vectors = np.load(path / 'vectors.npy', mmap_mode='r')
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable vector index in {directory}: {str(e)}")
+            return cls()
+
+        index = cls(meta['dim'])
+        if len(meta['ids']) != len(vectors):
+            logger.warning(f"Vector index in {directory} is inconsistent, starting empty")
+            return index
+        index._vectors = vectors
+        index._size = len(vectors)
+        index._ids = list(meta['ids'])
+        index._positions = {item_id: position for position, item_id in enumerate(index._ids)}
+        return index
+
+    def _make_writable(self) -> None:
+        """Copy a memory-mapped matrix into memory before changing it."""
+        if isinstance(self._vectors, np.memmap) or not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors, dtype=np.float32)
+
+    def _ensure_capacity(self, size: int) -> None:
+        """Grow the matrix geometrically so repeated adds stay amortized O(1)."""
+        self._make_writable()
+        capacity = self._vectors.shape[0]
+        if size <= capacity:
+            return
+        grown = np.zeros((max(size, capacity * 2, 64), self.dim), dtype=np.float32)
+        grown[:self._size] = self._vectors[:self._size]
+        self._vectors = grown
+
+def kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = 10,
+    seed: int = 0,
+    batch_size: int = 65536
+) -> np.ndarray:
+    """
+    Spherical k-means: cluster unit vectors by cosine similarity.
+
+    Args:
+        vectors: Normalized float32 array of shape (n, dim)
+        n_clusters: Number of centroids
+        iterations: Lloyd iterations
+        seed: Random seed for the initial centroids
+        batch_size: Rows scored per matrix product, bounding peak memory
+
+    Returns:
+        Normalized float32 centroids of shape (n_clusters, dim)
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = np.array(vectors[rng.choice(len(vectors), n_clusters, replace=False)], dtype=np.float32)
+
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids, batch_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Re-seed empty clusters from random points so no centroid is wasted
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for each vector."""
+    result = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        result[start:start + batch_size] = np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+    return result
+
+class IVFIndex(FlatIndex):
+    """
+    Approximate cosine-similarity index with an inverted-file (IVF) coarse quantizer.
+
+    Vectors are clustered with spherical k-means and each is filed under its
+    nearest centroid. A query scores the centroids, then only the vectors in
+    the nprobe closest lists, so raising nprobe trades latency for recall.
+    Until enough vectors have been added to train the quantizer, and for
+    searches restricted to explicit candidates, search is exact. The
+    quantizer is retrained automatically once the index has grown by
+    RETRAIN_GROWTH since the last training.
+    """
+
+    kind = 'ivf'
+
+    # Training starts once there are this many vectors per list
+    MIN_POINTS_PER_LIST = 39
+    # Sample at most this many vectors per list for k-means
+    MAX_POINTS_PER_LIST = 256
+    RETRAIN_GROWTH = 4.0
+
+    def __init__(self, dim: Optional[int] = None, nlist: Optional[int] = None, nprobe: int = 8):
+        """
+        Create an empty index.
+
+        Args:
+            dim: Vector dimension; inferred from the first add if not given
+            nlist: Number of inverted lists (default: about sqrt(n) at training time)
+            nprobe: Lists scanned per query
+        """
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        # Row -> list and slot within that list; list -> member rows
+        self._list_of = np.zeros(0, dtype=np.int32)
+        self._slot_of = np.zeros(0, dtype=np.int64)
+        self._members: List[np.ndarray] = []
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, nlist: Optional[int] = None, iterations: int = 10) -> None:
+        """
+        Cluster the stored vectors and rebuild the inverted lists.
+
+        Args:
+            nlist: Number of lists (default: the configured nlist or about sqrt(n))
+            iterations: k-means iterations
+        """
+        if not self._size:
+            return
+        nlist = min(nlist or self._nlist_for(self._size), self._size)
+        sample_size = min(self._size, nlist * self.MAX_POINTS_PER_LIST)
+        sample = self.vectors
+        if sample_size < self._size:
+            rows = np.random.default_rng(0).choice(self._size, sample_size, replace=False)
+            sample = self.vectors[np.sort(rows)]
+
+        start = time.perf_counter()
+        self.centroids = kmeans(np.asarray(sample, dtype=np.float32), nlist, iterations)
+        self._build_lists(assign(self.vectors, self.centroids))
+        self._trained_size = self._size
+        logger.info(
+            f"Trained IVF index: {self._size} vectors in {len(self.centroids)} lists "
+            f"({time.perf_counter() - start:.1f}s)"
+        )
+
+    def add(self, ids: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Add vectors, replacing any already stored under the same IDs.
+
+        Args:
+            ids: Unique ID per vector
+            vectors: Array-like of shape (len(ids), dim)
+        """
+        if not len(ids):
+            return
+        old_size = self._size
+        replaced = list(dict.fromkeys(self._positions[item_id] for item_id in ids if item_id in self._positions))
+        super().add(ids, vectors)
+
+        if not self.is_trained:
+            if self._size >= self._nlist_for(self._size) * self.MIN_POINTS_PER_LIST:
+                self.train()
+            return
+        if self._size >= self._trained_size * self.RETRAIN_GROWTH:
+            self.train()
+            return
+
+        for row in replaced:
+            self._unlink(row)
+        rows = np.concatenate([np.asarray(replaced, dtype=np.int64), np.arange(old_size, self._size)])
+        self._grow_rows(self._size)
+        self._link(rows, assign(self._vectors[rows], self.centroids))
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """
+        Remove vectors by ID; unknown IDs are ignored.
+
+        Args:
+            ids: IDs to remove
+
+        Returns:
+            Number of vectors removed
+        """
+        if not self.is_trained:
+            return super().remove(ids)
+
+        removed = 0
+        for item_id in ids:
+            position = self._positions.get(item_id)
+            if position is None:
+                continue
+            last = self._size - 1
+            self._unlink(position)
+            super().remove([item_id])
+            if position != last:
+                # The last row was moved into the freed slot
+                list_id, slot = self._list_of[last], self._slot_of[last]
+                self._members[list_id][slot] = position
+                self._list_of[position], self._slot_of[position] = list_id, slot
+            removed += 1
+        return removed
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int = 5,
+        candidates: Optional[Iterable[str]] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the stored vectors most similar to a query.
+
+        Args:
+            query: Query vector
+            k: Number of results
+            candidates: Restrict the search to these IDs (searched exactly)
+            nprobe: Lists scanned for this query (default: self.nprobe)
+
+        Returns:
+            List of (id, cosine similarity) pairs, best first
+        """
+        if not self.is_trained or candidates is not None or not self._size:
+            return super().search(query, k, candidates)
+
+        query = normalize(query)
+        probes = top_k(self.centroids @ query, nprobe or self.nprobe)
+        rows = np.concatenate([self._members[list_id][:self._counts[list_id]] for list_id in probes])
+        if not len(rows):
+            return []
+        scores = self._vectors[rows] @ query
+        return [(self._ids[rows[i]], float(scores[i])) for i in top_k(scores, k)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Copy the state save() writes, independent of later changes to the index.
+
+        Returns:
+            Dict of arrays and metadata to pass to save()
+        """
+        snapshot = super().snapshot()
+        if self.is_trained:
+            snapshot['centroids'] = self.centroids
+            snapshot['lists'] = self._list_of[:self._size].copy()
+        return snapshot
+
+    def save(self, directory: str, snapshot: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Write the index to a directory; adds centroids.npy and lists.npy when trained.
+
+        Args:
+            directory: Target directory, created if needed
+            snapshot: State from snapshot() to write (default: a snapshot taken now)
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        super().save(directory, snapshot)
+        path = Path(directory)
+        if 'lists' not in snapshot:
+            for name in ('centroids.npy', 'lists.npy'):
+                try:
+                    (path / name).unlink()
+                except OSError:
+                    pass
+            return
+        for name in ('centroids', 'lists'):
+            with open(path / f"{name}.tmp.npy", 'wb') as f:
+                np.save(f, snapshot[name])
+            os.replace(path / f"{name}.tmp.npy", path / f"{name}.npy")
+
+    @classmethod
+    def load(cls, directory: str, **kwargs: Any) -> 'IVFIndex':
+        """
+        Load a saved index, memory-mapping its vectors.
+
+        Args:
+            directory: Directory written by save()
+            **kwargs: Passed to the constructor (e.g. nprobe)
+
+        Returns:
+            IVFIndex: The loaded index, or an empty one if nothing was saved
+        """
+        flat = FlatIndex.load(directory)
+        index = cls(flat.dim, **kwargs)
+        index._vectors, index._size = flat._vectors, flat._size
+        index._ids, index._positions = flat._ids, flat._positions
+        if not index._size:
+            return index
+
+        path = Path(directory)
+        try:
+            with open(path / 'ids.json', 'r', encoding='utf-8') as f:
+                saved_kind = json.load(f).get('kind')
+            centroids = np.load(path / 'centroids.npy')
+            lists = np.load(path / 'lists.npy')
+        except (OSError, ValueError):
+            saved_kind, lists = None, None
+        if saved_kind != cls.kind or lists is None or len(lists) != index._size:
+            # Saved without a trained quantizer, or by a different index kind
+            if index._size >= index._nlist_for(index._size) * cls.MIN_POINTS_PER_LIST:
+                index.train()
+            return index
+
+        index.centroids = centroids
+        index._trained_size = index._size
+        index._build_lists(lists)
+        return index
+
+    def _nlist_for(self, size: int) -> int:
+        return self.nlist or max(1, int(np.sqrt(size)))
+
+    def _build_lists(self, lists: np.ndarray) -> None:
+        """Rebuild the inverted lists from each row's list number."""
+        nlist = len(self.centroids)
+        lists = np.asarray(lists, dtype=np.int32)
+        order = np.argsort(lists, kind='stable')
+        counts = np.bincount(lists, minlength=nlist)
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+
+        self._members = [order[bounds[i]:bounds[i + 1]].astype(np.int64) for i in range(nlist)]
+        self._counts = counts.astype(np.int64)
+        self._list_of = np.zeros(max(len(lists), 64), dtype=np.int32)
+        self._slot_of = np.zeros(max(len(lists), 64), dtype=np.int64)
+        self._list_of[:len(lists)] = lists
+        self._slot_of[order] = np.arange(len(lists)) - np.repeat(bounds[:-1], counts)
+
+    def _grow_rows(self, size: int) -> None:
+        if size > len(self._list_of):
+            capacity = max(size, len(self._list_of) * 2)
+            self._list_of = np.resize(self._list_of, capacity)
+            self._slot_of = np.resize(self._slot_of, capacity)
+
+    def _link(self, rows: np.ndarray, lists: np.ndarray) -> None:
+        """Append rows to the inverted lists."""
+        for row, list_id in zip(rows, lists):
+            count = self._counts[list_id]
+            members = self._members[list_id]
+            if count == len(members):
+                members = self._members[list_id] = np.resize(members, max(8, count * 2))
+            members[count] = row
+            self._list_of[row], self._slot_of[row] = list_id, count
+            self._counts[list_id] = count + 1
+
+    def _unlink(self, row: int) -> None:
+        """Remove a row from its inverted list, moving the list's last member into its slot."""
+        list_id, slot = self._list_of[row], self._slot_of[row]
+        last = self._counts[list_id] - 1
+        members = self._members[list_id]
+        if slot != last:
+            moved = members[last]
+            members[slot] = moved
+            self._slot_of[moved] = slot
+        self._counts[list_id] = last
+
+INDEX_TYPES = {FlatIndex.kind: FlatIndex, IVFIndex.kind: IVFIndex}
+
+def create_index(kind: str = 'flat', **kwargs: Any) -> FlatIndex:
+    """
+    Create an empty vector index.
+
+    Args:
+        kind: 'flat' (exact) or 'ivf' (approximate)
+        **kwargs: Passed to the index constructor
+
+    Returns:
+        The new index
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type: {kind}")
+    return INDEX_TYPES[kind](**kwargs)
+
+def load_index(directory: str, kind: str = 'flat', **kwargs: Any) -> FlatIndex:
+    """
+    Load a saved vector index as the requested kind.
+
+    An index saved as a different kind is rebuilt from its vectors, so
+    switching VECTOR_INDEX does not require re-embedding anything.
+
+    Args:
+        directory: Directory written by save()
+        kind: 'flat' or 'ivf'
+        **kwargs: Passed to the index constructor
+
+    Returns:
+        The loaded index, or an empty one if nothing was saved
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type: {kind}")
+    if kind == IVFIndex.kind:
+        return IVFIndex.load(directory, **kwargs)
+    return FlatIndex.load(directory)
@@ -0,0 +1,67 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from config import OPENAI_CONFIG
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+def _steps() -> List[Tuple[str, Callable[[], object]]]:
+    """Warm-up steps in order; the heavy modules are imported here, on the warm-up thread."""
+    from .registry import get_confluence_service, get_openai_service, get_retriever
+    from .tokenizer import get_tokenizer
+
+    return [
+        # tiktoken reads (or downloads) the BPE ranks on first use
+        ('tokenizer', lambda: get_tokenizer(OPENAI_CONFIG['MODEL']).encoding),
+        ('embedding_tokenizer', lambda: get_tokenizer(OPENAI_CONFIG['EMBEDDING_MODEL']).encoding),
+        # The health checks open the pooled connections, so the first session finds them warm
+        ('confluence', get_confluence_service),
+        ('openai', get_openai_service),
+        ('retriever', get_retriever),
+    ]
+
+def _run() -> None:
+    start = time.perf_counter()
+    try:
+        steps = _steps()
+    except Exception as e:
+        logger.warning(f"Warm-up failed to import services: {str(e)}")
+        return
+    for name, step in steps:
+        try:
+            with metrics.time(f'warm_up_{name}'):
+                step()
+        except Exception as e:
+            # A missing credential or unreachable server is reported again when a session needs it
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s")
+
+def warm_up(wait: bool = False) -> threading.Thread:
+    """
+    Preload encodings, service clients and the vector index in the background.
+
+    Runs once per process; later calls return the same thread. Failures are
+    logged and otherwise ignored, since every step is retried lazily when a
+    session first needs it.
+
+    Args:
+        wait: Block until the warm-up has finished
+
+    Returns:
+        threading.Thread: The warm-up thread
+    """
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name='warm-up', daemon=True)
+            _thread.start()
+        thread = _thread
+    if wait:
+        thread.join()
+    return thread
@@ -0,0 +1,83 @@
+"""
+Audit the import time of the app's modules against per-module budgets.
+
+Each module is imported in a fresh interpreter under `python -X importtime`.
+A module fails the audit if its imports take longer than its budget or pull
+in a package it must load lazily, e.g. openai for app.services.
+
+Usage:
+    python benchmarks/audit_imports.py [--budget config=50] [--top 10]
+"""
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+project_root = str(Path(__file__).parent.parent.absolute())
+
+HEAVY_PACKAGES = ('openai', 'tiktoken', 'bs4', 'atlassian', 'httpx', 'requests', 'numpy', 'streamlit')
+
+# Module -> (budget in ms, packages it must not import)
+CHECKS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    'config': (50, HEAVY_PACKAGES),
+    # Light submodules must stay importable without the API clients
+    'app.services': (250, ('openai', 'tiktoken', 'bs4', 'atlassian')),
+    'app.services.rate_limiter': (300, ('openai', 'tiktoken', 'bs4', 'atlassian')),
+    'app.pages.dashboard': (2500, ()),
+}
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+def import_times(statement: str) -> List[Tuple[str, int, int]]:
+    """
+    Run a statement in a fresh interpreter and parse its import times.
+
+    Returns:
+        (module, cumulative us, nesting depth) for every import, in order
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=project_root, capture_output=True, text=True
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            times.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+    return times
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS',
+                        help='Override or add a module budget in milliseconds')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports listed for modules over budget')
+    args = parser.parse_args()
+
+    checks = dict(CHECKS)
+    for budget in args.budget:
+        module, _, ms = budget.partition('=')
+        checks[module] = (float(ms), checks.get(module, (0, ()))[1])
+
+    # Imports every interpreter does at startup are not charged to the modules
+    baseline = {module for module, _, _ in import_times('pass')}
+
+    failures = 0
+    for module, (budget_ms, forbidden) in checks.items():
+        times = [entry for entry in import_times(f'import {module}') if entry[0] not in baseline]
+        total_ms = sum(cumulative for _, cumulative, depth in times if depth == 0) / 1000
+        loaded = {name.split('.')[0] for name, _, _ in times}
+        leaked = sorted(package for package in forbidden if package in loaded)
+
+        ok = total_ms <= budget_ms and not leaked
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<28} {total_ms:8.1f} ms (budget {budget_ms:.0f} ms)"
+              + (f"  imports {', '.join(leaked)}" if leaked else ''))
+        if not ok:
+            for name, cumulative, depth in sorted(times, key=lambda entry: -entry[1])[:args.top]:
+                print(f"       {cumulative / 1000:8.1f} ms  {'  ' * depth}{name}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Benchmark approximate vector search: recall@k and p50/p99 query latency.
+
+Usage:
+    python benchmarks/bench_ann.py [--sizes 100000 1000000] [--dim 256] [--nprobe 1 4 8 16 32]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+project_root = str(Path(__file__).parent.parent.absolute())
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import numpy as np
+
+from app.services.vector_index import FlatIndex, IVFIndex, normalize
+
+def make_vectors(count: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Clustered unit vectors, a rough stand-in for embeddings of related chunks."""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100000):
+        end = min(start + 100000, count)
+        noise = rng.standard_normal((end - start, dim), dtype=np.float32)
+        vectors[start:end] = centers[rng.integers(0, clusters, end - start)] + 0.5 * noise
+    return normalize(vectors)
+
+def percentile_ms(latencies: list, q: float) -> float:
+    return float(np.percentile(latencies, q)) * 1000
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000], help='Index sizes to test')
+    parser.add_argument('--dim', type=int, default=256, help='Vector dimension')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per measurement')
+    parser.add_argument('--k', type=int, default=10, help='Results per query')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32], help='IVF lists scanned')
+    parser.add_argument('--nlist', type=int, default=None, help='IVF lists (default: sqrt(n))')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        vectors = make_vectors(size, args.dim, clusters=max(10, size // 1000), rng=rng)
+        ids = [str(i) for i in range(size)]
+        # Queries are perturbed corpus vectors so they have real near neighbours
+        queries = normalize(
+            vectors[rng.integers(0, size, args.queries)]
+            + 0.1 * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        )
+        print(f"\n{size:,} vectors x {args.dim} dims, {args.queries} queries, k={args.k}")
+
+        flat = FlatIndex(args.dim)
+        flat.add(ids, vectors)
+        truth = []
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            truth.append({item_id for item_id, _ in flat.search(query, args.k)})
+            latencies.append(time.perf_counter() - start)
+        print(f"  {'flat':<12} recall@{args.k} 1.000  p50 {percentile_ms(latencies, 50):7.2f} ms  "
+              f"p99 {percentile_ms(latencies, 99):7.2f} ms")
+
+        ivf = IVFIndex(args.dim, nlist=args.nlist)
+        start = time.perf_counter()
+        # Bulk load without incremental training, then train once
+        FlatIndex.add(ivf, ids, vectors)
+        ivf.train()
+        print(f"  ivf build    {time.perf_counter() - start:.1f}s ({len(ivf.centroids)} lists)")
+
+        for nprobe in args.nprobe:
+            found = 0
+            latencies = []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                results = ivf.search(query, args.k, nprobe=nprobe)
+                latencies.append(time.perf_counter() - start)
+                found += len(expected & {item_id for item_id, _ in results})
+            print(f"  {'ivf/' + str(nprobe):<12} recall@{args.k} {found / (args.k * len(queries)):.3f}  "
+                  f"p50 {percentile_ms(latencies, 50):7.2f} ms  p99 {percentile_ms(latencies, 99):7.2f} ms")
+
+        # Incremental updates after training
+        new_ids = [f"new-{i}" for i in range(1000)]
+        start = time.perf_counter()
+        ivf.add(new_ids, make_vectors(1000, args.dim, 10, rng))
+        ivf.remove(new_ids)
+        print(f"  ivf add+delete 1,000: {(time.perf_counter() - start) * 1000:.0f} ms")
+        del flat, ivf, vectors
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
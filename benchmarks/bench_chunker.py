@@ -0,0 +1,48 @@
+"""
+Benchmark the token-aware chunker in chunks and tokens per second.
+
+Usage:
+    python benchmarks/bench_chunker.py [--pages 20] [--sections 200] [--max-tokens 512]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+project_root = str(Path(__file__).parent.parent.absolute())
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import tiktoken
+
+from app.services.chunker import chunk_text
+from app.services.extractor import storage_to_markdown
+from app.services.tokenizer import Tokenizer
+from bench_extractor import make_page
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help='Number of pages in the corpus')
+    parser.add_argument('--sections', type=int, default=200, help='Sections per page')
+    parser.add_argument('--max-tokens', type=int, default=512, help='Maximum tokens per chunk')
+    parser.add_argument('--overlap-tokens', type=int, default=64, help='Tokens shared by consecutive chunks')
+    parser.add_argument('--encoding', default='cl100k_base', help='tiktoken encoding name')
+    args = parser.parse_args()
+
+    tokenizer = Tokenizer(args.encoding, encoding=tiktoken.get_encoding(args.encoding))
+    corpus = [storage_to_markdown(make_page(args.sections, seed)) for seed in range(args.pages)]
+    print(f"Corpus: {args.pages} pages, {sum(len(page) for page in corpus) / 1e6:.1f}M characters")
+
+    start = time.perf_counter()
+    chunks = [chunk for page in corpus for chunk in chunk_text(
+        page, tokenizer, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens
+    )]
+    elapsed = time.perf_counter() - start
+
+    tokens = sum(chunk['token_count'] for chunk in chunks)
+    print(f"Chunks: {len(chunks)} (avg {tokens / max(1, len(chunks)):.0f} tokens)")
+    print(f"Throughput: {len(chunks) / elapsed:,.0f} chunks/s, {tokens / elapsed:,.0f} tokens/s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
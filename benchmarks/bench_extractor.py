@@ -0,0 +1,89 @@
+"""
+Benchmark the storage-format extractor against the previous BeautifulSoup cleaner.
+
+Usage:
+    python benchmarks/bench_extractor.py [--pages 20] [--sections 200]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+project_root = str(Path(__file__).parent.parent.absolute())
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from bs4 import BeautifulSoup
+
+from app.services.extractor import storage_to_markdown
+
+def legacy_clean_html(html_content: str) -> str:
+    """The html.parser based cleaner previously used by ConfluenceService._clean_html."""
+    if not html_content:
+        return ""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for element in soup(["script", "style", "noscript"]):
+        element.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+    return ' '.join(text.split())
+
+def make_page(sections: int, seed: int) -> str:
+    """Build a large storage-format page with the constructs found in spec pages."""
+    parts = []
+    for i in range(sections):
+        parts.append(f"<h2>Section {seed}.{i}</h2>")
+        parts.append(
+            f"<p>Paragraph {i} describing <strong>component-{i}</strong> with flag "
+            f"<code>feature.flag_{i}</code>&nbsp;and ticket PROJ-{i}. " + "Lorem ipsum dolor sit amet. " * 8 + "</p>"
+        )
+        parts.append("<ul>" + "".join(f"<li>Item {j} of section {i}</li>" for j in range(5)) + "</ul>")
+        parts.append(
+            "<table><tbody><tr><th>Key</th><th>Value</th></tr>"
+            + "".join(f"<tr><td>key_{j}</td><td><p>value {j}</p></td></tr>" for j in range(6))
+            + "</tbody></table>"
+        )
+        parts.append(
+            '<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">python</ac:parameter>'
+            f"<ac:plain-text-body><![CDATA[def handler_{i}(event):\n    return event['id'] < {i}\n]]>"
+            "</ac:plain-text-body></ac:structured-macro>"
+        )
+        parts.append(
+            '<ac:structured-macro ac:name="info"><ac:rich-text-body>'
+            f"<p>Note for section {i}: see <ac:link><ri:page ri:content-title=\"Page {i}\" /></ac:link>.</p>"
+            "</ac:rich-text-body></ac:structured-macro>"
+        )
+    return "".join(parts)
+
+def measure(func, corpus, repeat: int) -> float:
+    """Return the best wall-clock time to process the whole corpus."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in corpus:
+            func(page)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help='Number of pages in the corpus')
+    parser.add_argument('--sections', type=int, default=200, help='Sections per page')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per implementation (best is reported)')
+    parser.add_argument('--min-speedup', type=float, default=5.0, help='Fail if the speedup is lower')
+    args = parser.parse_args()
+
+    corpus = [make_page(args.sections, seed) for seed in range(args.pages)]
+    megabytes = sum(len(page.encode('utf-8')) for page in corpus) / 1e6
+    print(f"Corpus: {args.pages} pages, {megabytes:.1f} MB of storage format")
+
+    legacy = measure(legacy_clean_html, corpus, args.repeat)
+    current = measure(storage_to_markdown, corpus, args.repeat)
+    speedup = legacy / current
+
+    print(f"BeautifulSoup html.parser: {megabytes / legacy:8.2f} MB/s ({args.pages / legacy:.1f} pages/s)")
+    print(f"lxml storage extractor:    {megabytes / current:8.2f} MB/s ({args.pages / current:.1f} pages/s)")
+    print(f"Speedup: {speedup:.1f}x")
+    return 0 if speedup >= args.min_speedup else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
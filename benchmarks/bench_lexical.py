@@ -0,0 +1,95 @@
+"""
+Benchmark BM25 lexical lookups: index build rate and p50/p99 query latency.
+
+Each query runs both with early termination (the default) and with every
+posting scored. Exits non-zero if the two return different results, or if a
+query type's p99 with early termination is over --max-p99-ratio times the
+exhaustive p99. Both are timed on the same machine, so the check does not
+depend on its speed; --max-p99-ms adds an absolute limit for a known host.
+
+Usage:
+    python benchmarks/bench_lexical.py [--chunks 100000] [--queries 1000] [--max-p99-ratio 1.5] [--max-p99-ms N]
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = str(Path(__file__).parent.parent.absolute())
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import numpy as np
+
+from app.services.lexical_index import BM25Index
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=100000, help='Number of indexed chunks')
+    parser.add_argument('--words', type=int, default=200, help='Words per chunk')
+    parser.add_argument('--vocabulary', type=int, default=50000, help='Distinct words in the corpus')
+    parser.add_argument('--queries', type=int, default=1000, help='Queries per measurement')
+    parser.add_argument('--max-p99-ratio', type=float, default=1.5,
+                        help='Fail if a query type is this many times slower at p99 than scoring every posting')
+    parser.add_argument('--max-p99-ms', type=float, default=None, help='Fail if a query type is slower at p99')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # Zipf-like word frequencies, plus one identifier per chunk (error code / ticket key)
+    words = [f"word{i}" for i in range(args.vocabulary)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(args.vocabulary)))
+
+    corpus = [
+        f"{' '.join(rng.choices(words, cum_weights=cum_weights, k=args.words))} ERR-{number} PROJ-{number % 5000}"
+        for number in range(args.chunks)
+    ]
+
+    index = BM25Index()
+    start = time.perf_counter()
+    for number, text in enumerate(corpus):
+        index.add(str(number), text)
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {args.chunks:,} chunks in {elapsed:.1f}s ({args.chunks / elapsed:,.0f} chunks/s)")
+
+    query_sets = {
+        'error code': [f"ERR-{rng.randrange(args.chunks)}" for _ in range(args.queries)],
+        'ticket key': [f"what about PROJ-{rng.randrange(5000)}" for _ in range(args.queries)],
+        'rare words': [' '.join(rng.sample(words[1000:], 3)) for _ in range(args.queries)],
+        'common words': [' '.join(rng.sample(words[:100], 3)) for _ in range(args.queries)],
+    }
+    failures = 0
+    for name, queries in query_sets.items():
+        # Impact lists of common terms are built on first use and then kept, as in a long-running server
+        for query in queries:
+            index.search(query, 10)
+        latencies, exhaustive_latencies, mismatches = [], [], 0
+        for query in queries:
+            # Alternate the two modes so both see the same load on a noisy machine
+            start = time.perf_counter()
+            results = index.search(query, 10)
+            latencies.append(time.perf_counter() - start)
+            index.MAX_SCORED_POSTINGS = None
+            start = time.perf_counter()
+            exhaustive_results = index.search(query, 10)
+            exhaustive_latencies.append(time.perf_counter() - start)
+            del index.MAX_SCORED_POSTINGS
+            mismatches += results != exhaustive_results
+        p99_ms = np.percentile(latencies, 99) * 1000
+        exhaustive_p99_ms = np.percentile(exhaustive_latencies, 99) * 1000
+        problems = []
+        if mismatches:
+            problems.append(f"{mismatches} results differ from exhaustive")
+        if p99_ms > args.max_p99_ratio * exhaustive_p99_ms:
+            problems.append(f"over {args.max_p99_ratio:g}x exhaustive p99")
+        if args.max_p99_ms is not None and p99_ms > args.max_p99_ms:
+            problems.append(f"over {args.max_p99_ms:g} ms")
+        failures += bool(problems)
+        print(f"  {name:<13} p50 {np.percentile(latencies, 50) * 1000:6.3f} ms  p99 {p99_ms:6.3f} ms  "
+              f"(exhaustive p99 {exhaustive_p99_ms:6.3f} ms)"
+              f"{'  FAIL (' + '; '.join(problems) + ')' if problems else ''}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
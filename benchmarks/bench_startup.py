@@ -0,0 +1,78 @@
+"""
+Benchmark cold start: time to first render of the landing page.
+
+Each run starts a fresh interpreter that renders app/main.py once with
+Streamlit's AppTest and then reruns it, so module imports are paid exactly
+as on a new server process.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--warm-up]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+project_root = str(Path(__file__).parent.parent.absolute())
+
+HEAVY_PACKAGES = ('openai', 'tiktoken', 'bs4', 'atlassian')
+
+RUN = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file('app/main.py', default_timeout=120)
+app.run()
+rendered = time.perf_counter()
+app.run()
+rerendered = time.perf_counter()
+print(json.dumps({
+    'errors': [str(error.value) for error in app.exception],
+    'streamlit_import': imported - start,
+    'first_render': rendered - imported,
+    'rerun': rerendered - rendered,
+    'heavy': [package for package in %r if package in sys.modules],
+}))
+""" % (HEAVY_PACKAGES,)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to measure')
+    parser.add_argument('--warm-up', action='store_true', help='Start the background warm-up (WARM_UP_ON_START)')
+    args = parser.parse_args()
+
+    env = dict(os.environ, WARM_UP_ON_START='true' if args.warm_up else 'false')
+    samples = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', RUN], cwd=project_root, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if result.returncode:
+            print(result.stderr, file=sys.stderr)
+            return 1
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        if sample['errors']:
+            print(f"Landing page raised: {sample['errors']}", file=sys.stderr)
+            return 1
+        sample['process'] = wall
+        samples.append(sample)
+
+    for name, label in (
+        ('process', 'Process start to rerun done'),
+        ('streamlit_import', 'Streamlit import'),
+        ('first_render', 'First render'),
+        ('rerun', 'Rerun'),
+    ):
+        values = [sample[name] * 1000 for sample in samples]
+        print(f"{label:<28} median {statistics.median(values):7.1f} ms  (min {min(values):7.1f} ms)")
+    heavy = sorted({package for sample in samples for package in sample['heavy']})
+    print(f"Heavy packages loaded by the landing page: {', '.join(heavy) or 'none'}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,6 +14,9 @@ CONFLUENCE_CONFIG = {
     'EMAIL': os.getenv('CONFLUENCE_EMAIL', 'your-email@example.com'),
     'API_TOKEN': os.getenv('CONFLUENCE_API_TOKEN', 'your-api-token'),
     'DEFAULT_PAGE_ID': os.getenv('DEFAULT_PAGE_ID'),  # Optional: Set a default page ID
+    'TIMEOUT': int(os.getenv('CONFLUENCE_TIMEOUT', '10')),  # Seconds per API request
+    'POOL_SIZE': int(os.getenv('CONFLUENCE_POOL_SIZE', '20')),  # Keep-alive connections per host
+    'REQUESTS_PER_MINUTE': int(os.getenv('CONFLUENCE_REQUESTS_PER_MINUTE', '600')),  # 0 = unlimited
 }
 
 # OpenAI Configuration
@@ -22,6 +25,19 @@ OPENAI_CONFIG = {
     'MODEL': os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
     'TEMPERATURE': float(os.getenv('OPENAI_TEMPERATURE', '0.3')),
     'MAX_TOKENS': int(os.getenv('OPENAI_MAX_TOKENS', '1000')),
+    'CONTEXT_WINDOW': int(os.getenv('OPENAI_CONTEXT_WINDOW', '0')) or None,  # Default: looked up from the model
+    'TIMEOUT': float(os.getenv('OPENAI_TIMEOUT', '60')),
+    'POOL_SIZE': int(os.getenv('OPENAI_POOL_SIZE', '50')),
+    'MAX_CONCURRENCY': int(os.getenv('OPENAI_MAX_CONCURRENCY', '16')),  # Requests in flight per service
+    # Rate limits shared by all sessions and background jobs; 0 = unlimited
+    'CHAT_REQUESTS_PER_MINUTE': int(os.getenv('OPENAI_CHAT_REQUESTS_PER_MINUTE', '3500')),
+    'CHAT_TOKENS_PER_MINUTE': int(os.getenv('OPENAI_CHAT_TOKENS_PER_MINUTE', '200000')),
+    'EMBEDDING_REQUESTS_PER_MINUTE': int(os.getenv('OPENAI_EMBEDDING_REQUESTS_PER_MINUTE', '3000')),
+    'EMBEDDING_TOKENS_PER_MINUTE': int(os.getenv('OPENAI_EMBEDDING_TOKENS_PER_MINUTE', '1000000')),
+    'EMBEDDING_MODEL': os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small'),
+    'EMBEDDING_BATCH_TOKENS': int(os.getenv('OPENAI_EMBEDDING_BATCH_TOKENS', '100000')),
+    'EMBEDDING_BATCH_SIZE': int(os.getenv('OPENAI_EMBEDDING_BATCH_SIZE', '512')),
+    'EMBEDDING_MAX_WORKERS': int(os.getenv('OPENAI_EMBEDDING_MAX_WORKERS', '8')),
 }
 
 # Application Settings
@@ -31,6 +47,34 @@ APP_CONFIG = {
     'CACHE_DIR': os.path.join(BASE_DIR, '.cache'),
     'OUTPUT_DIR': os.path.join(BASE_DIR, 'output'),
     'UPLOAD_FOLDER': os.path.join(BASE_DIR, 'uploads'),
+    'PAGE_CACHE_MAX_MB': int(os.getenv('PAGE_CACHE_MAX_MB', '200')),
+    'PAGE_STORE_MAX_MB': int(os.getenv('PAGE_STORE_MAX_MB', '100')),  # In-memory pages shared by sessions
+    'PAGE_CACHE_REVALIDATE_SECONDS': float(os.getenv('PAGE_CACHE_REVALIDATE_SECONDS', '30')),
+    'EMBEDDING_CACHE_MAX_ROWS': int(os.getenv('EMBEDDING_CACHE_MAX_ROWS', '1000000')),
+    'CHUNK_MAX_TOKENS': int(os.getenv('CHUNK_MAX_TOKENS', '512')),
+    'CHUNK_OVERLAP_TOKENS': int(os.getenv('CHUNK_OVERLAP_TOKENS', '64')),
+    'RETRIEVAL_TOP_K': int(os.getenv('RETRIEVAL_TOP_K', '10')),  # Chunks retrieved per question, then packed into CONTEXT_MAX_TOKENS
+    'CONTEXT_MAX_TOKENS': int(os.getenv('CONTEXT_MAX_TOKENS', '6000')),  # Upper bound on page context per question
+    'VECTOR_INDEX': os.getenv('VECTOR_INDEX', 'flat'),  # 'flat' (exact) or 'ivf' (approximate, for large corpora)
+    'IVF_NPROBE': int(os.getenv('IVF_NPROBE', '8')),  # Lists scanned per query; higher = better recall, slower
+    'HISTORY_MAX_TOKENS': int(os.getenv('HISTORY_MAX_TOKENS', '1500')),  # Chat history per question, summary included
+    'HISTORY_SUMMARY_TOKENS': int(os.getenv('HISTORY_SUMMARY_TOKENS', '300')),  # Length of the summary of older turns
+    'CHAT_HISTORY_MAX_MESSAGES': int(os.getenv('CHAT_HISTORY_MAX_MESSAGES', '200')),  # Kept in memory; all are logged to OUTPUT_DIR
+    'CHAT_VISIBLE_MESSAGES': int(os.getenv('CHAT_VISIBLE_MESSAGES', '20')),  # Older messages render only on request
+    'CHAT_LOG_MAX_MB': float(os.getenv('CHAT_LOG_MAX_MB', '10')),  # Per session; older messages are dropped past it
+    'CHAT_LOG_MAX_AGE_DAYS': float(os.getenv('CHAT_LOG_MAX_AGE_DAYS', '30')),  # Logs untouched this long are deleted
+    'ANSWER_CACHE_SIMILARITY': float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.95')),  # Cosine similarity for reusing an answer
+    'ANSWER_CACHE_MAX_ENTRIES': int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000')),
+    'ANSWER_CACHE_TTL_SECONDS': float(os.getenv('ANSWER_CACHE_TTL_SECONDS', '86400')),
+    'SUMMARY_CHUNK_TOKENS': int(os.getenv('SUMMARY_CHUNK_TOKENS', '3000')),  # Input tokens per summary request
+    'SUMMARY_MAP_TOKENS': int(os.getenv('SUMMARY_MAP_TOKENS', '256')),  # Length of each intermediate summary
+    'SUMMARY_DEADLINE_SECONDS': float(os.getenv('SUMMARY_DEADLINE_SECONDS', '60')),
+    'SUMMARY_CACHE_MAX_ENTRIES': int(os.getenv('SUMMARY_CACHE_MAX_ENTRIES', '100000')),
+    'INGEST_MAX_JOBS': int(os.getenv('INGEST_MAX_JOBS', '2')),  # Page/space ingestion jobs run at once
+    'CRAWL_MAX_WORKERS': int(os.getenv('CRAWL_MAX_WORKERS', '8')),
+    'SYNC_OVERLAP_HOURS': float(os.getenv('SYNC_OVERLAP_HOURS', '24')),
+    'WARM_UP_ON_START': os.getenv('WARM_UP_ON_START', 'False').lower() == 'true',  # Preload encodings and clients in the background
+    'HEALTH_CHECK_TTL_SECONDS': float(os.getenv('HEALTH_CHECK_TTL_SECONDS', '300')),
 }
 
 # UI Settings
@@ -42,14 +86,16 @@ UI_CONFIG = {
 }
 
 def ensure_directories():
-    """Ensure all required directories exist."""
+    """
+    Ensure all required directories exist.
+
+    Not called on import: the caches, logs and indexes create their own
+    directories when first used. Call it before applying LOGGING_CONFIG.
+    """
     os.makedirs(APP_CONFIG['CACHE_DIR'], exist_ok=True)
     os.makedirs(APP_CONFIG['OUTPUT_DIR'], exist_ok=True)
     os.makedirs(APP_CONFIG['UPLOAD_FOLDER'], exist_ok=True)
 
-# Initialize directories
-ensure_directories()
-
 # Logging configuration
 LOGGING_CONFIG = {
     'version': 1,